@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Adaptive admission control for the API server
+
+Every routed request (except routes registered with admission=False) must
+take a slot from its route's limiter before any work is done. Each limiter
+adjusts its concurrency limit from the latency of completed requests:
+
+  - while the smoothed latency stays under ADMISSION_TARGET_LATENCY and the
+    route is using its slots, the limit grows by one per completion
+  - once latency exceeds the target, the limit shrinks by 10%, at most once
+    per target interval, down to ADMISSION_MIN_LIMIT
+
+A request that finds no free slot waits up to ADMISSION_MAX_QUEUE_DELAY
+seconds for one. After that, or when too many requests are already waiting,
+it is rejected with 503 and Retry-After. Limits are per route, so a slow
+/performQuery is shed without affecting cheap routes such as
+/auth/public-key.
+"""
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+import metrics
+
+# Set to 0 to admit everything (no limits, no shedding)
+ADMISSION_ENABLED = os.getenv('ADMISSION_ENABLED', '1') == '1'
+
+# Smoothed per-route latency (seconds) above which the limit is reduced
+ADMISSION_TARGET_LATENCY = float(os.getenv('ADMISSION_TARGET_LATENCY', '0.5'))
+
+# Seconds a request may wait for a slot before it is shed
+ADMISSION_MAX_QUEUE_DELAY = float(os.getenv('ADMISSION_MAX_QUEUE_DELAY', '0.05'))
+
+# Concurrency limit bounds per route, and the starting limit
+ADMISSION_MIN_LIMIT = int(os.getenv('ADMISSION_MIN_LIMIT', '2'))
+ADMISSION_MAX_LIMIT = int(os.getenv('ADMISSION_MAX_LIMIT', '64'))
+ADMISSION_INITIAL_LIMIT = int(os.getenv('ADMISSION_INITIAL_LIMIT', '16'))
+
+# Smoothing factor of the latency average (weight of the newest sample)
+LATENCY_EWMA_ALPHA = 0.2
+
+
+class RouteLimiter:
+    """Concurrency limit, in-flight count and latency of one route"""
+
+    __slots__ = ('name', 'limit', 'inflight', 'waiting', 'latency', 'last_decrease')
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = float(limit)
+        self.inflight = 0
+        self.waiting = 0
+        self.latency = 0.0
+        self.last_decrease = 0.0
+
+    @property
+    def slots(self) -> int:
+        return max(ADMISSION_MIN_LIMIT, int(self.limit))
+
+
+class AdmissionController:
+    def __init__(self, enabled: bool = ADMISSION_ENABLED):
+        self.enabled = enabled
+        self._cond = threading.Condition()
+        self._limiters: Dict[str, RouteLimiter] = {}
+
+    def limiter(self, route_name: str) -> RouteLimiter:
+        """Limiter for a route (created and exported at route registration)"""
+        limiter = self._limiters.get(route_name)
+        if limiter is None:
+            limiter = RouteLimiter(route_name, min(ADMISSION_MAX_LIMIT, max(ADMISSION_MIN_LIMIT, ADMISSION_INITIAL_LIMIT)))
+            self._limiters[route_name] = limiter
+            labels = {'route': route_name}
+            metrics.REGISTRY.register_gauge('admission_inflight', lambda: limiter.inflight, labels)
+            metrics.REGISTRY.register_gauge('admission_limit', lambda: limiter.slots, labels)
+            metrics.REGISTRY.register_gauge('admission_latency_seconds', lambda: limiter.latency, labels)
+        return limiter
+
+    def acquire(self, limiter: RouteLimiter) -> Optional[float]:
+        """
+        Take a slot for one request
+
+        Returns:
+            None if admitted, otherwise suggested seconds before a retry
+        """
+        if not self.enabled:
+            return None
+        with self._cond:
+            if limiter.inflight < limiter.slots:
+                limiter.inflight += 1
+                return None
+            if limiter.waiting < limiter.slots and ADMISSION_MAX_QUEUE_DELAY > 0:
+                limiter.waiting += 1
+                deadline = time.monotonic() + ADMISSION_MAX_QUEUE_DELAY
+                try:
+                    while limiter.inflight >= limiter.slots:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    else:
+                        limiter.inflight += 1
+                        metrics.inc('admission_total', {'route': limiter.name, 'result': 'queued'})
+                        return None
+                finally:
+                    limiter.waiting -= 1
+            retry_after = max(1.0, limiter.latency)
+        metrics.inc('admission_total', {'route': limiter.name, 'result': 'rejected'})
+        return retry_after
+
+    def release(self, limiter: RouteLimiter, elapsed: float) -> None:
+        """Return a slot and feed the request's latency into the limit"""
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        with self._cond:
+            saturated = limiter.inflight >= limiter.slots
+            limiter.inflight -= 1
+            limiter.latency = elapsed if limiter.latency == 0 else (
+                LATENCY_EWMA_ALPHA * elapsed + (1 - LATENCY_EWMA_ALPHA) * limiter.latency)
+            if limiter.latency > ADMISSION_TARGET_LATENCY:
+                if now - limiter.last_decrease >= ADMISSION_TARGET_LATENCY:
+                    limiter.limit = max(float(ADMISSION_MIN_LIMIT), limiter.limit * 0.9)
+                    limiter.last_decrease = now
+            elif saturated or limiter.waiting:
+                limiter.limit = min(float(ADMISSION_MAX_LIMIT), limiter.limit + 1)
+            self._cond.notify_all()
+
+
+ADMISSION = AdmissionController()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Aggregations for /performQuery
+
+A query with an "aggregate" object returns one summary row per group
+instead of the detail rows:
+
+    {"currentTable": "grades", "filters": [...],
+     "aggregate": {"group_by": ["CID"],
+                   "metrics": [{"op": "count"}, {"op": "avg", "column": "grade"}]}}
+
+    -> {"results": [{"CID": 2001, "Course Name": "...", "count": 2, "avg_grade": 2.35}, ...]}
+
+Ops are count (rows, or non-null values of a column), min, max and avg.
+Grouped and aggregated columns must be readable by the role and not
+encrypted. avg needs a numeric mapping (NUMERIC_COLUMNS, e.g. letter grades
+to grade points); min and max use the mapping when the column has one.
+The role's range filter and the request's filters apply as for detail rows.
+"""
+from decimal import Decimal
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from privilege_controller import FKLink
+
+# Letter grade -> grade points
+GRADE_POINTS = {
+    "A+": 4.3, "A": 4.0, "A-": 3.7,
+    "B+": 3.3, "B": 3.0, "B-": 2.7,
+    "C+": 2.3, "C": 2.0, "C-": 1.7,
+    "D+": 1.3, "D": 1.0, "F": 0.0,
+}
+
+# Text columns aggregated through a numeric mapping (other values count as NULL)
+NUMERIC_COLUMNS: Dict[str, Dict[str, Mapping[str, float]]] = {
+    "grades": {"grade": GRADE_POINTS},
+}
+
+AGGREGATE_OPS = ("count", "min", "max", "avg")
+
+# Most group_by columns and metrics in one query
+AGGREGATE_MAX_GROUP_BY = 4
+AGGREGATE_MAX_METRICS = 8
+
+
+class AggregateError(ValueError):
+    """Invalid aggregate request (answered with 400)"""
+
+
+class AggregateQuery:
+    """SQL pieces of an aggregate query"""
+
+    def __init__(self):
+        self.select: List[str] = []
+        self.select_params: List = []
+        self.joins: List[str] = []
+        self.group_by: List[str] = []
+        self.outputs: Dict[str, str] = {}  # lowercase output name -> ORDER BY expression
+        self.group_columns: List[str] = []
+
+
+def _numeric_expr(table: str, column: str, expr: str) -> Tuple[Optional[str], List]:
+    mapping = NUMERIC_COLUMNS.get(table, {}).get(column)
+    if not mapping:
+        return None, []
+    params: List = []
+    for value, number in mapping.items():
+        params.extend([value, number])
+    return f"CASE {expr} " + " ".join(["WHEN %s THEN %s"] * len(mapping)) + " END", params
+
+
+def build_aggregate(table: str, spec, column_lookup: Mapping[str, str],
+                    encrypted_columns, alias: str = "target") -> AggregateQuery:
+    """
+    Validate an "aggregate" request and compile its SELECT, joins and GROUP BY
+
+    Args:
+        column_lookup: lowercase name -> actual name of the role's readable columns
+        encrypted_columns: encrypted columns of the table (not aggregatable)
+
+    Raises:
+        AggregateError: the request is malformed or uses a column it may not
+    """
+    if not isinstance(spec, dict):
+        raise AggregateError("aggregate must be an object")
+    group_by = spec.get("group_by") or []
+    metrics = spec.get("metrics") or []
+    if not isinstance(group_by, list) or not isinstance(metrics, list):
+        raise AggregateError("group_by and metrics must be lists")
+    if not metrics:
+        raise AggregateError("aggregate needs at least one metric")
+    if len(group_by) > AGGREGATE_MAX_GROUP_BY or len(metrics) > AGGREGATE_MAX_METRICS:
+        raise AggregateError(f"At most {AGGREGATE_MAX_GROUP_BY} group_by columns "
+                             f"and {AGGREGATE_MAX_METRICS} metrics")
+
+    def column(name) -> str:
+        actual = column_lookup.get(str(name).lower())
+        if not actual:
+            raise AggregateError(f"Invalid column '{name}'")
+        if actual in encrypted_columns:
+            raise AggregateError(f"Aggregating encrypted column '{actual}' is not supported")
+        return actual
+
+    query = AggregateQuery()
+    table_fks = FKLink.get(table, {})
+    for name in group_by:
+        actual = column(name)
+        if actual in query.group_columns:
+            continue
+        expr = f"{alias}.`{actual}`"
+        query.group_columns.append(actual)
+        query.select.append(f"{expr} AS `{actual}`")
+        query.group_by.append(expr)
+        query.outputs[actual.lower()] = expr
+        # Show the linked name (course, student) next to a grouped foreign key
+        fk = table_fks.get(actual)
+        if fk and fk.get("corrNameSql") and fk.get("corrName"):
+            join_alias = f"g{len(query.joins) + 1}"
+            query.joins.append(f"LEFT JOIN `{fk['table']}` {join_alias} "
+                               f"ON {expr} = {join_alias}.`{fk['pk']}`")
+            corr = fk["corrNameSql"].replace("j.", f"{join_alias}.")
+            query.select.append(f"ANY_VALUE({corr}) AS `{fk['corrName']}`")
+
+    for metric in metrics:
+        if not isinstance(metric, dict):
+            raise AggregateError("Each metric must be an object")
+        op = str(metric.get("op") or "").lower()
+        if op not in AGGREGATE_OPS:
+            raise AggregateError(f"Unsupported aggregate op '{op}'")
+        name = metric.get("column")
+        if name is None:
+            if op != "count":
+                raise AggregateError(f"{op} needs a column")
+            output, sql, params = "count", "COUNT(*)", []
+        else:
+            actual = column(name)
+            expr = f"{alias}.`{actual}`"
+            numeric, params = _numeric_expr(table, actual, expr)
+            output = f"{op}_{actual}"
+            if op == "count":
+                sql, params = f"COUNT({expr})", []
+            elif op == "avg":
+                if numeric is None:
+                    raise AggregateError(f"avg is not supported on column '{actual}'")
+                sql = f"ROUND(AVG({numeric}), 2)"
+            else:
+                sql = f"{op.upper()}({numeric or expr})"
+        if output.lower() in query.outputs:
+            continue
+        query.select.append(f"{sql} AS `{output}`")
+        query.select_params.extend(params)
+        query.outputs[output.lower()] = f"`{output}`"
+    return query
+
+
+def finish_rows(rows: List[Dict]) -> List[Dict]:
+    """Send DECIMAL aggregates (AVG, mapped MIN/MAX) as JSON numbers"""
+    for row in rows:
+        for key, value in row.items():
+            if isinstance(value, Decimal):
+                row[key] = float(value)
+    return rows
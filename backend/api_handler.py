@@ -1,36 +1,719 @@
 import json
-import urllib.parse
 import traceback
 from http.server import BaseHTTPRequestHandler
 
-import os
-from communicator import json_response, read_json
+from router import Router
+import metrics
+from aggregation import AggregateError, build_aggregate, finish_rows
+from batch import run_batch
+from query_cache import QUERY_CACHE
+from startup import WARMUP
+from guardian_children import GUARDIAN_CHILDREN
 from privilege_controller import (
-    parse_bearer_role,
     ROLE_TABLES,
     RolePrivileges,
     FKLink,
     buildRangeFilter,
     retrieveReadableColumns,
+    getTablePrivileges,
 )
-from db_query import db_query, db_execute, getTableColumns, checkPrimaryKey, checkUpdatableColumns
+from db_query import db_query, db_execute, getTableColumns, checkPrimaryKey
 from logger import logDataUpdate, logAccountOperation
-from auth import authenticate_user, create_session, validate_session, logout
+from auth import authenticate_user, create_session, logout
+from login_throttle import LOGIN_THROTTLE
+from deadline import QUERY_DEADLINE, DeadlineExceeded, ClientDisconnected
 from logger_config import app_logger, log_security_event
-from audit_logger import log_audit_event, log_sql_execution, log_unauthorized_access
-from security_monitor import detect_sql_injection, log_sql_injection_attempt, detect_policy_violation, log_policy_violation
+from audit_logger import log_audit_event, log_sql_execution
+from security_monitor import detect_sql_injection, log_sql_injection_attempt
 # Security enhancements
 from security import (
-    decrypt_password, validate_email, validate_password, 
-    sanitize_input, validate_table_name, validate_column_name,
-    validate_table_name_whitelist, escape_identifier
+    decrypt_password, validate_email, validate_password,
+    sanitize_input, validate_column_name, escape_identifier
 )
 from encryption import (
     getEncryptedColumns,
-    buildSelectDecryptExpr,
-    getEncryptionKey,
+    buildSelectEncryptedColumn,
+    buildEncryptValue,
+    decryptResultRows,
+    getBlindIndexColumn,
+    computeBlindIndex,
+    computeBlindIndexCandidates,
 )
 
+# Login bodies only carry credentials; keep them small
+LOGIN_MAX_BODY = 64 * 1024  # 64KB
+
+router = Router()
+router.add_observer(metrics.observe_route)
+
+
+@router.get("/", max_body=None, admission=False)
+def handle_index(ctx):
+    endpoints = {}
+    for route in router.routes():
+        endpoints.setdefault(route.method, []).append(route.path)
+    return ctx.respond(200, {
+        "message": "University Data API Server",
+        "version": "1.0",
+        "endpoints": endpoints
+    })
+
+
+@router.get("/retrieveTablesColumns", auth=True, action="retrieve_columns", max_body=None, batch="read")
+def handle_retrieve_tables_columns(ctx):
+    auth = ctx.auth
+    role_privs = RolePrivileges.get(auth["role"], {})
+    tables = ROLE_TABLES.get(auth["role"], [])
+
+    tableColumns = {}
+    for table in tables:
+        columns_info = getTableColumns(table, role=auth["role"])
+        table_priv = getTablePrivileges(auth["role"], table)
+        allowed_columns = retrieveReadableColumns(
+            table_priv, [col["Field"] for col in columns_info]
+        ) if table_priv else set()
+
+        # keep original structure but drop disallowed columns
+        filtered = [col for col in columns_info if col["Field"] in allowed_columns]
+        tableColumns[table] = filtered
+
+    rolePrivileges = role_privs  # keep original structure for client if needed
+    return ctx.respond(
+        200,
+        {"tables": tables, "tableColumns": tableColumns, "rolePrivileges": rolePrivileges},
+    )
+
+
+# Public key endpoint for frontend encryption
+@router.get("/auth/public-key", max_body=None, admission=False)
+def handle_public_key(ctx):
+    from security import get_public_key_info
+    key_info = get_public_key_info()
+    if key_info:
+        return ctx.respond(200, key_info)
+    else:
+        return ctx.respond(503, {"error": "Public key not available"})
+
+
+# Liveness: the process is up and answering
+@router.get("/healthz", max_body=None, admission=False)
+def handle_healthz(ctx):
+    return ctx.respond(200, {"status": "ok"})
+
+
+# Readiness: 503 until the startup warm-up has finished (startup.py)
+@router.get("/readyz", max_body=None, admission=False)
+def handle_readyz(ctx):
+    status = WARMUP.status()
+    return ctx.respond(200 if status["ready"] else 503, status)
+
+
+# Prometheus scrape endpoint, restricted to METRICS_ALLOWED_NETWORKS
+@router.get("/metrics", max_body=None, admission=False)
+def handle_metrics(ctx):
+    if not metrics.is_scrape_allowed(ctx.client_ip):
+        app_logger.warning(f"Metrics scrape denied: ip={ctx.client_ip}")
+        return ctx.respond(403, {"error": "Forbidden"})
+    return ctx.respond_text(200, metrics.render(), "text/plain; version=0.0.4; charset=utf-8")
+
+
+@router.post("/auth/login", action="login", max_body=LOGIN_MAX_BODY, envelope=True,
+             throttle=LOGIN_THROTTLE)
+def handle_login(ctx):
+    client_ip = ctx.client_ip
+    data = ctx.data
+    email = data.get("email", "").strip()
+    password = data.get("password", "")
+    encrypted_password = data.get("encryptedPassword", "")  # Support encrypted password
+
+    # Log login request
+    app_logger.info(f"Login request received: email={email}, ip={client_ip}")
+    logAccountOperation(client_ip, None, None, f"Login request sent: email={email}")
+
+    # Input validation
+    if not email:
+        app_logger.warning(f"Login rejected: email missing, ip={client_ip}")
+        log_security_event('login_rejected', {'reason': 'email_missing'}, None, client_ip)
+        logAccountOperation(client_ip, None, None, f"Login rejected: reason=Email missing")
+        return ctx.error(400, "Email is required")
+    if not password and not encrypted_password:
+        app_logger.warning(f"Login rejected: password missing, email={email}, ip={client_ip}")
+        log_security_event('login_rejected', {'email': email, 'reason': 'password_missing'}, None, client_ip)
+        logAccountOperation(client_ip, None, None, f"Login rejected: email={email}, reason=Password missing")
+        return ctx.error(400, "Password is required")
+
+    # Validate email format
+    if not validate_email(email):
+        app_logger.warning(f"Login rejected: invalid email format, email={email}, ip={client_ip}")
+        log_security_event('login_rejected', {'email': email, 'reason': 'invalid_email_format'}, None, client_ip)
+        logAccountOperation(client_ip, None, None, f"Login rejected: email={email}, reason=Invalid email format")
+        return ctx.error(400, "Invalid email format")
+
+    # Decrypt password if encrypted
+    if encrypted_password:
+        key_id = ctx.headers.get("X-Key-Id") or data.get("keyId") or None
+        decrypted = decrypt_password(encrypted_password, key_id)
+        if decrypted:
+            password = decrypted
+        # If decryption fails, fall back to plain password (backward compatibility)
+
+    # Check for SQL injection attempts in email
+    if detect_sql_injection(email):
+        app_logger.warning(f"SQL injection attempt detected in login: email={email}, ip={client_ip}")
+        log_sql_injection_attempt(email, None, client_ip)
+        log_security_event('sql_injection_attempt', {'email': email, 'location': 'login_email'}, None, client_ip)
+        logAccountOperation(client_ip, None, None, f"SQL injection attempt: email={email}, location=login_email")
+        return ctx.error(400, "Invalid input")
+
+    # Check for SQL injection attempts in password
+    if password and detect_sql_injection(password):
+        app_logger.warning(f"SQL injection attempt detected in login: password field, email={email}, ip={client_ip}")
+        log_sql_injection_attempt(password, None, client_ip)
+        log_security_event('sql_injection_attempt', {'email': email, 'location': 'login_password'}, None, client_ip)
+        logAccountOperation(client_ip, None, None, f"SQL injection attempt: email={email}, location=login_password")
+        return ctx.error(400, "Invalid input")
+
+    # Validate password
+    if password:
+        is_valid, error_msg = validate_password(password)
+        if not is_valid:
+            app_logger.warning(f"Login rejected: invalid password format, email={email}, ip={client_ip}")
+            log_security_event('login_rejected', {'email': email, 'reason': 'invalid_password_format'}, None, client_ip)
+            logAccountOperation(client_ip, None, None, f"Login rejected: email={email}, reason=Invalid password format")
+            return ctx.error(400, error_msg)
+
+    # Sanitize inputs
+    email = sanitize_input(email, max_length=255)
+    password = sanitize_input(password, max_length=128)
+
+    if not email or not password:
+        app_logger.warning(f"Login rejected: sanitization failed, email={email}, ip={client_ip}")
+        log_security_event('login_rejected', {'email': email, 'reason': 'sanitization_failed'}, None, client_ip)
+        logAccountOperation(client_ip, None, None, f"Login rejected: email={email}, reason=Input sanitization failed")
+        return ctx.error(400, "Invalid input")
+
+    # Authenticate user
+    user_info = authenticate_user(email, password, client_ip)
+
+    if user_info:
+        # Create session
+        token = create_session(user_info)
+        app_logger.info(f"Session created for login: user_id={user_info['user_id']}, role={user_info['role']}, ip={client_ip}")
+        logAccountOperation(client_ip, user_info['user_id'], user_info['role'], f"Session created successfully: user_id={user_info['user_id']}, role={user_info['role']}")
+        return ctx.respond(200, {
+            "ok": True,
+            "token": token,
+            "user": {
+                "id": user_info["user_id"],
+                "role": user_info["role"],
+                "name": user_info["name"],
+                "user_type": user_info.get("user_type", "")
+            }
+        })
+    else:
+        # Login failed - ensure it's logged (brute force attack indicator)
+        # Note: authenticate_user already logs this, but we ensure it's recorded here too
+        app_logger.warning(f"Login failed: email={email}, reason=invalid_credentials, ip={client_ip}")
+        log_security_event('login_failed', {'email': email, 'reason': 'invalid_credentials'}, None, client_ip)
+        logAccountOperation(client_ip, None, None, f"Login failed: email={email}, reason=Invalid email or password")
+        return ctx.error(401, "Invalid email or password")
+
+
+@router.post("/auth/logout", action="logout", max_body=None, envelope=True)
+def handle_logout(ctx):
+    if logout(ctx.bearer_token()):
+        return ctx.respond(200, {"ok": True, "message": "Logged out successfully"})
+    else:
+        return ctx.error(400, "Invalid token")
+
+
+@router.post("/performQuery", auth=True, action="query", audit="Database query request",
+             table_field="currentTable", policy_action="read", deadline=QUERY_DEADLINE, batch="read")
+def handle_perform_query(ctx):
+    auth = ctx.auth
+    client_ip = ctx.client_ip
+    data = ctx.data
+    table = ctx.table
+    filters = data.get("filters", [])
+    orders = data.get("orders", [])
+    limit = int(data.get("limit", 100))
+    offset = int(data.get("offset", 0))
+    limit = max(1, min(limit, 500))
+    offset = max(0, offset)
+
+    columnData = getTableColumns(table, role=auth.get('role'))
+    table_priv = getTablePrivileges(auth["role"], table)
+    availableCols = [col["Field"] for col in columnData]
+    tableCols = table_priv.readable_columns(availableCols) if table_priv else ()
+    if not tableCols:
+        return ctx.respond(403, {"error": "Forbidden"})
+    tableColsMap = table_priv.column_lookup(availableCols)
+
+    table_encrypted_columns = getEncryptedColumns(table)
+
+    def checkColumn(name):
+        actual = tableColsMap.get(str(name).lower())
+        if actual:
+            return f"{currentTableName}.`{actual}`", actual
+        raise ValueError("Invalid column")
+
+    OP = {
+        "eq": "=",
+        "ne": "!=",
+        "gt": ">",
+        "lt": "<",
+        "gte": ">=",
+        "lte": "<=",
+        "like": "LIKE",
+        "in": "IN",
+        "between": "BETWEEN",
+        "is_null": "IS NULL",
+        "is_not_null": "IS NOT NULL",
+    }
+
+    currentTableName = "target"
+    queryingColumns = []
+    joins = []
+    joinIdx = 1
+    whereClauses = []
+    select_params = []
+    where_params = []
+
+    tableFks = FKLink.get(table, {})
+
+    # Summary rows instead of detail rows (aggregation.py)
+    aggregate = None
+    if data.get("aggregate") is not None:
+        try:
+            aggregate = build_aggregate(table, data["aggregate"], tableColsMap, table_encrypted_columns, currentTableName)
+        except AggregateError as e:
+            return ctx.respond(400, {"error": str(e)})
+        queryingColumns = aggregate.select
+        joins = aggregate.joins
+        select_params = list(aggregate.select_params)
+    else:
+        for col in tableCols:
+            if col in table_encrypted_columns:
+                select_expr, expr_params = buildSelectEncryptedColumn(table, col, currentTableName)
+                queryingColumns.append(select_expr)
+                select_params.extend(expr_params)
+            elif col in tableFks.keys():
+                queryingColumns.append(f"{currentTableName}.`{col}` AS `{col}`")
+
+                joinTableName = f"j{joinIdx}"
+                joins.append(
+                    f"LEFT JOIN `{tableFks[col].get('table')}` {joinTableName} "
+                    f"ON {currentTableName}.`{col}` = {joinTableName}.`{tableFks[col].get('pk')}`"
+                )
+                joinIdx += 1
+
+                corr_sql = tableFks[col].get("corrNameSql")
+                corr_alias = tableFks[col].get("corrName")
+                if corr_sql and corr_alias:
+                    queryingColumns.append(
+                        f"{corr_sql.replace('j.', f'{joinTableName}.')} AS `{corr_alias}`"
+                    )
+            else:
+                queryingColumns.append(f"{currentTableName}.`{col}` AS `{col}`")
+
+    rangeJoins, rangeWhere, rangeParams = buildRangeFilter(auth, table, currentTableName)
+
+    queryingColumnsStr = ', '.join(queryingColumns)
+    sqlComponents = [f"SELECT {queryingColumnsStr} FROM `{table}` {currentTableName}"]
+
+    if rangeJoins:
+        sqlComponents.extend(rangeJoins)
+
+    if joins:
+        sqlComponents.extend(joins)
+
+    def verifyList(valInstance):
+        if isinstance(valInstance, list):
+            if all(isinstance(i, (str, int, float)) for i in valInstance):
+                return True
+            else:
+                return False
+        else:
+            return False
+
+    if rangeWhere:
+        whereClauses.append(rangeWhere)
+        where_params.extend(rangeParams or [])
+
+    for f in (filters or []):
+        targetColumn = f.get("column")
+        operator = str(f.get("operator") or f.get("op") or "").lower()
+        val = f.get("value", None)
+        if not targetColumn or operator not in OP:
+            continue
+        # Validate column name
+        if not validate_column_name(targetColumn):
+            continue
+        try:
+            col, actual_col = checkColumn(targetColumn)
+        except ValueError:
+            continue
+
+        if actual_col in table_encrypted_columns:
+            # Equality on a blind-indexed column is an indexed lookup on its HMAC
+            bidx_col = getBlindIndexColumn(table, actual_col)
+            if bidx_col and operator == "eq" and val is not None:
+                candidates = computeBlindIndexCandidates(table, actual_col, val)
+                placeholders = ", ".join(["%s"] * len(candidates))
+                whereClauses.append(f"{currentTableName}.`{bidx_col}` IN ({placeholders})")
+                where_params.extend(candidates)
+                continue
+            return ctx.respond(
+                400,
+                {"error": f"Filtering on encrypted column '{actual_col}' is not supported"},
+            )
+
+        tok = OP[operator]
+        if operator in {"eq", "ne", "gt", "lt", "gte", "lte", "like"}:
+            if val is None:
+                continue
+            whereClauses.append(f"{col} {tok} %s")
+            where_params.append(val)
+        elif operator == "in":
+            if isinstance(val, str):
+                try:
+                    valInstance = json.loads(val)
+                except Exception:
+                    continue
+            else:
+                valInstance = val
+            if not verifyList(valInstance) or len(valInstance) != 2:
+                continue
+            placeholders = ", ".join(["%s"] * len(valInstance))
+            whereClauses.append(f"{col} IN ({placeholders})")
+            where_params.extend(valInstance)
+        elif operator == "between":
+            if isinstance(val, str):
+                try:
+                    valInstance = json.loads(val)
+                except Exception:
+                    continue
+            else:
+                valInstance = val
+            if not verifyList(valInstance) or len(valInstance) != 2:
+                continue
+            whereClauses.append(f"{col} BETWEEN %s AND %s")
+            where_params.extend(valInstance)
+        elif operator == "is_null":
+            whereClauses.append(f"{col} IS NULL")
+        elif operator == "is_not_null":
+            whereClauses.append(f"{col} IS NOT NULL")
+
+    if whereClauses:
+        sqlComponents.append("WHERE " + " AND ".join(whereClauses))
+    if aggregate and aggregate.group_by:
+        sqlComponents.append("GROUP BY " + ", ".join(aggregate.group_by))
+
+    orderClauses = []
+    for o in (orders or []):
+        targetColumn = o.get("column")
+        if not targetColumn:
+            continue
+        if aggregate:
+            # Aggregates are ordered by their output columns (groups or metrics)
+            expr = aggregate.outputs.get(str(targetColumn).lower())
+            direction = (o.get("direction") or "").upper()
+            if expr and direction in ("ASC", "DESC"):
+                orderClauses.append(f"{expr} {direction}")
+            continue
+        # Validate column name
+        if not validate_column_name(targetColumn):
+            continue
+        try:
+            col, actual_col = checkColumn(targetColumn)
+        except ValueError:
+            continue
+
+        if actual_col in table_encrypted_columns:
+            return ctx.respond(
+                400,
+                {"error": f"Ordering on encrypted column '{actual_col}' is not supported"},
+            )
+
+        direction = (o.get("direction") or "").upper()
+        if direction not in ("ASC", "DESC"):
+            continue
+        orderClauses.append(f"{col} {direction}")
+    if aggregate and not orderClauses:
+        orderClauses = [f"{expr} ASC" for expr in aggregate.group_by]
+    if orderClauses:
+        sqlComponents.append("ORDER BY " + ", ".join(orderClauses))
+
+    sqlComponents.append(f"LIMIT {limit} OFFSET {offset}")
+
+    sql = " ".join(sqlComponents)
+
+    # Log database query access
+    log_sql_execution('SELECT', table, auth.get('personId'), auth.get('role'), sql, client_ip, True)
+    log_audit_event('query', {'table': table, 'filters': len(filters), 'limit': limit, 'aggregate': aggregate is not None}, auth.get('personId'), auth.get('role'), client_ip, sql)
+
+    final_params = select_params + where_params
+
+    # Self-service roles re-read the same rows; serve them from the result cache
+    cache_key = None
+    if QUERY_CACHE.enabled_for(auth.get('role')):
+        cache_tables = {table, *(tableFks[c].get('table') for c in tableCols if c in tableFks)}
+        if rangeJoins or table_priv.range == "children":
+            cache_tables.add("students")
+        cache_key = QUERY_CACHE.make_key(auth.get('role'), sql, final_params)
+        results = QUERY_CACHE.get(cache_key, table)
+        if results is not None:
+            app_logger.info(f"Query served from cache: user_id={auth.get('personId')}, role={auth.get('role')}, table={table}, rows={len(results)}, ip={client_ip}")
+            logAccountOperation(client_ip, auth.get('personId'), auth.get('role'), f"Database query successful: table={table}, rows_returned={len(results)}")
+            return ctx.respond(200, {"results": results})
+        cache_generation = QUERY_CACHE.generation(cache_tables)
+
+    # Cache fills read the primary: a lagging replica could store pre-write
+    # rows under the generation the write just bumped
+    results = db_query(sql, final_params, role=auth.get('role'), use_primary=cache_key is not None)
+    if aggregate:
+        finish_rows(results)
+    else:
+        decryptResultRows(table, results, tableCols)
+    if cache_key is not None:
+        QUERY_CACHE.put(cache_key, table, cache_tables, results, cache_generation)
+    app_logger.info(f"Query executed successfully: user_id={auth.get('personId')}, role={auth.get('role')}, table={table}, rows={len(results)}, ip={client_ip}")
+    logAccountOperation(client_ip, auth.get('personId'), auth.get('role'), f"Database query successful: table={table}, rows_returned={len(results)}")
+    return ctx.respond(200, {"results": results})
+
+
+@router.post("/data/update", auth=True, action="update", audit="Data update request",
+             table_field="table", policy_action="write", envelope=True, batch="write")
+def handle_data_update(ctx):
+    auth = ctx.auth
+    client_ip = ctx.client_ip
+    table_priv = getTablePrivileges(auth["role"], ctx.table)
+    data = ctx.data
+    table = ctx.table
+    key = data.get("key", {})
+    updateValues = data.get("updateValues", {})
+
+    columnData = getTableColumns(table, role=auth.get('role'))
+    if not checkPrimaryKey(columnData, key):
+        return ctx.error(401, "Unauthorized")
+
+    if table_priv is None or not table_priv.can_update(updateValues):
+        return ctx.error(401, "Unauthorized")
+
+    table_encrypted_columns = getEncryptedColumns(table)
+    currentTableName = "target"
+    rangeJoins, rangeWhere, rangeParams = buildRangeFilter(auth, table, currentTableName)
+
+    setColumnSql = []
+    params = []
+
+    for colName, colVal in updateValues.items():
+        if colName in table_encrypted_columns:
+            value_expr, value_params = buildEncryptValue(table, colName, colVal)
+            setColumnSql.append(f"{currentTableName}.`{colName}` = {value_expr}")
+            params.extend(value_params)
+            bidx_col = getBlindIndexColumn(table, colName)
+            if bidx_col:
+                setColumnSql.append(f"{currentTableName}.`{bidx_col}` = %s")
+                params.append(computeBlindIndex(table, colName, colVal))
+        else:
+            setColumnSql.append(f"{currentTableName}.`{colName}` = %s")
+            params.append(colVal)
+
+    if not setColumnSql:
+        return ctx.error(400, "No columns to update")
+
+    primaryKey = next(iter(key))
+
+    parts = [f"UPDATE `{table}` {currentTableName}"]
+    if rangeJoins:
+        parts.append(" ".join(rangeJoins))
+
+    parts.append(f"SET {', '.join(setColumnSql)}")
+
+    where_parts = [f"{currentTableName}.`{primaryKey}` = %s"]
+    params.append(key[primaryKey])
+
+    if rangeWhere:
+        where_parts.append(rangeWhere)
+        params.extend(rangeParams or [])
+
+    sql = " ".join(parts) + " WHERE " + " AND ".join(where_parts)
+
+    # Log data modification
+    logDataUpdate(auth["personId"], auth["role"], sql)
+    log_sql_execution('UPDATE', table, auth.get('personId'), auth.get('role'), sql, client_ip, True)
+    log_audit_event('update', {'table': table, 'key': key, 'updateValues': list(updateValues.keys())}, auth.get('personId'), auth.get('role'), client_ip, sql)
+
+    try:
+        rows_affected = db_execute(sql, params, role=auth.get('role'))
+        QUERY_CACHE.invalidate(table)
+        GUARDIAN_CHILDREN.on_write(table, updateValues.keys())
+        app_logger.info(f"Update executed successfully: user_id={auth.get('personId')}, role={auth.get('role')}, table={table}, rows_affected={rows_affected}, ip={client_ip}")
+        logAccountOperation(client_ip, auth.get('personId'), auth.get('role'), f"Data update successful: table={table}, rows_affected={rows_affected}")
+        return ctx.respond(200, {"ok": True, "updated": updateValues})
+    except Exception as e:
+        # Log error details but don't expose to client
+        app_logger.error(f"Update error: user_id={auth.get('personId')}, role={auth.get('role')}, table={table}, error={e}, ip={client_ip}")
+        log_sql_execution('UPDATE', table, auth.get('personId'), auth.get('role'), sql, client_ip, False)
+        logAccountOperation(client_ip, auth.get('personId'), auth.get('role'), f"Data update failed: table={table}, error={str(e)}")
+        if isinstance(e, (DeadlineExceeded, ClientDisconnected)):
+            raise  # Answered by the router (504 / no response)
+        import logging
+        logging.error(f"Update error: {str(e)}", exc_info=True)
+        traceback.print_exc()  # Keep for development
+        # Return generic error message
+        return ctx.error(500, "Server error occurred")
+
+
+@router.post("/data/delete", auth=True, action="delete", audit="Data delete request",
+             table_field="table", policy_action="delete", envelope=True, batch="write")
+def handle_data_delete(ctx):
+    auth = ctx.auth
+    client_ip = ctx.client_ip
+    data = ctx.data
+    table = ctx.table
+    key = data.get("key", {})
+
+    table_priv = getTablePrivileges(auth["role"], table)
+    if table_priv is None or not table_priv.can_delete:
+        return ctx.error(401, "Unauthorized")
+
+    columnData = getTableColumns(table, role=auth.get('role'))
+    if not checkPrimaryKey(columnData, key):
+        return ctx.error(401, "Unauthorized")
+
+    currentTableName = "target"
+    rangeJoins, rangeWhere, rangeParams = buildRangeFilter(auth, table, currentTableName)
+
+    params = []
+    primaryKey = next(iter(key))
+
+    parts = [f"DELETE {currentTableName} FROM `{table}` {currentTableName}"]
+    if rangeJoins:
+        parts.append(" ".join(rangeJoins))
+
+    where_parts = [f"{currentTableName}.`{primaryKey}` = %s"]
+    params.append(key[primaryKey])
+
+    if rangeWhere:
+        where_parts.append(rangeWhere)
+        params.extend(rangeParams or [])
+
+    sql = " ".join(parts) + " WHERE " + " AND ".join(where_parts)
+
+    # Log data modification
+    logDataUpdate(auth["personId"], auth["role"], sql)
+    log_sql_execution('DELETE', table, auth.get('personId'), auth.get('role'), sql, client_ip, True)
+    log_audit_event('delete', {'table': table, 'key': key}, auth.get('personId'), auth.get('role'), client_ip, sql)
+
+    try:
+        rows_affected = db_execute(sql, params, role=auth.get('role'))
+        QUERY_CACHE.invalidate(table)
+        GUARDIAN_CHILDREN.on_write(table)
+        app_logger.info(f"Delete executed successfully: user_id={auth.get('personId')}, role={auth.get('role')}, table={table}, rows_affected={rows_affected}, ip={client_ip}")
+        logAccountOperation(client_ip, auth.get('personId'), auth.get('role'), f"Data delete successful: table={table}, rows_affected={rows_affected}")
+        return ctx.respond(200, {"ok": True, "deleted": key})
+    except Exception as e:
+        # Log error details but don't expose to client
+        app_logger.error(f"Delete error: user_id={auth.get('personId')}, role={auth.get('role')}, table={table}, error={e}, ip={client_ip}")
+        log_sql_execution('DELETE', table, auth.get('personId'), auth.get('role'), sql, client_ip, False)
+        logAccountOperation(client_ip, auth.get('personId'), auth.get('role'), f"Data delete failed: table={table}, error={str(e)}")
+        if isinstance(e, (DeadlineExceeded, ClientDisconnected)):
+            raise  # Answered by the router (504 / no response)
+        import logging
+        logging.error(f"Delete error: {str(e)}", exc_info=True)
+        traceback.print_exc()  # Keep for development
+        # Return generic error message
+        return ctx.error(500, "Server error occurred")
+
+
+@router.post("/data/insert", auth=True, action="insert", audit="Data insert request",
+             table_field="table", policy_action="write", envelope=True, batch="write")
+def handle_data_insert(ctx):
+    auth = ctx.auth
+    client_ip = ctx.client_ip
+    table_priv = getTablePrivileges(auth["role"], ctx.table)
+    data = ctx.data
+    table = ctx.table
+    updateValues = data.get("insertValues", {})
+    params = []
+
+    # Check if insert columns match allowed columns
+    if table_priv is None or not table_priv.insert_matches(updateValues.keys()):
+        return ctx.error(401, "Unauthorized")
+    allowed_insert_columns = table_priv.insert_columns
+
+    # Validate and escape column names
+    updateValueColumns = list(updateValues.keys())
+    for col in updateValueColumns:
+        if not validate_column_name(col):
+            return ctx.error(400, f"Invalid column name: {col}")
+        escaped_col = escape_identifier(col)
+        if not escaped_col:
+            return ctx.error(400, f"Invalid column name: {col}")
+
+    # Build INSERT SQL with encryption support
+    ordered_columns = allowed_insert_columns
+    table_encrypted_columns = getEncryptedColumns(table)
+
+    columns_clause = []
+    value_fragments = []
+    params = []
+
+    for col in ordered_columns:
+        columns_clause.append(f"`{col}`")
+        val = updateValues[col]
+        if col in table_encrypted_columns:
+            value_expr, value_params = buildEncryptValue(table, col, val)
+            value_fragments.append(value_expr)
+            params.extend(value_params)
+            bidx_col = getBlindIndexColumn(table, col)
+            if bidx_col:
+                columns_clause.append(f"`{bidx_col}`")
+                value_fragments.append("%s")
+                params.append(computeBlindIndex(table, col, val))
+        else:
+            value_fragments.append("%s")
+            params.append(val)
+
+    columns_str = ', '.join(columns_clause)
+    placeholders = ', '.join(value_fragments)
+
+    sql = f"INSERT INTO `{table}` ({columns_str}) VALUES ({placeholders})"
+
+    # Log data modification
+    logDataUpdate(auth["personId"], auth["role"], sql)
+    log_sql_execution('INSERT', table, auth.get('personId'), auth.get('role'), sql, client_ip, True)
+    log_audit_event('insert', {'table': table, 'columns': updateValueColumns}, auth.get('personId'), auth.get('role'), client_ip, sql)
+
+    try:
+        rows_affected = db_execute(sql, params, role=auth.get('role'))
+        QUERY_CACHE.invalidate(table)
+        GUARDIAN_CHILDREN.on_write(table)
+        app_logger.info(f"Insert executed successfully: user_id={auth.get('personId')}, role={auth.get('role')}, table={table}, rows_affected={rows_affected}, ip={client_ip}")
+        logAccountOperation(client_ip, auth.get('personId'), auth.get('role'), f"Data insert successful: table={table}, rows_affected={rows_affected}")
+        return ctx.respond(200, {"ok": True, "insert": updateValueColumns})
+    except Exception as e:
+        # Log error details but don't expose to client
+        app_logger.error(f"Insert error: user_id={auth.get('personId')}, role={auth.get('role')}, table={table}, error={e}, ip={client_ip}")
+        log_sql_execution('INSERT', table, auth.get('personId'), auth.get('role'), sql, client_ip, False)
+        logAccountOperation(client_ip, auth.get('personId'), auth.get('role'), f"Data insert failed: table={table}, error={str(e)}")
+        if isinstance(e, (DeadlineExceeded, ClientDisconnected)):
+            raise  # Answered by the router (504 / no response)
+        import logging
+        logging.error(f"Insert error: {str(e)}", exc_info=True)
+        traceback.print_exc()  # Keep for development
+        # Return generic error message
+        return ctx.error(500, "Server error occurred")
+
+
+# Several query / data requests in one round trip, session validated once (batch.py)
+@router.post("/batch", auth=True, action="batch")
+def handle_batch(ctx):
+    status, body = run_batch(router, ctx)
+    return ctx.respond(status, body)
+
 
 class SimpleAPIServer(BaseHTTPRequestHandler):
     server_version = "SimpleAPIServer/0.1"
@@ -49,727 +732,12 @@ class SimpleAPIServer(BaseHTTPRequestHandler):
         self.end_headers()
 
     def do_GET(self):
-        try:
-            url = urllib.parse.urlparse(self.path)
-            path = url.path
-            self.log_message(f"GET {path}")
-
-            if path == "/" or path == "":
-                return json_response(self, 200, {
-                    "message": "University Data API Server",
-                    "version": "1.0",
-                    "endpoints": {
-                        "GET": ["/retrieveTablesColumns"],
-                        "POST": ["/auth/login", "/performQuery", "/data/update", "/data/delete", "/data/insert"]
-                    }
-                })
-
-            if path == "/retrieveTablesColumns":
-                auth = parse_bearer_role(self.headers)
-                if not auth:
-                    return json_response(self, 401, {"error": "Unauthorized"})
-
-                role_privs = RolePrivileges.get(auth["role"], {})
-                tables = ROLE_TABLES.get(auth["role"], [])
-
-                tableColumns = {}
-                for table in tables:
-                    columns_info = getTableColumns(table, role=auth["role"])
-                    table_priv = role_privs.get(table, {})
-                    allowed_columns = retrieveReadableColumns(
-                        table_priv, [col["Field"] for col in columns_info]
-                    )
-
-                    # keep original structure but drop disallowed columns
-                    filtered = [col for col in columns_info if col["Field"] in allowed_columns]
-                    tableColumns[table] = filtered
-
-                rolePrivileges = role_privs  # keep original structure for client if needed
-                return json_response(
-                    self,
-                    200,
-                    {"tables": tables, "tableColumns": tableColumns, "rolePrivileges": rolePrivileges},
-                )
-            
-            # Public key endpoint for frontend encryption
-            if path == "/auth/public-key":
-                from security import get_public_key_pem
-                public_key = get_public_key_pem()
-                if public_key:
-                    return json_response(self, 200, {
-                        "publicKey": public_key,
-                        "keyId": os.getenv("RSA_KEY_ID", "default")
-                    })
-                else:
-                    return json_response(self, 503, {"error": "Public key not available"})
-
-            return json_response(self, 404, {"error": "Not found"})
-        except Exception as e:
-            # Log error details but don't expose to client
-            import logging
-            logging.error(f"GET request error: {str(e)}", exc_info=True)
-            traceback.print_exc()  # Keep for development
-            # Return generic error message
-            return json_response(self, 500, {"error": "Server error occurred"})
+        return router.dispatch(self, "GET")
 
     def do_POST(self):
-        try:
-            url = urllib.parse.urlparse(self.path)
-            path = url.path
-            self.log_message(f"POST {path}")
-
-            if path == "/auth/login":
-                # Get client IP address
-                client_ip = self.client_address[0] if hasattr(self, 'client_address') else self.headers.get('X-Forwarded-For', '').split(',')[0].strip() or 'unknown'
-                
-                data = read_json(self) or {}
-                email = data.get("email", "").strip()
-                password = data.get("password", "")
-                encrypted_password = data.get("encryptedPassword", "")  # Support encrypted password
-                
-                # Log login request
-                app_logger.info(f"Login request received: email={email}, ip={client_ip}")
-                logAccountOperation(client_ip, None, None, f"Login request sent: email={email}")
-                
-                # Input validation
-                if not email:
-                    app_logger.warning(f"Login rejected: email missing, ip={client_ip}")
-                    log_security_event('login_rejected', {'reason': 'email_missing'}, None, client_ip)
-                    logAccountOperation(client_ip, None, None, f"Login rejected: reason=Email missing")
-                    return json_response(self, 400, {"ok": False, "error": "Email is required"})
-                if not password and not encrypted_password:
-                    app_logger.warning(f"Login rejected: password missing, email={email}, ip={client_ip}")
-                    log_security_event('login_rejected', {'email': email, 'reason': 'password_missing'}, None, client_ip)
-                    logAccountOperation(client_ip, None, None, f"Login rejected: email={email}, reason=Password missing")
-                    return json_response(self, 400, {"ok": False, "error": "Password is required"})
-                
-                # Validate email format
-                if not validate_email(email):
-                    app_logger.warning(f"Login rejected: invalid email format, email={email}, ip={client_ip}")
-                    log_security_event('login_rejected', {'email': email, 'reason': 'invalid_email_format'}, None, client_ip)
-                    logAccountOperation(client_ip, None, None, f"Login rejected: email={email}, reason=Invalid email format")
-                    return json_response(self, 400, {"ok": False, "error": "Invalid email format"})
-                
-                # Decrypt password if encrypted
-                if encrypted_password:
-                    decrypted = decrypt_password(encrypted_password)
-                    if decrypted:
-                        password = decrypted
-                    # If decryption fails, fall back to plain password (backward compatibility)
-                
-                # Check for SQL injection attempts in email
-                if detect_sql_injection(email):
-                    app_logger.warning(f"SQL injection attempt detected in login: email={email}, ip={client_ip}")
-                    log_sql_injection_attempt(email, None, client_ip)
-                    log_security_event('sql_injection_attempt', {'email': email, 'location': 'login_email'}, None, client_ip)
-                    logAccountOperation(client_ip, None, None, f"SQL injection attempt: email={email}, location=login_email")
-                    return json_response(self, 400, {"ok": False, "error": "Invalid input"})
-                
-                # Check for SQL injection attempts in password
-                if password and detect_sql_injection(password):
-                    app_logger.warning(f"SQL injection attempt detected in login: password field, email={email}, ip={client_ip}")
-                    log_sql_injection_attempt(password, None, client_ip)
-                    log_security_event('sql_injection_attempt', {'email': email, 'location': 'login_password'}, None, client_ip)
-                    logAccountOperation(client_ip, None, None, f"SQL injection attempt: email={email}, location=login_password")
-                    return json_response(self, 400, {"ok": False, "error": "Invalid input"})
-                
-                # Validate password
-                if password:
-                    is_valid, error_msg = validate_password(password)
-                    if not is_valid:
-                        app_logger.warning(f"Login rejected: invalid password format, email={email}, ip={client_ip}")
-                        log_security_event('login_rejected', {'email': email, 'reason': 'invalid_password_format'}, None, client_ip)
-                        logAccountOperation(client_ip, None, None, f"Login rejected: email={email}, reason=Invalid password format")
-                        return json_response(self, 400, {"ok": False, "error": error_msg})
-                
-                # Sanitize inputs
-                email = sanitize_input(email, max_length=255)
-                password = sanitize_input(password, max_length=128)
-                
-                if not email or not password:
-                    app_logger.warning(f"Login rejected: sanitization failed, email={email}, ip={client_ip}")
-                    log_security_event('login_rejected', {'email': email, 'reason': 'sanitization_failed'}, None, client_ip)
-                    logAccountOperation(client_ip, None, None, f"Login rejected: email={email}, reason=Input sanitization failed")
-                    return json_response(self, 400, {"ok": False, "error": "Invalid input"})
-                
-                # Authenticate user
-                user_info = authenticate_user(email, password, client_ip)
-                
-                if user_info:
-                    # Create session
-                    token = create_session(user_info)
-                    app_logger.info(f"Session created for login: user_id={user_info['user_id']}, role={user_info['role']}, ip={client_ip}")
-                    logAccountOperation(client_ip, user_info['user_id'], user_info['role'], f"Session created successfully: user_id={user_info['user_id']}, role={user_info['role']}")
-                    return json_response(self, 200, {
-                        "ok": True,
-                        "token": token,
-                        "user": {
-                            "id": user_info["user_id"],
-                            "role": user_info["role"],
-                            "name": user_info["name"],
-                            "user_type": user_info.get("user_type", "")
-                        }
-                    })
-                else:
-                    # Login failed - ensure it's logged (brute force attack indicator)
-                    # Note: authenticate_user already logs this, but we ensure it's recorded here too
-                    app_logger.warning(f"Login failed: email={email}, reason=invalid_credentials, ip={client_ip}")
-                    log_security_event('login_failed', {'email': email, 'reason': 'invalid_credentials'}, None, client_ip)
-                    logAccountOperation(client_ip, None, None, f"Login failed: email={email}, reason=Invalid email or password")
-                    return json_response(self, 401, {"ok": False, "error": "Invalid email or password"})
-
-            elif path == "/auth/logout":
-                auth_header = self.headers.get("Authorization", "")
-                token = auth_header.replace("Bearer ", "") if auth_header.startswith("Bearer ") else ""
-                if logout(token):
-                    return json_response(self, 200, {"ok": True, "message": "Logged out successfully"})
-                else:
-                    return json_response(self, 400, {"ok": False, "error": "Invalid token"})
-            elif path == "/performQuery":
-                # Get client IP address
-                client_ip = self.client_address[0] if hasattr(self, 'client_address') else self.headers.get('X-Forwarded-For', '').split(',')[0].strip() or 'unknown'
-                
-                auth = parse_bearer_role(self.headers)
-                if not auth:
-                    # Log unauthorized access attempt (session attack indicator)
-                    auth_header = self.headers.get("Authorization", "")
-                    token_info = "missing"
-                    if auth_header.startswith("Bearer "):
-                        token = auth_header.replace("Bearer ", "")
-                        token_info = f"invalid_token: {token[:20]}..." if len(token) > 20 else f"invalid_token: {token}"
-                    app_logger.warning(f"Unauthorized query attempt: ip={client_ip}, token={token_info}")
-                    log_security_event('unauthorized_access', {'action': 'query', 'reason': 'invalid_token', 'token_info': token_info}, None, client_ip)
-                    logAccountOperation(client_ip, None, None, f"Unauthorized access: action=query, reason=Invalid or missing token (session attack attempt)")
-                    return json_response(self, 401, {"error": "Unauthorized"})
-
-                data = read_json(self) or {}
-                table = str(data.get("currentTable") or "")
-                filters = data.get("filters", [])
-                orders = data.get("orders", [])
-                limit = int(data.get("limit", 100))
-                offset = int(data.get("offset", 0))
-                limit = max(1, min(limit, 500))
-                offset = max(0, offset)
-
-                # Log query request
-                app_logger.info(f"Query request: user_id={auth.get('personId')}, role={auth.get('role')}, table={table}, ip={client_ip}")
-                logAccountOperation(client_ip, auth.get('personId'), auth.get('role'), f"Database query request: table={table}")
-
-                # Validate table name with whitelist
-                allowed_tables = ROLE_TABLES.get(auth["role"], [])
-                if not validate_table_name_whitelist(table, allowed_tables):
-                    app_logger.warning(f"Invalid table name in query: user_id={auth.get('personId')}, role={auth.get('role')}, table={table}, ip={client_ip}")
-                    log_security_event('policy_violation', {'action': 'query', 'resource': table, 'reason': 'invalid_table_name'}, auth.get('personId'), client_ip)
-                    logAccountOperation(client_ip, auth.get('personId'), auth.get('role'), f"Policy violation: action=query, table={table}, reason=Invalid table name")
-                    return json_response(self, 400, {"error": "Invalid table name"})
-
-                # check if the table is allowed for the role
-                if table not in allowed_tables:
-                    app_logger.warning(f"Access denied to table: user_id={auth.get('personId')}, role={auth.get('role')}, table={table}, ip={client_ip}")
-                    log_policy_violation('read', auth.get('role'), table, auth.get('personId'), client_ip)
-                    log_unauthorized_access('query', auth.get('personId'), auth.get('role'), client_ip, table)
-                    logAccountOperation(client_ip, auth.get('personId'), auth.get('role'), f"Inappropriate access: action=query, table={table}, reason=Access denied")
-                    return json_response(self, 403, {"error": "Forbidden"})
-
-                columnData = getTableColumns(table, role=auth.get('role'))
-                table_priv = RolePrivileges.get(auth["role"], {}).get(table, {})
-                allowed_columns = retrieveReadableColumns(table_priv, [col["Field"] for col in columnData])
-                if not allowed_columns:
-                    return json_response(self, 403, {"error": "Forbidden"})
-
-                table_encrypted_columns = getEncryptedColumns(table)
-
-                tableCols = []
-                tableColsMap = {}
-                for c in columnData:
-                    colName = c.get("Field")
-                    if colName in allowed_columns:
-                        tableCols.append(colName)
-                        tableColsMap[colName.lower()] = colName
-
-                if not tableCols:
-                    return json_response(
-                        self,
-                        403,
-                        {"error": "No readable columns configured for this table"},
-                    )
-
-                def checkColumn(name):
-                    actual = tableColsMap.get(str(name).lower())
-                    if actual:
-                        return f"{currentTableName}.`{actual}`", actual
-                    raise ValueError("Invalid column")
-
-                OP = {
-                    "eq": "=",
-                    "ne": "!=",
-                    "gt": ">",
-                    "lt": "<",
-                    "gte": ">=",
-                    "lte": "<=",
-                    "like": "LIKE",
-                    "in": "IN",
-                    "between": "BETWEEN",
-                    "is_null": "IS NULL",
-                    "is_not_null": "IS NOT NULL",
-                }
-
-                currentTableName = "target"
-                queryingColumns = []
-                joins = []
-                joinIdx = 1
-                whereClauses = []
-                select_params = []
-                where_params = []
-
-                tableFks = FKLink.get(table, {})
-                encryption_key_value = None
-
-                for col in tableCols:
-                    if col in table_encrypted_columns:
-                        if encryption_key_value is None:
-                            encryption_key_value = getEncryptionKey()
-                        decrypt_expr = buildSelectDecryptExpr(table, col, currentTableName)
-                        queryingColumns.append(f"{decrypt_expr} AS `{col}`")
-                        select_params.append(encryption_key_value)
-                    elif col in tableFks.keys():
-                        queryingColumns.append(f"{currentTableName}.`{col}` AS `{col}`")
-
-                        joinTableName = f"j{joinIdx}"
-                        joins.append(
-                            f"LEFT JOIN `{tableFks[col].get('table')}` {joinTableName} "
-                            f"ON {currentTableName}.`{col}` = {joinTableName}.`{tableFks[col].get('pk')}`"
-                        )
-                        joinIdx += 1
-
-                        corr_sql = tableFks[col].get("corrNameSql")
-                        corr_alias = tableFks[col].get("corrName")
-                        if corr_sql and corr_alias:
-                            queryingColumns.append(
-                                f"{corr_sql.replace('j.', f'{joinTableName}.')} AS `{corr_alias}`"
-                            )
-                    else:
-                        queryingColumns.append(f"{currentTableName}.`{col}` AS `{col}`")
-
-                rangeJoins, rangeWhere, rangeParams = buildRangeFilter(auth, table, currentTableName)
-
-                queryingColumnsStr = ', '.join(queryingColumns)
-                sqlComponents = [f"SELECT {queryingColumnsStr} FROM `{table}` {currentTableName}"]
-
-                if rangeJoins:
-                    sqlComponents.extend(rangeJoins)
-
-                if joins:
-                    sqlComponents.extend(joins)
-
-                def verifyList(valInstance):
-                    if isinstance(valInstance, list):
-                        if all(isinstance(i, (str, int, float)) for i in valInstance):
-                            return True
-                        else:
-                            return False
-                    else:
-                        return False
-
-                if rangeWhere:
-                    whereClauses.append(rangeWhere)
-                    where_params.extend(rangeParams or [])
-
-                for f in (filters or []):
-                    targetColumn = f.get("column")
-                    operator = str(f.get("operator") or f.get("op") or "").lower()
-                    val = f.get("value", None)
-                    if not targetColumn or operator not in OP:
-                        continue
-                    # Validate column name
-                    if not validate_column_name(targetColumn):
-                        continue
-                    try:
-                        col, actual_col = checkColumn(targetColumn)
-                    except ValueError:
-                        continue
-
-                    if actual_col in table_encrypted_columns:
-                        return json_response(
-                            self,
-                            400,
-                            {"error": f"Filtering on encrypted column '{actual_col}' is not supported"},
-                        )
-
-                    tok = OP[operator]
-                    if operator in {"eq", "ne", "gt", "lt", "gte", "lte", "like"}:
-                        if val is None:
-                            continue
-                        whereClauses.append(f"{col} {tok} %s")
-                        where_params.append(val)
-                    elif operator == "in":
-                        if isinstance(val, str):
-                            try:
-                                valInstance = json.loads(val)
-                            except Exception:
-                                continue
-                        else:
-                            valInstance = val
-                        if not verifyList(valInstance) or len(valInstance) != 2:
-                            continue
-                        placeholders = ", ".join(["%s"] * len(valInstance))
-                        whereClauses.append(f"{col} IN ({placeholders})")
-                        where_params.extend(valInstance)
-                    elif operator == "between":
-                        if isinstance(val, str):
-                            try:
-                                valInstance = json.loads(val)
-                            except Exception:
-                                continue
-                        else:
-                            valInstance = val
-                        if not verifyList(valInstance) or len(valInstance) != 2:
-                            continue
-                        whereClauses.append(f"{col} BETWEEN %s AND %s")
-                        where_params.extend(valInstance)
-                    elif operator == "is_null":
-                        whereClauses.append(f"{col} IS NULL")
-                    elif operator == "is_not_null":
-                        whereClauses.append(f"{col} IS NOT NULL")
-
-                if whereClauses:
-                    sqlComponents.append("WHERE " + " AND ".join(whereClauses))
-
-                orderClauses = []
-                for o in (orders or []):
-                    targetColumn = o.get("column")
-                    if not targetColumn:
-                        continue
-                    # Validate column name
-                    if not validate_column_name(targetColumn):
-                        continue
-                    try:
-                        col, actual_col = checkColumn(targetColumn)
-                    except ValueError:
-                        continue
-
-                    if actual_col in table_encrypted_columns:
-                        return json_response(
-                            self,
-                            400,
-                            {"error": f"Ordering on encrypted column '{actual_col}' is not supported"},
-                        )
-
-                    direction = (o.get("direction") or "").upper()
-                    if direction not in ("ASC", "DESC"):
-                        continue
-                    orderClauses.append(f"{col} {direction}")
-                if orderClauses:
-                    sqlComponents.append("ORDER BY " + ", ".join(orderClauses))
-
-                sqlComponents.append(f"LIMIT {limit} OFFSET {offset}")
-
-                sql = " ".join(sqlComponents)
-
-                # Log database query access
-                log_sql_execution('SELECT', table, auth.get('personId'), auth.get('role'), sql, client_ip, True)
-                log_audit_event('query', {'table': table, 'filters': len(filters), 'limit': limit}, auth.get('personId'), auth.get('role'), client_ip, sql)
-
-                final_params = select_params + where_params
-                results = db_query(sql, final_params, role=auth.get('role'))
-                app_logger.info(f"Query executed successfully: user_id={auth.get('personId')}, role={auth.get('role')}, table={table}, rows={len(results)}, ip={client_ip}")
-                logAccountOperation(client_ip, auth.get('personId'), auth.get('role'), f"Database query successful: table={table}, rows_returned={len(results)}")
-                return json_response(self, 200, {"results": results})
-            elif path == "/data/update":
-                # Get client IP address
-                client_ip = self.client_address[0] if hasattr(self, 'client_address') else self.headers.get('X-Forwarded-For', '').split(',')[0].strip() or 'unknown'
-                
-                auth = parse_bearer_role(self.headers)
-                if not auth:
-                    app_logger.warning(f"Unauthorized update attempt: ip={client_ip}")
-                    log_security_event('unauthorized_access', {'action': 'update', 'reason': 'no_auth'}, None, client_ip)
-                    logAccountOperation(client_ip, None, None, f"Unauthorized access: action=update, reason=Token error or missing")
-                    return json_response(self, 401, {"ok": False, "error": "Unauthorized"})
-
-                rolePrivileges = RolePrivileges.get(auth["role"], {})
-                data = read_json(self) or {}
-                table = str(data.get("table") or "")
-                key = data.get("key", {})
-                updateValues = data.get("updateValues", {})
-                
-                # Log update request
-                app_logger.info(f"Update request: user_id={auth.get('personId')}, role={auth.get('role')}, table={table}, ip={client_ip}")
-                logAccountOperation(client_ip, auth.get('personId'), auth.get('role'), f"Data update request: table={table}")
-                
-                # Validate table name
-                if not validate_table_name(table):
-                    app_logger.warning(f"Invalid table name in update: user_id={auth.get('personId')}, role={auth.get('role')}, table={table}, ip={client_ip}")
-                    log_security_event('policy_violation', {'action': 'update', 'resource': table, 'reason': 'invalid_table_name'}, auth.get('personId'), client_ip)
-                    logAccountOperation(client_ip, auth.get('personId'), auth.get('role'), f"Policy violation: action=update, table={table}, reason=Invalid table name")
-                    return json_response(self, 400, {"ok": False, "error": "Invalid table name"})
-
-                setColumnSql = []
-                params = []
-
-                # check if the table is allowed for the role
-                if table not in ROLE_TABLES.get(auth["role"], []):
-                    app_logger.warning(f"Access denied to table for update: user_id={auth.get('personId')}, role={auth.get('role')}, table={table}, ip={client_ip}")
-                    log_policy_violation('write', auth.get('role'), table, auth.get('personId'), client_ip)
-                    log_unauthorized_access('update', auth.get('personId'), auth.get('role'), client_ip, table)
-                    logAccountOperation(client_ip, auth.get('personId'), auth.get('role'), f"Inappropriate access: action=update, table={table}, reason=Access denied")
-                    return json_response(self, 403, {"error": "Forbidden"})
-
-                columnData = getTableColumns(table, role=auth.get('role'))
-                if not checkPrimaryKey(columnData, key):
-                    return json_response(self, 401, {"ok": False, "error": "Unauthorized"})
-
-                if not checkUpdatableColumns(rolePrivileges.get(table, {}).get("update", []), updateValues):
-                    return json_response(self, 401, {"ok": False, "error": "Unauthorized"})
-
-                table_encrypted_columns = getEncryptedColumns(table)
-                currentTableName = "target"
-                rangeJoins, rangeWhere, rangeParams = buildRangeFilter(auth, table, currentTableName)
-
-                setColumnSql = []
-                params = []
-                encryption_key_value = None
-
-                for colName, colVal in updateValues.items():
-                    if colName in table_encrypted_columns:
-                        if encryption_key_value is None:
-                            encryption_key_value = getEncryptionKey()
-                        setColumnSql.append(f"{currentTableName}.`{colName}` = AES_ENCRYPT(%s, %s)")
-                        params.append(colVal)
-                        params.append(encryption_key_value)
-                    else:
-                        setColumnSql.append(f"{currentTableName}.`{colName}` = %s")
-                        params.append(colVal)
-
-                if not setColumnSql:
-                    return json_response(self, 400, {"ok": False, "error": "No columns to update"})
-
-                primaryKey = next(iter(key))
-
-                parts = [f"UPDATE `{table}` {currentTableName}"]
-                if rangeJoins:
-                    parts.append(" ".join(rangeJoins))
-
-                parts.append(f"SET {', '.join(setColumnSql)}")
-
-                where_parts = [f"{currentTableName}.`{primaryKey}` = %s"]
-                params.append(key[primaryKey])
-
-                if rangeWhere:
-                    where_parts.append(rangeWhere)
-                    params.extend(rangeParams or [])
-
-                sql = " ".join(parts) + " WHERE " + " AND ".join(where_parts)
-
-                # Log data modification
-                logDataUpdate(auth["personId"], auth["role"], sql)
-                log_sql_execution('UPDATE', table, auth.get('personId'), auth.get('role'), sql, client_ip, True)
-                log_audit_event('update', {'table': table, 'key': key, 'updateValues': list(updateValues.keys())}, auth.get('personId'), auth.get('role'), client_ip, sql)
-
-                try:
-                    rows_affected = db_execute(sql, params, role=auth.get('role'))
-                    app_logger.info(f"Update executed successfully: user_id={auth.get('personId')}, role={auth.get('role')}, table={table}, rows_affected={rows_affected}, ip={client_ip}")
-                    logAccountOperation(client_ip, auth.get('personId'), auth.get('role'), f"Data update successful: table={table}, rows_affected={rows_affected}")
-                    return json_response(self, 200, {"ok": True, "updated": updateValues})
-                except Exception as e:
-                    # Log error details but don't expose to client
-                    app_logger.error(f"Update error: user_id={auth.get('personId')}, role={auth.get('role')}, table={table}, error={e}, ip={client_ip}")
-                    log_sql_execution('UPDATE', table, auth.get('personId'), auth.get('role'), sql, client_ip, False)
-                    logAccountOperation(client_ip, auth.get('personId'), auth.get('role'), f"Data update failed: table={table}, error={str(e)}")
-                    import logging
-                    logging.error(f"Update error: {str(e)}", exc_info=True)
-                    traceback.print_exc()  # Keep for development
-                    # Return generic error message
-                    return json_response(self, 500, {"ok": False, "error": "Server error occurred"})
-            elif path == "/data/delete":
-                # Get client IP address
-                client_ip = self.client_address[0] if hasattr(self, 'client_address') else self.headers.get('X-Forwarded-For', '').split(',')[0].strip() or 'unknown'
-                
-                auth = parse_bearer_role(self.headers)
-                if not auth:
-                    app_logger.warning(f"Unauthorized delete attempt: ip={client_ip}")
-                    log_security_event('unauthorized_access', {'action': 'delete', 'reason': 'no_auth'}, None, client_ip)
-                    logAccountOperation(client_ip, None, None, f"Unauthorized access: action=delete, reason=Token error or missing")
-                    return json_response(self, 401, {"ok": False, "error": "Unauthorized"})
-
-                rolePrivileges = RolePrivileges.get(auth["role"], {})
-                data = read_json(self) or {}
-                table = str(data.get("table") or "")
-                key = data.get("key", {})
-                
-                # Log delete request
-                app_logger.info(f"Delete request: user_id={auth.get('personId')}, role={auth.get('role')}, table={table}, ip={client_ip}")
-                logAccountOperation(client_ip, auth.get('personId'), auth.get('role'), f"Data delete request: table={table}")
-                
-                # Validate table name with whitelist
-                allowed_tables = ROLE_TABLES.get(auth["role"], [])
-                if not validate_table_name_whitelist(table, allowed_tables):
-                    app_logger.warning(f"Invalid table name in delete: user_id={auth.get('personId')}, role={auth.get('role')}, table={table}, ip={client_ip}")
-                    log_security_event('policy_violation', {'action': 'delete', 'resource': table, 'reason': 'invalid_table_name'}, auth.get('personId'), client_ip)
-                    logAccountOperation(client_ip, auth.get('personId'), auth.get('role'), f"Policy violation: action=delete, table={table}, reason=Invalid table name")
-                    return json_response(self, 400, {"ok": False, "error": "Invalid table name"})
-
-                 # check if the table is allowed for the role
-                if table not in allowed_tables:
-                    app_logger.warning(f"Access denied to table for delete: user_id={auth.get('personId')}, role={auth.get('role')}, table={table}, ip={client_ip}")
-                    log_policy_violation('delete', auth.get('role'), table, auth.get('personId'), client_ip)
-                    log_unauthorized_access('delete', auth.get('personId'), auth.get('role'), client_ip, table)
-                    logAccountOperation(client_ip, auth.get('personId'), auth.get('role'), f"Inappropriate access: action=delete, table={table}, reason=Access denied")
-                    return json_response(self, 403, {"error": "Forbidden"})
-
-                columnData = getTableColumns(table, role=auth.get('role'))
-                if not checkPrimaryKey(columnData, key):
-                    return json_response(self, 401, {"ok": False, "error": "Unauthorized"})
-
-                currentTableName = "target"
-                rangeJoins, rangeWhere, rangeParams = buildRangeFilter(auth, table, currentTableName)
-
-                params = []
-                primaryKey = next(iter(key))
-
-                parts = [f"DELETE {currentTableName} FROM `{table}` {currentTableName}"]
-                if rangeJoins:
-                    parts.append(" ".join(rangeJoins))
-
-                where_parts = [f"{currentTableName}.`{primaryKey}` = %s"]
-                params.append(key[primaryKey])
-
-                if rangeWhere:
-                    where_parts.append(rangeWhere)
-                    params.extend(rangeParams or [])
-
-                sql = " ".join(parts) + " WHERE " + " AND ".join(where_parts)
-
-                # Log data modification
-                logDataUpdate(auth["personId"], auth["role"], sql)
-                log_sql_execution('DELETE', table, auth.get('personId'), auth.get('role'), sql, client_ip, True)
-                log_audit_event('delete', {'table': table, 'key': key}, auth.get('personId'), auth.get('role'), client_ip, sql)
-
-                try:
-                    rows_affected = db_execute(sql, params, role=auth.get('role'))
-                    app_logger.info(f"Delete executed successfully: user_id={auth.get('personId')}, role={auth.get('role')}, table={table}, rows_affected={rows_affected}, ip={client_ip}")
-                    logAccountOperation(client_ip, auth.get('personId'), auth.get('role'), f"Data delete successful: table={table}, rows_affected={rows_affected}")
-                    return json_response(self, 200, {"ok": True, "deleted": key})
-                except Exception as e:
-                    # Log error details but don't expose to client
-                    app_logger.error(f"Delete error: user_id={auth.get('personId')}, role={auth.get('role')}, table={table}, error={e}, ip={client_ip}")
-                    log_sql_execution('DELETE', table, auth.get('personId'), auth.get('role'), sql, client_ip, False)
-                    logAccountOperation(client_ip, auth.get('personId'), auth.get('role'), f"Data delete failed: table={table}, error={str(e)}")
-                    import logging
-                    logging.error(f"Delete error: {str(e)}", exc_info=True)
-                    traceback.print_exc()  # Keep for development
-                    # Return generic error message
-                    return json_response(self, 500, {"ok": False, "error": "Server error occurred"})
-            elif path == "/data/insert":
-                # Get client IP address
-                client_ip = self.client_address[0] if hasattr(self, 'client_address') else self.headers.get('X-Forwarded-For', '').split(',')[0].strip() or 'unknown'
-                
-                auth = parse_bearer_role(self.headers)
-                if not auth:
-                    app_logger.warning(f"Unauthorized insert attempt: ip={client_ip}")
-                    log_security_event('unauthorized_access', {'action': 'insert', 'reason': 'no_auth'}, None, client_ip)
-                    logAccountOperation(client_ip, None, None, f"Unauthorized access: action=insert, reason=Token error or missing")
-                    return json_response(self, 401, {"ok": False, "error": "Unauthorized"})
-
-                rolePrivileges = RolePrivileges.get(auth["role"], {})
-                data = read_json(self) or {}
-                table = str(data.get("table") or "")
-                updateValues = data.get("insertValues", {})
-                params = []
-                
-                # Log insert request
-                app_logger.info(f"Insert request: user_id={auth.get('personId')}, role={auth.get('role')}, table={table}, ip={client_ip}")
-                logAccountOperation(client_ip, auth.get('personId'), auth.get('role'), f"Data insert request: table={table}")
-                
-                # Validate table name with whitelist
-                allowed_tables = ROLE_TABLES.get(auth["role"], [])
-                if not validate_table_name_whitelist(table, allowed_tables):
-                    app_logger.warning(f"Invalid table name in insert: user_id={auth.get('personId')}, role={auth.get('role')}, table={table}, ip={client_ip}")
-                    log_security_event('policy_violation', {'action': 'insert', 'resource': table, 'reason': 'invalid_table_name'}, auth.get('personId'), client_ip)
-                    logAccountOperation(client_ip, auth.get('personId'), auth.get('role'), f"Policy violation: action=insert, table={table}, reason=Invalid table name")
-                    return json_response(self, 400, {"ok": False, "error": "Invalid table name"})
-
-                # check if the table is allowed for the role
-                if table not in allowed_tables:
-                    app_logger.warning(f"Access denied to table for insert: user_id={auth.get('personId')}, role={auth.get('role')}, table={table}, ip={client_ip}")
-                    log_policy_violation('write', auth.get('role'), table, auth.get('personId'), client_ip)
-                    log_unauthorized_access('insert', auth.get('personId'), auth.get('role'), client_ip, table)
-                    logAccountOperation(client_ip, auth.get('personId'), auth.get('role'), f"Inappropriate access: action=insert, table={table}, reason=Access denied")
-                    return json_response(self, 403, {"error": "Forbidden"})
-                
-                columnData = getTableColumns(table, role=auth.get('role'))
-                
-                # Check if insert columns match allowed columns
-                allowed_insert_columns = rolePrivileges.get(table, {}).get("insert", [])
-                if set(updateValues.keys()) != set(allowed_insert_columns):
-                    return json_response(self, 401, {"ok": False, "error": "Unauthorized"})
-                
-                # Validate and escape column names
-                updateValueColumns = list(updateValues.keys())
-                for col in updateValueColumns:
-                    if not validate_column_name(col):
-                        return json_response(self, 400, {"ok": False, "error": f"Invalid column name: {col}"})
-                    escaped_col = escape_identifier(col)
-                    if not escaped_col:
-                        return json_response(self, 400, {"ok": False, "error": f"Invalid column name: {col}"})
-
-                # Build INSERT SQL with encryption support
-                ordered_columns = allowed_insert_columns
-                table_encrypted_columns = getEncryptedColumns(table)
-
-                columns_clause = []
-                value_fragments = []
-                params = []
-                encryption_key_value = None
-
-                for col in ordered_columns:
-                    columns_clause.append(f"`{col}`")
-                    val = updateValues[col]
-                    if col in table_encrypted_columns:
-                        if encryption_key_value is None:
-                            encryption_key_value = getEncryptionKey()
-                        value_fragments.append("AES_ENCRYPT(%s, %s)")
-                        params.append(val)
-                        params.append(encryption_key_value)
-                    else:
-                        value_fragments.append("%s")
-                        params.append(val)
-
-                columns_str = ', '.join(columns_clause)
-                placeholders = ', '.join(value_fragments)
-
-                sql = f"INSERT INTO `{table}` ({columns_str}) VALUES ({placeholders})"
-
-                # Log data modification
-                logDataUpdate(auth["personId"], auth["role"], sql)
-                log_sql_execution('INSERT', table, auth.get('personId'), auth.get('role'), sql, client_ip, True)
-                log_audit_event('insert', {'table': table, 'columns': updateValueColumns}, auth.get('personId'), auth.get('role'), client_ip, sql)
-
-                try:
-                    rows_affected = db_execute(sql, params, role=auth.get('role'))
-                    app_logger.info(f"Insert executed successfully: user_id={auth.get('personId')}, role={auth.get('role')}, table={table}, rows_affected={rows_affected}, ip={client_ip}")
-                    logAccountOperation(client_ip, auth.get('personId'), auth.get('role'), f"Data insert successful: table={table}, rows_affected={rows_affected}")
-                    return json_response(self, 200, {"ok": True, "insert": updateValueColumns})
-                except Exception as e:
-                    # Log error details but don't expose to client
-                    app_logger.error(f"Insert error: user_id={auth.get('personId')}, role={auth.get('role')}, table={table}, error={e}, ip={client_ip}")
-                    log_sql_execution('INSERT', table, auth.get('personId'), auth.get('role'), sql, client_ip, False)
-                    logAccountOperation(client_ip, auth.get('personId'), auth.get('role'), f"Data insert failed: table={table}, error={str(e)}")
-                    import logging
-                    logging.error(f"Insert error: {str(e)}", exc_info=True)
-                    traceback.print_exc()  # Keep for development
-                    # Return generic error message
-                    return json_response(self, 500, {"ok": False, "error": "Server error occurred"})
-
-            return json_response(self, 404, {"error": "Not found"})
-        except Exception as e:
-            # Log error details but don't expose to client
-            import logging
-            logging.error(f"POST request error: {str(e)}", exc_info=True)
-            traceback.print_exc()  # Keep for development
-            # Return generic error message
-            return json_response(self, 500, {"error": "Server error occurred"})
+        return router.dispatch(self, "POST")
 
     def log_message(self, format, *args):
         print("%s - - [%s] %s" % (self.address_string(),
             self.log_date_time_string(),
-            format % args))
\ No newline at end of file
+            format % args))
@@ -6,10 +6,12 @@ from typing import Optional, Dict
 from datetime import datetime
 from logger_config import app_logger, log_security_event
 from db_query import db_execute
+from metrics import timed
 
 # Audit log table name
 AUDIT_LOG_TABLE = 'audit_log'
 
+@timed('log_audit_event')
 def log_audit_event(event_type: str, details: Dict, user_id: Optional[str] = None,
                    user_role: Optional[str] = None, ip_address: Optional[str] = None,
                    sql: Optional[str] = None):
@@ -39,7 +41,9 @@ def log_audit_event(event_type: str, details: Dict, user_id: Optional[str] = Non
                 ip_address,
                 sql[:1000] if sql else None,  # Limit SQL length
                 str(details)[:500] if details else None,  # Limit details length
-            )
+            ),
+            pin_session=False,  # Audit rows are never read back by the session
+            bounded=False,  # Still record events of requests out of time
         )
         
         # Also log to file
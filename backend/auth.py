@@ -6,11 +6,14 @@ import hashlib
 import secrets
 import time
 import os
-import bcrypt
 from db_query import db_query
 from logger_config import app_logger, log_security_event
 from audit_logger import log_audit_event
 from logger import logAccountOperation
+from metrics import timed
+from crypto_pool import CRYPTO_POOL, CryptoPoolBusy
+from deadline import DeadlineExceeded, ClientDisconnected
+from session_tokens import is_signed_token, issue_token, validate_token, revoke_token
 
 # Session storage - supports both in-memory and database
 # Format: {token: {"user_id": str, "role": str, "name": str, "expires_at": float}}
@@ -22,6 +25,9 @@ SESSION_EXPIRY = 2 * 60 * 60
 # Use database for session storage if enabled
 USE_DB_SESSIONS = os.getenv('USE_DB_SESSIONS', 'false').lower() == 'true'
 
+# 'opaque' (random token + session store) or 'signed' (self-contained, see session_tokens.py)
+SESSION_TOKEN_MODE = os.getenv('SESSION_TOKEN_MODE', 'opaque')
+
 def hash_password(password, salt=None):
     """
     Hash password using bcrypt (more secure than SHA-256)
@@ -35,16 +41,23 @@ def hash_password(password, salt=None):
     """
     # Use bcrypt for password hashing
     # bcrypt automatically handles salt generation
+    import bcrypt  # imported on first use (see startup.py)
     password_bytes = password.encode('utf-8')
     hashed = bcrypt.hashpw(password_bytes, bcrypt.gensalt())
     return hashed.decode('utf-8')
 
+@timed('verify_password')
 def verify_password(password, salt, hashed_password):
     """
     Verify password against hashed password
     
-    Supports both bcrypt (new) and SHA-256 (legacy) for backward compatibility
+    Supports both bcrypt (new) and SHA-256 (legacy) for backward compatibility.
+    Runs on the bounded crypto pool (bcrypt is deliberately CPU heavy).
     """
+    return CRYPTO_POOL.run(_verify_password, password, salt, hashed_password)
+
+def _verify_password(password, salt, hashed_password):
+    import bcrypt
     password_bytes = password.encode('utf-8')
     
     # Try bcrypt first (new format)
@@ -194,6 +207,8 @@ def authenticate_user(email, password, ip_address=None):
         log_security_event('login_failed', {'email': email, 'reason': 'invalid_credentials'}, None, ip_address)
         logAccountOperation(ip_address or 'unknown', None, None, f"Login failed: email={email}, reason=Invalid email or password")
         return None
+    except (DeadlineExceeded, ClientDisconnected, CryptoPoolBusy):
+        raise  # Answered by the router (504, 499, 503), not a failed login
     except Exception as e:
         # Log authentication error
         app_logger.error(f"Authentication error: email={email}, error={e}, ip={ip_address}")
@@ -214,6 +229,12 @@ def create_session(user_info):
     Returns:
         session token string
     """
+    if SESSION_TOKEN_MODE == 'signed':
+        # Nothing to store: the token itself carries the session
+        token = issue_token(user_info["user_id"], user_info["role"], time.time() + SESSION_EXPIRY)
+        app_logger.info(f"Signed session created for user {user_info['user_id']} with role {user_info['role']}")
+        return token
+    
     token = generate_token()
     session_data = {
         "user_id": user_info["user_id"],
@@ -257,6 +278,16 @@ def validate_session(token):
     if not token:
         return None
     
+    if SESSION_TOKEN_MODE == 'signed' and is_signed_token(token):
+        payload = validate_token(token)
+        if not payload:
+            return None
+        return {
+            "user_id": payload["sub"],
+            "role": payload["role"],
+            "personId": payload["sub"]
+        }
+    
     # Try memory first
     session = ACTIVE_SESSIONS.get(token)
     
@@ -264,11 +295,11 @@ def validate_session(token):
     if not session and USE_DB_SESSIONS:
         try:
             # Use 'student' role as default for session queries (all roles have INSERT on sessions)
-            result = db_query(
-                "SELECT user_id, role, expires_at FROM sessions WHERE token = %s AND expires_at > NOW()",
-                (token,),
-                role='student'
-            )
+            session_sql = "SELECT user_id, role, expires_at FROM sessions WHERE token = %s AND expires_at > NOW()"
+            result = db_query(session_sql, (token,), role='student')
+            if not result:
+                # A replica may not have the session row yet (just logged in elsewhere)
+                result = db_query(session_sql, (token,), role='student', use_primary=True)
             if result and result[0]:
                 session = {
                     "user_id": result[0]["user_id"],
@@ -285,8 +316,7 @@ def validate_session(token):
     
     # Check expiration
     if time.time() > session["expires_at"]:
-        if token in ACTIVE_SESSIONS:
-            del ACTIVE_SESSIONS[token]
+        ACTIVE_SESSIONS.pop(token, None)
         if USE_DB_SESSIONS:
             try:
                 from db_query import db_execute
@@ -306,10 +336,14 @@ def logout(token):
     """
     Remove session token
     """
-    removed = False
-    if token in ACTIVE_SESSIONS:
-        del ACTIVE_SESSIONS[token]
-        removed = True
+    if SESSION_TOKEN_MODE == 'signed' and is_signed_token(token):
+        removed = revoke_token(token)
+        if removed:
+            app_logger.info(f"Signed session revoked: {token[-8:]}...")
+        return removed
+    
+    # pop() rather than check-then-delete: requests run on concurrent threads
+    removed = ACTIVE_SESSIONS.pop(token, None) is not None
     
     # Also remove from database if enabled
     if USE_DB_SESSIONS:
@@ -330,9 +364,9 @@ def cleanup_expired_sessions():
     """Remove expired sessions (call periodically)"""
     current_time = time.time()
     expired_tokens = [
-        token for token, session in ACTIVE_SESSIONS.items()
+        token for token, session in list(ACTIVE_SESSIONS.items())
         if current_time > session["expires_at"]
     ]
     for token in expired_tokens:
-        del ACTIVE_SESSIONS[token]
+        ACTIVE_SESSIONS.pop(token, None)
 
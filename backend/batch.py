@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Request batching (POST /batch)
+
+Several API calls in one HTTPS round trip, with the session validated once:
+
+    {"requests": [{"method": "GET", "path": "/retrieveTablesColumns"},
+                  {"method": "POST", "path": "/performQuery", "body": {...}}]}
+
+returns 200 with one result per sub-request, in request order:
+
+    {"results": [{"status": 200, "body": {...}}, {"status": 403, "body": {...}}]}
+
+Routes opt in with batch='read' or batch='write' (router.Route). Consecutive
+reads run concurrently on BATCH_WORKERS threads, so each takes its own
+pooled connection. A write waits for everything before it and finishes
+before anything after it starts, so a query placed after an update sees
+the update. Each sub-request runs its route's admission, audit and table
+checks and gets its route's deadline, capped by the batch's.
+"""
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from deadline import ClientDisconnected
+from logger_config import app_logger
+
+# Most sub-requests accepted in one batch
+BATCH_MAX_REQUESTS = int(os.getenv('BATCH_MAX_REQUESTS', '16'))
+
+# Threads running batched reads (shared by all batches of the process)
+BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', '8'))
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=max(1, BATCH_WORKERS), thread_name_prefix='batch')
+    return _executor
+
+
+def _item_error(status: int, message: str) -> Dict:
+    return {"status": status, "body": {"error": message}}
+
+
+def _resolve(router, item) -> Tuple[Optional[object], Optional[Dict], Optional[Dict]]:
+    """(route, body, None) for a valid sub-request, else (None, None, error result)"""
+    if not isinstance(item, dict) or not isinstance(item.get("path"), str):
+        return None, None, _item_error(400, "Each request needs a path")
+    method = str(item.get("method") or "POST").upper()
+    route = router.resolve(method, "/" + item["path"].lstrip("/"))
+    if route is None:
+        return None, None, _item_error(404, "Not found")
+    if not route.batch:
+        return None, None, _item_error(400, "Route cannot be batched")
+    body = item.get("body") or {}
+    if not isinstance(body, dict):
+        return None, None, _item_error(400, "body must be an object")
+    if route.max_body is not None and len(json.dumps(body, default=str)) > route.max_body:
+        return None, None, _item_error(413, "Request body too large")
+    return route, body, None
+
+
+def _groups(jobs: List[Tuple]) -> List[List[Tuple]]:
+    """Runs of consecutive reads; every write is a group of its own"""
+    groups: List[List[Tuple]] = []
+    for job in jobs:
+        route = job[1]
+        if route.batch == 'read' and groups and groups[-1][0][1].batch == 'read':
+            groups[-1].append(job)
+        else:
+            groups.append([job])
+    return groups
+
+
+def run_batch(router, ctx) -> Tuple[int, Dict]:
+    """
+    Serve the sub-requests of a /batch request
+
+    Returns:
+        (status, body) of the batch response
+    """
+    items = ctx.data.get("requests")
+    if not isinstance(items, list) or not items:
+        return 400, {"error": "requests must be a non-empty list"}
+    if len(items) > BATCH_MAX_REQUESTS:
+        return 400, {"error": f"At most {BATCH_MAX_REQUESTS} requests per batch"}
+
+    results: List[Optional[Dict]] = [None] * len(items)
+    jobs = []
+    for index, item in enumerate(items):
+        route, body, error = _resolve(router, item)
+        if error is not None:
+            results[index] = error
+        else:
+            jobs.append((index, route, body))
+    app_logger.info(f"Batch request: user_id={ctx.user_id}, role={ctx.role}, requests={len(items)}, ip={ctx.client_ip}")
+
+    for group in _groups(jobs):
+        if len(group) == 1:
+            index, route, body = group[0]
+            done = [(index, router.run_subrequest(ctx, route, body))]
+        else:
+            executor = _get_executor()
+            futures = [(index, executor.submit(router.run_subrequest, ctx, route, body))
+                       for index, route, body in group]
+            done = [(index, future.result()) for index, future in futures]
+        for index, sub in done:
+            if sub.status == 499:
+                raise ClientDisconnected(f"Client of {ctx.route.name} went away")
+            result = {"status": sub.status or 500, "body": sub.body}
+            if sub.response_headers:
+                result["headers"] = sub.response_headers
+            results[index] = result
+    return 200, {"results": results}
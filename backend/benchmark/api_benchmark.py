@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""
+API Benchmark Suite
+Drive scripted workloads against the API server and report throughput and
+latency percentiles. Results can be written as JSON and compared across runs.
+
+Usage:
+    python api_benchmark.py --workloads login_storm,query_mix --requests 500 \
+        --concurrency 20 --output run.json
+    python api_benchmark.py --compare baseline.json --output run.json
+
+A disposable database is available through the docker-compose "bench"
+profile in percona-compose/ (listens on port 3307). Start the server with
+LOGIN_THROTTLE_ENABLED=0: every login comes from one address, so the login
+throttle would otherwise answer 429 after a few dozen attempts.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Disable SSL warnings (using self-signed certificate)
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+# Target URL for testing
+BASE_URL = os.getenv("BENCH_BASE_URL", "https://127.0.0.1:8000")
+
+# Default load shape
+DEFAULT_REQUESTS = 200
+DEFAULT_CONCURRENCY = 10
+
+# Test accounts from TEST_USERS.md
+TEST_USERS = {
+    "student": ("test_student@example.com", "StudentTest123"),
+    "guardian": ("test_guardian@example.com", "GuardianTest123"),
+    "aro": ("test_staff@example.com", "StaffTest123"),
+}
+
+# Rows touched by the batch_writes workload (grades seeded by University.sql)
+WRITE_GRADE_IDS = [3001, 3002, 3003, 3004, 3005]
+
+_local = threading.local()
+
+
+def create_session() -> requests.Session:
+    """Create a keep-alive session without retries (retries would skew latency)"""
+    session = requests.Session()
+    session.verify = False
+    adapter = HTTPAdapter(max_retries=0, pool_connections=1, pool_maxsize=1)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def thread_session() -> requests.Session:
+    """One HTTP session per worker thread"""
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = _local.session = create_session()
+    return session
+
+
+def login(session: requests.Session, role: str) -> str:
+    """Log in as the test user for a role and return the bearer token"""
+    email, password = TEST_USERS[role]
+    response = session.post(f"{BASE_URL}/auth/login",
+                            json={"email": email, "password": password}, timeout=10)
+    data = response.json()
+    if response.status_code != 200 or not data.get("token"):
+        raise RuntimeError(f"Login failed for {role}: {response.status_code} {data}")
+    return data["token"]
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Recorder:
+    """Thread-safe latency and status collector"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies: List[float] = []
+        self.statuses: Dict[str, int] = {}
+        self.errors = 0
+
+    def record(self, latency: float, status: Optional[int], ok: bool) -> None:
+        with self._lock:
+            self.latencies.append(latency)
+            key = str(status) if status is not None else "exception"
+            self.statuses[key] = self.statuses.get(key, 0) + 1
+            if not ok:
+                self.errors += 1
+
+    def summary(self, wall_time: float) -> Dict:
+        values = sorted(self.latencies)
+        count = len(values)
+        to_ms = lambda s: round(s * 1000.0, 3)
+        return {
+            "requests": count,
+            "errors": self.errors,
+            "duration_s": round(wall_time, 3),
+            "throughput_rps": round(count / wall_time, 2) if wall_time > 0 else 0.0,
+            "latency_ms": {
+                "min": to_ms(values[0]) if values else 0.0,
+                "mean": to_ms(sum(values) / count) if values else 0.0,
+                "p50": to_ms(percentile(values, 50)),
+                "p95": to_ms(percentile(values, 95)),
+                "p99": to_ms(percentile(values, 99)),
+                "max": to_ms(values[-1]) if values else 0.0,
+            },
+            "status_codes": dict(sorted(self.statuses.items())),
+        }
+
+
+def run_load(operation: Callable[[int], Tuple[Optional[int], bool]],
+             total: int, concurrency: int) -> Dict:
+    """
+    Run an operation `total` times across `concurrency` worker threads
+
+    Args:
+        operation: Callable taking the request index and returning (status, ok)
+        total: Number of requests to issue
+        concurrency: Number of worker threads
+    """
+    recorder = Recorder()
+
+    def worker(i: int):
+        start = time.perf_counter()
+        try:
+            status, ok = operation(i)
+        except Exception:
+            status, ok = None, False
+        recorder.record(time.perf_counter() - start, status, ok)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, range(total)))
+    return recorder.summary(time.perf_counter() - started)
+
+
+# =========================
+# Workloads
+# =========================
+
+def workload_login_storm(total: int, concurrency: int) -> Dict:
+    """Concurrent logins across all test accounts (about 10% wrong passwords)"""
+    roles = list(TEST_USERS)
+
+    def operation(i: int):
+        email, password = TEST_USERS[roles[i % len(roles)]]
+        wrong = i % 10 == 9
+        response = thread_session().post(
+            f"{BASE_URL}/auth/login",
+            json={"email": email, "password": password + "x" if wrong else password},
+            timeout=10,
+        )
+        expected = 401 if wrong else 200
+        return response.status_code, response.status_code == expected
+
+    return run_load(operation, total, concurrency)
+
+
+def workload_query_mix(total: int, concurrency: int) -> Dict:
+    """/performQuery reads spread across every role and its visible tables"""
+    setup = create_session()
+    targets = []
+    for role in TEST_USERS:
+        token = login(setup, role)
+        response = setup.get(f"{BASE_URL}/retrieveTablesColumns",
+                             headers={"Authorization": f"Bearer {token}"}, timeout=10)
+        for table in response.json().get("tables", []):
+            targets.append((token, table))
+    setup.close()
+    if not targets:
+        raise RuntimeError("No readable tables returned for any test user")
+
+    def operation(i: int):
+        token, table = targets[i % len(targets)]
+        response = thread_session().post(
+            f"{BASE_URL}/performQuery",
+            headers={"Authorization": f"Bearer {token}"},
+            json={"currentTable": table, "limit": random.choice([20, 100, 500]), "offset": 0},
+            timeout=10,
+        )
+        return response.status_code, response.status_code == 200
+
+    return run_load(operation, total, concurrency)
+
+
+def workload_batch_writes(total: int, concurrency: int) -> Dict:
+    """/data/update on seeded grades as the ARO test user; originals are restored"""
+    setup = create_session()
+    token = login(setup, "aro")
+    headers = {"Authorization": f"Bearer {token}"}
+    response = setup.post(f"{BASE_URL}/performQuery", headers=headers,
+                          json={"currentTable": "grades", "limit": 500}, timeout=10)
+    originals = {row["GradeID"]: row.get("comments")
+                 for row in response.json().get("results", [])
+                 if row.get("GradeID") in WRITE_GRADE_IDS}
+    if not originals:
+        raise RuntimeError("Seeded grades rows not found; is the bench database loaded?")
+    grade_ids = sorted(originals)
+
+    def operation(i: int):
+        response = thread_session().post(
+            f"{BASE_URL}/data/update",
+            headers=headers,
+            json={
+                "table": "grades",
+                "key": {"GradeID": grade_ids[i % len(grade_ids)]},
+                "updateValues": {"comments": f"benchmark write {i}"},
+            },
+            timeout=10,
+        )
+        return response.status_code, response.status_code == 200
+
+    try:
+        return run_load(operation, total, concurrency)
+    finally:
+        for grade_id, comments in originals.items():
+            setup.post(f"{BASE_URL}/data/update", headers=headers,
+                       json={"table": "grades", "key": {"GradeID": grade_id},
+                             "updateValues": {"comments": comments}}, timeout=10)
+        setup.close()
+
+
+def workload_session_validation(total: int, concurrency: int) -> Dict:
+    """Authenticated metadata reads; every request validates a bearer token"""
+    setup = create_session()
+    tokens = [login(setup, role) for role in TEST_USERS]
+    setup.close()
+
+    def operation(i: int):
+        response = thread_session().get(
+            f"{BASE_URL}/retrieveTablesColumns",
+            headers={"Authorization": f"Bearer {tokens[i % len(tokens)]}"},
+            timeout=10,
+        )
+        return response.status_code, response.status_code == 200
+
+    return run_load(operation, total, concurrency)
+
+
+WORKLOADS = {
+    "login_storm": workload_login_storm,
+    "query_mix": workload_query_mix,
+    "batch_writes": workload_batch_writes,
+    "session_validation": workload_session_validation,
+}
+
+
+# =========================
+# Reporting
+# =========================
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def print_summary(name: str, result: Dict) -> None:
+    lat = result["latency_ms"]
+    print(f"\n[{name}]")
+    print(f"  - Requests: {result['requests']} (errors: {result['errors']})")
+    print(f"  - Throughput: {result['throughput_rps']:.2f} req/s")
+    print(f"  - Latency ms: p50={lat['p50']:.2f} p95={lat['p95']:.2f} p99={lat['p99']:.2f} max={lat['max']:.2f}")
+    print(f"  - Status codes: {result['status_codes']}")
+    if "429" in result["status_codes"]:
+        print("  ! 429 responses: start the server with LOGIN_THROTTLE_ENABLED=0 for benchmarks")
+
+
+def print_comparison(baseline: Dict, current: Dict) -> None:
+    """Print throughput / latency deltas against a previous JSON report"""
+    base_meta = baseline.get("meta", {})
+    print(f"\n[Comparison] baseline={base_meta.get('git_commit')} ({base_meta.get('label')}) "
+          f"-> current={current['meta'].get('git_commit')} ({current['meta'].get('label')})")
+    for name, result in current["workloads"].items():
+        before = baseline.get("workloads", {}).get(name)
+        if not before or "error" in before or "error" in result:
+            continue
+
+        def delta(new, old):
+            return f"{((new - old) / old * 100.0):+.1f}%" if old else "n/a"
+
+        print(f"  {name}: throughput {before['throughput_rps']:.2f} -> {result['throughput_rps']:.2f} "
+              f"({delta(result['throughput_rps'], before['throughput_rps'])}), "
+              f"p95 {before['latency_ms']['p95']:.2f} -> {result['latency_ms']['p95']:.2f} ms "
+              f"({delta(result['latency_ms']['p95'], before['latency_ms']['p95'])}), "
+              f"p99 {before['latency_ms']['p99']:.2f} -> {result['latency_ms']['p99']:.2f} ms "
+              f"({delta(result['latency_ms']['p99'], before['latency_ms']['p99'])})")
+
+
+def main(argv=None) -> int:
+    global BASE_URL
+    parser = argparse.ArgumentParser(description="Benchmark the University Data API")
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--workloads", default=",".join(WORKLOADS),
+                        help=f"Comma separated subset of: {', '.join(WORKLOADS)}")
+    parser.add_argument("--requests", type=int, default=DEFAULT_REQUESTS, help="Requests per workload")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--label", default="", help="Free-form label stored in the report")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument("--compare", help="Previous JSON report to compare against")
+    args = parser.parse_args(argv)
+
+    BASE_URL = args.base_url.rstrip("/")
+    names = [n.strip() for n in args.workloads.split(",") if n.strip()]
+    unknown = [n for n in names if n not in WORKLOADS]
+    if unknown:
+        parser.error(f"Unknown workload(s): {', '.join(unknown)}")
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git_commit": git_commit(),
+            "label": args.label,
+            "base_url": BASE_URL,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "python": platform.python_version(),
+        },
+        "workloads": {},
+    }
+
+    print(f"[Benchmark] Target: {BASE_URL}, {args.requests} requests x {args.concurrency} workers")
+    for name in names:
+        try:
+            result = WORKLOADS[name](args.requests, args.concurrency)
+            print_summary(name, result)
+        except Exception as e:
+            print(f"\n[{name}] setup failed: {e}")
+            result = {"error": str(e)}
+        report["workloads"][name] = result
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n[Benchmark] Report written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print_comparison(json.load(f), report)
+
+    return 1 if any("error" in r for r in report["workloads"].values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Column Encryption Benchmark
+Compare decrypt throughput of the two encryption engines over a result set:
+
+  sql  - SELECT AES_DECRYPT(col, key) ... (MySQL decrypts, current default)
+  app  - SELECT col ... then AES-GCM batch decrypt in Python (column_crypto)
+
+The local measurements need no database. With --db, the same number of values
+is also round-tripped through MySQL, comparing server-side AES_DECRYPT with
+fetching raw ciphertext and decrypting it in the API process.
+
+Usage:
+    python crypto_benchmark.py --rows 10000
+    python crypto_benchmark.py --rows 10000 --db --role aro --output crypto.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Callable, Dict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from column_crypto import decrypt_rows, get_cipher  # noqa: E402
+
+BENCH_KEY = os.getenv("BENCH_ENCRYPTION_KEY", "benchmark-only-key-not-for-production")
+BENCH_KEY_ID = "bench"
+
+# Sample values shaped like the encrypted columns (phone / Id_No / address)
+SAMPLES = {
+    "phone": "91234567",
+    "Id_No": "A1234567",
+    "address": "Flat 12B, 88 Example Road, Kowloon, Hong Kong",
+}
+
+
+def timed(fn: Callable[[], int], repeat: int) -> Dict:
+    """Run fn `repeat` times and report the best rows/s"""
+    best = None
+    rows = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return {"rows": rows, "seconds": round(best, 6), "rows_per_sec": round(rows / best, 1) if best else 0.0}
+
+
+def bench_local(rows: int, repeat: int) -> Dict:
+    cipher = get_cipher(BENCH_KEY, BENCH_KEY_ID)
+    gcm_rows = [{c: cipher.encrypt("students", c, v) for c, v in SAMPLES.items()} for _ in range(rows)]
+    ecb_rows = [{c: cipher.encrypt_legacy(v) for c, v in SAMPLES.items()} for _ in range(rows)]
+
+    def run(source):
+        def fn():
+            copy = [dict(r) for r in source]
+            decrypt_rows("students", copy, SAMPLES.keys(), [cipher])
+            return len(copy)
+        return fn
+
+    def encrypt():
+        for _ in range(rows):
+            for c, v in SAMPLES.items():
+                cipher.encrypt("students", c, v)
+        return rows
+
+    return {
+        "app_gcm_decrypt": timed(run(gcm_rows), repeat),
+        "app_legacy_ecb_decrypt": timed(run(ecb_rows), repeat),
+        "app_gcm_encrypt": timed(encrypt, repeat),
+    }
+
+
+def bench_db(rows: int, repeat: int, role: str) -> Dict:
+    """Decrypt `rows` generated values in MySQL vs. locally"""
+    from db_connector import get_db_connection
+
+    cipher = get_cipher(BENCH_KEY, BENCH_KEY_ID)
+    column = "address"
+    plaintext = SAMPLES[column]
+    seq = ("WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < %s) ")
+    conn = get_db_connection(role)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SET SESSION cte_max_recursion_depth = %s", (rows + 1,))
+
+        def sql_engine():
+            with conn.cursor() as cur:
+                cur.execute(seq + "SELECT CONVERT(AES_DECRYPT(AES_ENCRYPT(CONCAT(%s, n), %s), %s) USING utf8mb4) AS v FROM seq",
+                            (rows, plaintext, BENCH_KEY, BENCH_KEY))
+                return len(cur.fetchall())
+
+        def app_engine():
+            # Same server-side generation, but ciphertext is decrypted here
+            with conn.cursor() as cur:
+                cur.execute(seq + f"SELECT AES_ENCRYPT(CONCAT(%s, n), %s) AS `{column}` FROM seq",
+                            (rows, plaintext, BENCH_KEY))
+                result = cur.fetchall()
+            decrypt_rows("students", result, [column], [cipher])
+            return len(result)
+
+        def baseline():
+            # Generation + transfer cost alone, to isolate the decrypt step
+            with conn.cursor() as cur:
+                cur.execute(seq + "SELECT AES_ENCRYPT(CONCAT(%s, n), %s) AS v FROM seq", (rows, plaintext, BENCH_KEY))
+                return len(cur.fetchall())
+
+        sanity = [{column: cipher.encrypt_legacy(plaintext)}]
+        decrypt_rows("students", sanity, [column], [cipher])
+        if sanity[0][column] != plaintext:
+            raise RuntimeError("Local AES_ENCRYPT compatibility check failed")
+
+        return {
+            "fetch_ciphertext_only": timed(baseline, repeat),
+            "sql_aes_decrypt": timed(sql_engine, repeat),
+            "app_decrypt_after_fetch": timed(app_engine, repeat),
+        }
+    finally:
+        conn.close()
+
+
+def print_results(title: str, results: Dict) -> None:
+    print(f"\n[{title}]")
+    for name, r in results.items():
+        print(f"  - {name}: {r['rows']} rows in {r['seconds'] * 1000:.2f} ms ({r['rows_per_sec']:.0f} rows/s)")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark SQL vs application-side column decryption")
+    parser.add_argument("--rows", type=int, default=10000, help="Rows per measurement")
+    parser.add_argument("--repeat", type=int, default=5, help="Repetitions (best run is reported)")
+    parser.add_argument("--db", action="store_true", help="Also measure against MySQL")
+    parser.add_argument("--role", default="aro", help="DB role used for --db")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    report = {"meta": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "rows": args.rows, "repeat": args.repeat}}
+    report["local"] = bench_local(args.rows, args.repeat)
+    print_results("Local", report["local"])
+
+    if args.db:
+        try:
+            report["db"] = bench_db(args.rows, args.repeat, args.role)
+            print_results("Database", report["db"])
+        except Exception as e:
+            print(f"\n[Database] benchmark failed: {e}")
+            report["db"] = {"error": str(e)}
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n[Benchmark] Report written to {args.output}")
+    return 1 if "error" in report.get("db", {}) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Prepared Statement Benchmark
+Compare the two ways a pooled connection can run the hottest statements:
+
+  text      - cursor.execute(): the statement text is parsed and optimized
+              by MySQL on every call (DB_PREPARED_STATEMENTS=0)
+  prepared  - COM_STMT_PREPARE once, then COM_STMT_EXECUTE with binary
+              parameters (prepared_statements.py, DB_PREPARED_STATEMENTS=1)
+
+Paths measured:
+  login  - the student login lookup (LOWER(email) = %s) as auth_user
+  audit  - the audit_log INSERT of log_audit_event, inside a transaction that
+           is rolled back, so no audit rows are left behind
+
+Both engines run on one already-open connection, so the difference is the
+per-statement parse/plan and protocol cost, not connection setup.
+
+Usage:
+    python statement_benchmark.py --iterations 2000
+    python statement_benchmark.py --paths login --email alice@example.com --output stmt.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Callable, Dict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audit_logger import AUDIT_LOG_TABLE  # noqa: E402
+from db_connector import get_db_connection  # noqa: E402
+from prepared_statements import StatementCache, execute  # noqa: E402
+
+LOGIN_SQL = "SELECT StuID, password, salt, first_name, last_name FROM students WHERE LOWER(email) = %s"
+AUDIT_SQL = (f"INSERT INTO {AUDIT_LOG_TABLE} "
+             "(event_type, user_id, user_role, ip_address, sql_statement, details, timestamp) "
+             "VALUES (%s, %s, %s, %s, %s, %s, NOW())")
+AUDIT_PARAMS = ("benchmark", "S0000", "student", "127.0.0.1", None, "{'source': 'statement_benchmark'}")
+
+
+def timed(fn: Callable[[], None], iterations: int, repeat: int) -> Dict:
+    """Run fn `iterations` times per round and report the best round"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return {"statements": iterations, "seconds": round(best, 6),
+            "us_per_statement": round(best / iterations * 1e6, 1) if iterations else 0.0}
+
+
+def stmt_status(conn) -> Dict[str, int]:
+    """Session counters of prepared statement commands"""
+    with conn.cursor() as cur:
+        cur.execute("SHOW SESSION STATUS LIKE 'Com_stmt_%'")
+        return {row["Variable_name"]: int(row["Value"]) for row in cur.fetchall()}
+
+
+def bench_path(role: str, sql: str, params, iterations: int, repeat: int, rollback: bool) -> Dict:
+    conn = get_db_connection(role)
+    try:
+        if rollback:
+            conn.begin()
+
+        def text():
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+                cur.fetchall()
+
+        cache = StatementCache()
+        stmt = cache.get(conn, sql)
+        if stmt is None:
+            raise RuntimeError("MySQL refused to prepare the statement")
+
+        def prepared():
+            execute(conn, stmt, params)
+
+        # Warm up both paths (plan caches, buffer pool)
+        text()
+        prepared()
+        before = stmt_status(conn)
+        results = {"text": timed(text, iterations, repeat), "prepared": timed(prepared, iterations, repeat)}
+        after = stmt_status(conn)
+        results["com_stmt"] = {k: after[k] - before.get(k, 0) for k in after if after[k] != before.get(k, 0)}
+        saved = results["text"]["us_per_statement"] - results["prepared"]["us_per_statement"]
+        results["saved_us_per_statement"] = round(saved, 1)
+        if rollback:
+            conn.rollback()
+        return results
+    finally:
+        conn.close()
+
+
+def print_results(title: str, results: Dict) -> None:
+    print(f"\n[{title}]")
+    for name in ("text", "prepared"):
+        r = results[name]
+        print(f"  - {name}: {r['statements']} statements in {r['seconds'] * 1000:.2f} ms "
+              f"({r['us_per_statement']:.1f} us/statement)")
+    print(f"  - saved: {results['saved_us_per_statement']:.1f} us/statement")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark text vs prepared statements on the login and audit paths")
+    parser.add_argument("--iterations", type=int, default=2000, help="Statements per round")
+    parser.add_argument("--repeat", type=int, default=3, help="Rounds (best round is reported)")
+    parser.add_argument("--paths", nargs="+", choices=["login", "audit"], default=["login", "audit"])
+    parser.add_argument("--email", default="benchmark@example.com", help="Email looked up on the login path")
+    parser.add_argument("--audit-role", default="student", help="DB role used for the audit INSERT")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    report = {"meta": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                       "iterations": args.iterations, "repeat": args.repeat}}
+    paths = {
+        "login": ("auth", LOGIN_SQL, (args.email.strip().lower(),), False),
+        "audit": (args.audit_role, AUDIT_SQL, AUDIT_PARAMS, True),
+    }
+    failed = False
+    for name in args.paths:
+        role, sql, params, rollback = paths[name]
+        try:
+            report[name] = bench_path(role, sql, params, args.iterations, args.repeat, rollback)
+            print_results(f"{name} ({role})", report[name])
+        except Exception as e:
+            print(f"\n[{name}] benchmark failed: {e}")
+            report[name] = {"error": str(e)}
+            failed = True
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n[Benchmark] Report written to {args.output}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Application-side column encryption engine
+
+Encrypts ENCRYPTED_COLUMNS values in the API process with AES-256-GCM instead
+of pushing AES_ENCRYPT/AES_DECRYPT (and the key) into every SQL statement.
+Enabled with ENCRYPTION_ENGINE=app; the default remains the SQL engine.
+
+Ciphertext formats:
+    v1: b"AG" | 0x01 | nonce (12 bytes) | ciphertext | GCM tag (16 bytes)
+    v2: b"AG" | 0x02 | key id length (1 byte) | key id | nonce | ciphertext | tag
+
+v2 records the keyring key id (key_provider.py), so a reader picks the right
+key directly during a rotation. v1 values are still read.
+
+The column's "table.column" name is bound as associated data, so a value
+cannot be copied into another column and still decrypt. Values without the
+header are legacy MySQL AES_ENCRYPT output (aes-128-ecb, the server default).
+They are decrypted locally with MySQL's key folding, so existing rows stay
+readable before re-encryption.
+"""
+import hashlib
+import hmac
+import os
+from typing import Dict, Iterable, List, Optional
+
+from cryptography.hazmat.primitives import padding as sym_padding
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.exceptions import InvalidTag
+
+FORMAT_PREFIX = b"AG"
+FORMAT_VERSION = 1
+FORMAT_VERSION_KEY_ID = 2
+NONCE_SIZE = 12
+TAG_SIZE = 16
+HEADER_SIZE = len(FORMAT_PREFIX) + 1
+
+# Context string for deriving the GCM data key from DATA_ENCRYPTION_KEY
+_GCM_KEY_INFO = b"ComputingU column-gcm v1"
+
+
+def derive_gcm_key(master_key: str) -> bytes:
+    """Derive the 256-bit AES-GCM column key from the configured master key"""
+    # HKDF-Extract + single-block Expand (RFC 5869) with SHA-256
+    prk = hmac.new(b"ComputingU", master_key.encode('utf-8'), hashlib.sha256).digest()
+    return hmac.new(prk, _GCM_KEY_INFO + b"\x01", hashlib.sha256).digest()
+
+
+def mysql_fold_key(master_key: str) -> bytes:
+    """Reproduce MySQL's AES_ENCRYPT key folding for aes-128 modes"""
+    folded = bytearray(16)
+    for i, b in enumerate(master_key.encode('utf-8')):
+        folded[i % 16] ^= b
+    return bytes(folded)
+
+
+class ColumnCipher:
+    """Encrypts and decrypts column values for one master key"""
+
+    def __init__(self, master_key: str, key_id: Optional[str] = None):
+        self._aead = AESGCM(derive_gcm_key(master_key))
+        self._legacy_key = mysql_fold_key(master_key)
+        self.key_id = key_id
+        self._header = FORMAT_PREFIX + bytes([FORMAT_VERSION])
+        if key_id:
+            kid = key_id.encode('utf-8')
+            self._header = FORMAT_PREFIX + bytes([FORMAT_VERSION_KEY_ID, len(kid)]) + kid
+
+    # ---- AES-GCM (format v1 / v2) ----
+
+    def encrypt(self, table: str, column: str, value) -> Optional[bytes]:
+        if value is None:
+            return None
+        data = value if isinstance(value, bytes) else str(value).encode('utf-8')
+        nonce = os.urandom(NONCE_SIZE)
+        aad = f"{table}.{column}".encode('utf-8')
+        return self._header + nonce + self._aead.encrypt(nonce, data, aad)
+
+    def decrypt(self, table: str, column: str, blob) -> Optional[bytes]:
+        """Decrypt a stored value; returns None if it cannot be decrypted"""
+        if blob is None:
+            return None
+        blob = bytes(blob)
+        body = envelope_body(blob, self.key_id)
+        if body is not None:
+            try:
+                return self._aead.decrypt(body[:NONCE_SIZE], body[NONCE_SIZE:],
+                                          f"{table}.{column}".encode('utf-8'))
+            except InvalidTag:
+                pass  # Other key, or legacy ciphertext that happens to start with the header
+        return self.decrypt_legacy(blob)
+
+    # ---- MySQL AES_ENCRYPT compatible (aes-128-ecb, PKCS#7) ----
+
+    def encrypt_legacy(self, value) -> bytes:
+        data = value if isinstance(value, bytes) else str(value).encode('utf-8')
+        padder = sym_padding.PKCS7(128).padder()
+        padded = padder.update(data) + padder.finalize()
+        encryptor = Cipher(algorithms.AES(self._legacy_key), modes.ECB()).encryptor()
+        return encryptor.update(padded) + encryptor.finalize()
+
+    def decrypt_legacy(self, blob: bytes) -> Optional[bytes]:
+        if not blob or len(blob) % 16:
+            return None
+        decryptor = Cipher(algorithms.AES(self._legacy_key), modes.ECB()).decryptor()
+        padded = decryptor.update(blob) + decryptor.finalize()
+        try:
+            unpadder = sym_padding.PKCS7(128).unpadder()
+            return unpadder.update(padded) + unpadder.finalize()
+        except ValueError:
+            return None  # Wrong key, like AES_DECRYPT returning NULL
+
+
+def is_envelope(blob: bytes) -> bool:
+    return (len(blob) >= HEADER_SIZE + NONCE_SIZE + TAG_SIZE and blob[:2] == FORMAT_PREFIX
+            and blob[2] in (FORMAT_VERSION, FORMAT_VERSION_KEY_ID))
+
+
+def envelope_key_id(blob: bytes) -> Optional[str]:
+    """Key id recorded in a v2 value, or None"""
+    if is_envelope(blob) and blob[2] == FORMAT_VERSION_KEY_ID:
+        return blob[4:4 + blob[3]].decode('utf-8', errors='replace')
+    return None
+
+
+def envelope_body(blob: bytes, key_id: Optional[str]) -> Optional[bytes]:
+    """
+    nonce | ciphertext | tag of an AES-GCM value, or None if the value is not
+    in envelope format or was written under a different key id
+    """
+    if not is_envelope(blob):
+        return None
+    if blob[2] == FORMAT_VERSION:
+        return blob[HEADER_SIZE:]
+    start = 4 + blob[3]
+    if key_id is not None and blob[4:start] != key_id.encode('utf-8'):
+        return None
+    body = blob[start:]
+    return body if len(body) >= NONCE_SIZE + TAG_SIZE else None
+
+
+_ciphers: Dict[tuple, ColumnCipher] = {}
+
+
+def get_cipher(master_key: str, key_id: Optional[str] = None) -> ColumnCipher:
+    """Cipher objects are cached per master key (key schedule is not free)"""
+    cache_key = (master_key, key_id)
+    cipher = _ciphers.get(cache_key)
+    if cipher is None:
+        cipher = _ciphers[cache_key] = ColumnCipher(master_key, key_id)
+    return cipher
+
+
+def _to_text(data: Optional[bytes]) -> Optional[str]:
+    if data is None:
+        return None
+    return data.decode('utf-8', errors='replace')
+
+
+def _decode_strict(data: Optional[bytes]) -> Optional[str]:
+    # A wrong-key ECB decrypt can pass the padding check by chance; garbage
+    # is almost never valid UTF-8, so treat it as a failed decrypt
+    if data is None:
+        return None
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+
+
+def decrypt_text(table: str, column: str, blob, ciphers: List[ColumnCipher]) -> Optional[str]:
+    """Decrypt with the first cipher that yields valid text"""
+    for cipher in ciphers:
+        text = _decode_strict(cipher.decrypt(table, column, blob))
+        if text is not None:
+            return text
+    return None
+
+
+def decrypt_rows(table: str, rows: List[Dict], columns: Iterable[str], ciphers: List[ColumnCipher]) -> List[Dict]:
+    """
+    Decrypt encrypted columns across a whole result set in place
+
+    Works column by column with cached ciphers, so per-value cost is a
+    single AEAD call with no per-row setup or DB round trip.
+
+    Args:
+        table: Table the rows come from
+        rows: Result rows (dicts), modified in place
+        columns: Encrypted column names present in the rows
+        ciphers: Ciphers for the keyring keys, active key first; older keys
+            are only tried while a key rotation is in progress
+
+    Returns:
+        The same list of rows
+    """
+    for column in columns:
+        if len(ciphers) > 1:
+            for row in rows:
+                value = row.get(column)
+                if isinstance(value, (bytes, bytearray)):
+                    row[column] = decrypt_text(table, column, value, ciphers)
+            continue
+        decrypt = ciphers[0].decrypt
+        for row in rows:
+            value = row.get(column)
+            if isinstance(value, (bytes, bytearray)):
+                row[column] = _to_text(decrypt(table, column, value))
+    return rows
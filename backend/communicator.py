@@ -2,10 +2,17 @@
 import json
 # Security enhancements
 from security import get_allowed_origins, is_origin_allowed
+from metrics import span
+
+
+class RequestBodyTooLarge(ValueError):
+    """Content-Length is over the route's limit (answered with 413)"""
+
 
 def json_response(handler, status, data, headers=None):
     """Send JSON formatted HTTP response"""
-    body = json.dumps(data, ensure_ascii=False, default=str).encode("utf-8")
+    with span('json_encode'):
+        body = json.dumps(data, ensure_ascii=False, default=str).encode("utf-8")
     handler.send_response(status)
     handler.send_header("Content-Type", "application/json; charset=utf-8")
     handler.send_header("Content-Length", str(len(body)))
@@ -40,16 +47,24 @@ def text_response(handler, status, text, content_type="text/plain; charset=utf-8
     handler.end_headers()
     handler.wfile.write(body)
 
-def read_json(handler):
-    """Read JSON data from HTTP request"""
+def read_json(handler, max_body=None):
+    """
+    Read JSON data from HTTP request
+
+    Raises:
+        RequestBodyTooLarge: the body is over max_body
+        ValueError: Content-Length is not a non-negative integer
+    """
     length = int(handler.headers.get("Content-Length", "0") or "0")
+    if length < 0:
+        raise ValueError(f"Invalid Content-Length: {length}")
     if length == 0:
         return {}
     
     # Limit request body size to prevent DoS
-    MAX_BODY_SIZE = 10 * 1024 * 1024  # 10MB
+    MAX_BODY_SIZE = max_body or 10 * 1024 * 1024  # 10MB
     if length > MAX_BODY_SIZE:
-        raise ValueError(f"Request body too large: {length} bytes (max: {MAX_BODY_SIZE} bytes)")
+        raise RequestBodyTooLarge(f"Request body too large: {length} bytes (max: {MAX_BODY_SIZE} bytes)")
     
     raw = handler.rfile.read(length)
     try:
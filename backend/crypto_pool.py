@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Bounded worker pool for CPU-heavy crypto
+
+RSA-OAEP decryption and bcrypt checks take milliseconds of CPU each. They run
+on a fixed number of worker threads (the underlying C code releases the GIL),
+so a burst of logins cannot occupy every request thread. Callers block until
+their job finishes. If too many jobs are already waiting, they get
+CryptoPoolBusy instead of queueing without limit.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+import metrics
+
+# Worker threads for crypto jobs
+CRYPTO_POOL_WORKERS = int(os.getenv('CRYPTO_POOL_WORKERS', str(min(4, os.cpu_count() or 1))))
+
+# Jobs allowed to wait or run at once before new ones are rejected
+CRYPTO_POOL_MAX_PENDING = int(os.getenv('CRYPTO_POOL_MAX_PENDING', str(CRYPTO_POOL_WORKERS * 16)))
+
+# Seconds a caller waits for a pending slot before giving up
+CRYPTO_POOL_ADMIT_TIMEOUT = float(os.getenv('CRYPTO_POOL_ADMIT_TIMEOUT', '2'))
+
+
+class CryptoPoolBusy(RuntimeError):
+    """Raised when the crypto pool has no capacity left"""
+
+
+class CryptoPool:
+    def __init__(self, workers: int = CRYPTO_POOL_WORKERS, max_pending: int = CRYPTO_POOL_MAX_PENDING):
+        self.workers = max(1, workers)
+        self._slots = threading.BoundedSemaphore(max(self.workers, max_pending))
+        self._executor = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pending = 0
+        metrics.REGISTRY.register_gauge('crypto_pool_pending', lambda: self._pending)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.workers, thread_name_prefix='crypto',
+                        initializer=lambda: setattr(self._local, 'worker', True))
+        return self._executor
+
+    def run(self, fn: Callable, *args, **kwargs):
+        """Run fn(*args, **kwargs) on the pool and return its result"""
+        if getattr(self._local, 'worker', False):
+            return fn(*args, **kwargs)  # Already on a crypto worker
+        if not self._slots.acquire(timeout=CRYPTO_POOL_ADMIT_TIMEOUT):
+            metrics.inc('crypto_pool_rejected_total', {'job': getattr(fn, '__name__', 'job')})
+            raise CryptoPoolBusy("Crypto worker pool is saturated")
+        with self._lock:
+            self._pending += 1
+        try:
+            return self._get_executor().submit(fn, *args, **kwargs).result()
+        finally:
+            with self._lock:
+                self._pending -= 1
+            self._slots.release()
+
+
+CRYPTO_POOL = CryptoPool()
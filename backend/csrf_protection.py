@@ -1,18 +1,62 @@
 #!/usr/bin/env python3
 """
 CSRF protection module for database security
+
+Two token modes (CSRF_MODE):
+
+  stateless - the token is "<expires_at>.<nonce>.<mac>", where mac is an
+              HMAC-SHA256 over (user_id, session token digest, expires_at,
+              nonce). Validation recomputes the MAC, so nothing is stored
+              per token and any worker process can check any token. Only
+              tokens revoked on logout are remembered, until they expire.
+  memory    - random tokens kept in the in-process CSRF_TOKENS dict
 """
+import base64
+import hashlib
+import hmac
+import os
 import secrets
+import threading
 import time
-import hashlib
-from typing import Optional, Dict
+from typing import Optional, Dict, Tuple
+
+from key_provider import derived_hmac_keys
 
-# In-memory CSRF token storage (for production, use Redis or database)
+# 'stateless' (HMAC-signed, default) or 'memory'
+CSRF_MODE = os.getenv('CSRF_MODE', 'stateless')
+
+# CSRF token HMAC key, the same on every worker (empty: derived from the keyring)
+CSRF_SECRET = os.getenv('CSRF_SECRET', '')
+
+# In-memory CSRF token storage (memory mode only)
 CSRF_TOKENS: Dict[str, Dict] = {}
 
+# Revoked stateless tokens still within their expiry: MAC -> expires_at
+REVOKED_CSRF_TOKENS: Dict[str, int] = {}
+_revoked_lock = threading.Lock()
+
 # CSRF token expiration time (in seconds) - 1 hour
 CSRF_TOKEN_EXPIRY = 60 * 60
 
+def _signing_keys() -> Tuple[bytes, ...]:
+    return derived_hmac_keys("csrf-token", CSRF_SECRET)
+
+def _mac(key: bytes, user_id: str, session_token: str, expires_at: int, nonce: str) -> str:
+    session_digest = hashlib.sha256(str(session_token).encode('utf-8')).hexdigest()
+    message = f"{user_id}\0{session_digest}\0{expires_at}\0{nonce}".encode('utf-8')
+    digest = hmac.new(key, message, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b'=').decode('ascii')
+
+def _parse_signed(token: str) -> Optional[Tuple[int, str, str]]:
+    parts = token.split('.')
+    if len(parts) != 3:
+        return None
+    try:
+        expires_at = int(parts[0])
+    except ValueError:
+        return None
+    return expires_at, parts[1], parts[2]
+
 def generate_csrf_token(user_id: str, session_token: str) -> str:
     """
     Generate CSRF token for user session
@@ -20,10 +64,16 @@ def generate_csrf_token(user_id: str, session_token: str) -> str:
     Args:
         user_id: User ID
         session_token: Session token
-        
+    
     Returns:
         CSRF token string
     """
+    if CSRF_MODE == 'stateless':
+        expires_at = int(time.time()) + CSRF_TOKEN_EXPIRY
+        nonce = secrets.token_urlsafe(8)
+        mac = _mac(_signing_keys()[0], str(user_id), session_token, expires_at, nonce)
+        return f"{expires_at}.{nonce}.{mac}"
+    
     # Create token from user_id, session_token, and random value
     random_value = secrets.token_urlsafe(16)
     token_data = f"{user_id}:{session_token}:{random_value}:{time.time()}"
@@ -47,13 +97,26 @@ def validate_csrf_token(token: str, user_id: str, session_token: str) -> bool:
         token: CSRF token to validate
         user_id: User ID
         session_token: Session token
-        
+    
     Returns:
         True if valid, False otherwise
     """
     if not token:
         return False
     
+    if CSRF_MODE == 'stateless':
+        parsed = _parse_signed(token)
+        if parsed is None:
+            return False
+        expires_at, nonce, mac = parsed
+        if time.time() > expires_at:
+            return False
+        # Constant-time comparison against every accepted key
+        if not any(hmac.compare_digest(_mac(key, str(user_id), session_token, expires_at, nonce), mac)
+                   for key in _signing_keys()):
+            return False
+        return mac not in REVOKED_CSRF_TOKENS
+    
     token_info = CSRF_TOKENS.get(token)
     if not token_info:
         return False
@@ -76,18 +139,30 @@ def revoke_csrf_token(token: str):
     Args:
         token: CSRF token to revoke
     """
+    if CSRF_MODE == 'stateless':
+        parsed = _parse_signed(token or '')
+        if parsed is None or time.time() > parsed[0]:
+            return
+        with _revoked_lock:
+            REVOKED_CSRF_TOKENS[parsed[2]] = parsed[0]
+        # Keep the list short: expired tokens fail validation anyway
+        cleanup_expired_csrf_tokens()
+        return
+    
     if token in CSRF_TOKENS:
         del CSRF_TOKENS[token]
 
 def cleanup_expired_csrf_tokens():
     """
-    Remove expired CSRF tokens (call periodically)
+    Remove expired CSRF tokens and revocations (call periodically)
     """
     current_time = time.time()
+    with _revoked_lock:
+        for mac in [m for m, expires_at in REVOKED_CSRF_TOKENS.items() if current_time > expires_at]:
+            del REVOKED_CSRF_TOKENS[mac]
     expired_tokens = [
         token for token, info in CSRF_TOKENS.items()
         if current_time > info['expires_at']
     ]
     for token in expired_tokens:
         del CSRF_TOKENS[token]
-
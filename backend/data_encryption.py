@@ -5,7 +5,7 @@ Uses MySQL AES_ENCRYPT/AES_DECRYPT functions
 """
 import os
 import secrets
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
 # Encryption keys for different roles
 # Keys should be stored in environment variables or key files (not in database)
@@ -96,6 +96,45 @@ def get_sensitive_fields(table_name: str) -> list:
     """
     return SENSITIVE_FIELDS.get(table_name.lower(), [])
 
+def process_encrypted_rows(rows: List[Dict], table_name: str, role: str) -> List[Dict]:
+    """
+    Decrypt sensitive fields across a whole result set
+
+    Values are decrypted locally (MySQL AES_ENCRYPT compatible, see
+    column_crypto.py) instead of one AES_DECRYPT round trip per field.
+    Fields that do not decrypt are left unchanged, as before.
+
+    Args:
+        rows: Query result rows
+        table_name: Table name
+        role: User role for key selection
+
+    Returns:
+        New list of row dictionaries with decrypted sensitive fields
+    """
+    if not rows:
+        return rows
+
+    sensitive_fields = get_sensitive_fields(table_name)
+    results = [row.copy() if row else row for row in rows]
+    if not sensitive_fields:
+        return results
+
+    from column_crypto import get_cipher, decrypt_text
+    ciphers = [get_cipher(get_encryption_key(role))]
+    table = table_name.lower()
+
+    # Note: This is a fallback if decryption wasn't done in SQL
+    for field in sensitive_fields:
+        for result in results:
+            # If field is already decrypted in SQL, skip
+            if result and isinstance(result.get(field), bytes):
+                decrypted = decrypt_text(table, field, result[field], ciphers)
+                if decrypted:
+                    result[field] = decrypted
+
+    return results
+
 def process_encrypted_data(data: Dict, table_name: str, role: str) -> Dict:
     """
     Process query results to decrypt sensitive fields
@@ -110,28 +149,4 @@ def process_encrypted_data(data: Dict, table_name: str, role: str) -> Dict:
     """
     if not data:
         return data
-    
-    sensitive_fields = get_sensitive_fields(table_name)
-    result = data.copy()
-    
-    # Decrypt sensitive fields
-    # Note: This is a fallback if decryption wasn't done in SQL
-    for field in sensitive_fields:
-        if field in result and result[field]:
-            # If field is already decrypted in SQL, skip
-            if isinstance(result[field], bytes):
-                try:
-                    key = get_encryption_key(role)
-                    from db_query import db_query
-                    # Decrypt using MySQL function
-                    decrypted = db_query(
-                        f"SELECT AES_DECRYPT(%s, %s) as decrypted",
-                        (result[field], key)
-                    )
-                    if decrypted and decrypted[0].get('decrypted'):
-                        result[field] = decrypted[0]['decrypted'].decode('utf-8') if isinstance(decrypted[0]['decrypted'], bytes) else decrypted[0]['decrypted']
-                except Exception:
-                    pass
-    
-    return result
-
+    return process_encrypted_rows([data], table_name, role)[0]
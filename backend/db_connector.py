@@ -1,5 +1,4 @@
 #!/usr/bin/env python3
-import pymysql
 import os
 from logger_config import app_logger
 
@@ -22,52 +21,68 @@ DBMS_USERS = {
     'student': {'user': 'student', 'password': 'student_password'},
     'guardian': {'user': 'guardian', 'password': 'guardian_password'},
     'aro': {'user': 'aro', 'password': 'aro_password'},
-    'dro': {'user': 'dro', 'password': 'dro_password'}
+    'dro': {'user': 'dro', 'password': 'dro_password'},
+    # Offline maintenance jobs (re-encryption / key rotation), see load_sql/migrations
+    'maintenance': {'user': os.getenv('DB_MAINTENANCE_USER', 'maintenance_user'),
+                    'password': os.getenv('DB_MAINTENANCE_PASSWORD', 'maintenance_password')},
 }
 
-def _create_connection(role=None):
+def _create_connection(role=None, endpoint=None, timeout=None):
     """
     Create a new database connection using role-specific DBMS user
     
     Args:
         role: User role (auth, student, guardian, aro, dro). If None, defaults to 'student'
+        endpoint: (host, port) to connect to. If None, uses the primary from DB_CONFIG
+        timeout: Connect/read/write timeout in seconds (None = PyMySQL defaults)
     
     Returns:
         Database connection object
     """
+    import pymysql  # imported on first connection (see startup.py)
+    
     # Default to 'student' if role is not provided or invalid
     if role not in DBMS_USERS:
         role = 'student'
         app_logger.warning(f"Invalid role provided, defaulting to 'student'")
     
     dbms_user = DBMS_USERS[role]
+    host, port = endpoint or (DB_CONFIG['host'], DB_CONFIG['port'])
+    timeouts = {}
+    if timeout is not None:
+        timeouts = {'connect_timeout': min(10, max(1, int(timeout))),
+                    'read_timeout': timeout, 'write_timeout': timeout}
     
     return pymysql.connect(
-        host=DB_CONFIG['host'],
-        port=DB_CONFIG['port'],
+        host=host,
+        port=port,
         user=dbms_user['user'],
         password=dbms_user['password'],
         database=DB_CONFIG['database'],
         charset=DB_CONFIG['charset'],
         cursorclass=pymysql.cursors.DictCursor,
         autocommit=True,
+        **timeouts,
     )
 
-def get_db_connection(role=None):
+def get_db_connection(role=None, endpoint=None, timeout=None):
     """
     Get database connection using role-specific DBMS user
     
     Args:
         role: User role (auth, student, guardian, aro, dro). If None, defaults to 'student'
+        endpoint: (host, port) of a replica. If None, connects to the primary
+        timeout: Connect/read/write timeout in seconds (None = PyMySQL defaults)
     
     Returns:
         Database connection object
     """
     try:
-        conn = _create_connection(role)
+        conn = _create_connection(role, endpoint, timeout)
         return conn
     except Exception as e:
-        app_logger.error(f"Error creating database connection for role {role}: {e}")
+        target = f"{endpoint[0]}:{endpoint[1]}" if endpoint else "primary"
+        app_logger.error(f"Error creating database connection for role {role} ({target}): {e}")
         raise
 
 def test_db_connection(role='student'):
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Reusable MySQL connections per (role, endpoint)
+
+By default every db_query / db_execute opens and closes its own connection.
+With DB_POOL_SIZE > 0, up to that many idle connections are kept per DBMS
+role and endpoint and handed out again, so later statements skip the TCP
+connect and MySQL authentication, and can reuse the statements prepared on
+the connection (prepared_statements.py, DB_PREPARED_STATEMENTS=1).
+
+A connection that raised during a statement is closed rather than returned,
+so a half-read result or a killed statement never reaches the next caller.
+Connections idle for more than DB_POOL_PING_AFTER seconds are pinged before
+reuse. Each checkout applies the caller's deadline to the connection's
+read/write timeouts.
+"""
+import os
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+import metrics
+from db_connector import get_db_connection
+from logger_config import app_logger
+from prepared_statements import DB_PREPARED_STATEMENTS
+
+# Idle connections kept per (role, endpoint); 0 opens one connection per statement
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '0'))
+
+# Seconds of idleness after which a connection is pinged before reuse
+DB_POOL_PING_AFTER = float(os.getenv('DB_POOL_PING_AFTER', '30'))
+
+# Idle connections older than this are closed instead of reused (seconds)
+DB_POOL_MAX_IDLE = float(os.getenv('DB_POOL_MAX_IDLE', '300'))
+
+
+class ConnectionPool:
+    def __init__(self, size: int = DB_POOL_SIZE):
+        self.size = size
+        # Prepared statements only pay off on connections that are reused
+        self.prepare = DB_PREPARED_STATEMENTS and size > 0
+        self._lock = threading.Lock()
+        self._idle: Dict[Tuple, Deque] = {}
+        metrics.REGISTRY.register_gauge('db_pool_idle', lambda: sum(len(q) for q in self._idle.values()))
+
+    def acquire(self, role: Optional[str], endpoint: Optional[Tuple[str, int]] = None,
+                timeout: Optional[float] = None):
+        """Idle connection for role/endpoint, or a new one"""
+        if self.size <= 0:
+            return get_db_connection(role, endpoint, timeout)
+        key = (role, endpoint)
+        now = time.monotonic()
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                if not idle:
+                    break
+                conn, released = idle.pop()
+            if now - released > DB_POOL_MAX_IDLE:
+                self._close(conn)
+                continue
+            if now - released > DB_POOL_PING_AFTER:
+                try:
+                    conn.ping(reconnect=False)
+                except Exception as e:
+                    app_logger.warning(f"Dropping stale pooled connection for role {role}: {e}")
+                    self._close(conn)
+                    continue
+            conn._read_timeout = timeout
+            conn._write_timeout = timeout
+            metrics.inc('db_pool_checkouts_total', {'result': 'reused'})
+            return conn
+        metrics.inc('db_pool_checkouts_total', {'result': 'opened'})
+        return get_db_connection(role, endpoint, timeout)
+
+    def release(self, conn, role: Optional[str], endpoint: Optional[Tuple[str, int]] = None,
+                discard: bool = False) -> None:
+        """Return a connection after use (discard: close it instead)"""
+        if self.size <= 0 or discard or not conn.open:
+            self._close(conn)
+            return
+        with self._lock:
+            idle = self._idle.setdefault((role, endpoint), deque())
+            if len(idle) < self.size:
+                idle.append((conn, time.monotonic()))
+                return
+        self._close(conn)
+
+    def warm(self, role: Optional[str], count: int, endpoint: Optional[Tuple[str, int]] = None) -> int:
+        """Open connections until role/endpoint has `count` idle ones; returns how many were opened"""
+        with self._lock:
+            missing = min(count, self.size) - len(self._idle.get((role, endpoint), ()))
+        for _ in range(max(0, missing)):
+            self.release(get_db_connection(role, endpoint), role, endpoint)
+        return max(0, missing)
+
+    def clear(self) -> None:
+        """Close all idle connections"""
+        with self._lock:
+            idle = [conn for q in self._idle.values() for conn, _ in q]
+            self._idle.clear()
+        for conn in idle:
+            self._close(conn)
+
+    @staticmethod
+    def _close(conn) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass  # Already closed by the server or a failed read
+
+
+POOL = ConnectionPool()
@@ -1,8 +1,39 @@
 #!/usr/bin/env python3
-from db_connector import get_db_connection
+import os
+import time
+from db_pool import POOL
+from deadline import remaining, connection_timeout, limit_select, guard
 from logger_config import app_logger, log_database_operation
+from metrics import span, timed
+from prepared_statements import run
+from replica_router import READ_ROUTER, is_read_only, current_session_key
 
-def db_query(sql, params=None, role=None):
+# Seconds SHOW COLUMNS results are reused (the schema only changes through migrations)
+SCHEMA_CACHE_TTL = float(os.getenv('SCHEMA_CACHE_TTL', '300'))
+
+# (table, role) -> (expires_at, rows); per role, as column privileges limit what SHOW COLUMNS lists
+_table_columns = {}
+
+def _get_read_connection(sql, role, use_primary, timeout=None):
+    """
+    Check out a connection for a read, preferring a healthy replica
+
+    Returns:
+        (connection, endpoint it was checked out for; None for the primary)
+    """
+    endpoint = None
+    if not use_primary and READ_ROUTER.enabled and is_read_only(sql):
+        endpoint = READ_ROUTER.pick_read_endpoint(current_session_key())
+    if endpoint is None:
+        return POOL.acquire(role, timeout=timeout), None
+    try:
+        return POOL.acquire(role, endpoint, timeout), endpoint
+    except Exception as e:
+        # Replica unreachable: take it out of rotation and serve from the primary
+        READ_ROUTER.mark_failed(endpoint, e)
+        return POOL.acquire(role, timeout=timeout), None
+
+def db_query(sql, params=None, role=None, use_primary=False, bounded=True):
     """
     Execute query SQL and return results
     
@@ -10,22 +41,28 @@ def db_query(sql, params=None, role=None):
         sql: SQL query string
         params: Query parameters (optional)
         role: User role for DBMS user selection (student, guardian, aro, dro)
+        use_primary: Skip replicas (for reads that must see the latest writes)
+        bounded: Apply the current request's deadline (deadline.py)
     """
-    conn = get_db_connection(role)
+    left = remaining() if bounded else None
+    conn, endpoint = _get_read_connection(sql, role, use_primary, connection_timeout(left))
+    failed = False
+    watch = None
     try:
-        with conn.cursor() as cur:
-            cur.execute(sql, params or ())
-            result = cur.fetchall()
+        with span('db_query'), guard(conn, role, left) as watch:
+            result, _ = run(conn, limit_select(sql, left), params, POOL.prepare)
             # Log database operation
             log_database_operation('SELECT', 'unknown', 'system', role or 'system', sql)
             return result
     except Exception as e:
+        failed = True
         app_logger.error(f"Database query error: {e}, SQL: {sql[:100]}")
         raise
     finally:
-        conn.close()
+        # A killed statement's connection may still receive the KILL QUERY
+        POOL.release(conn, role, endpoint, discard=failed or (watch is not None and watch.killed))
 
-def db_execute(sql, params=None, role=None):
+def db_execute(sql, params=None, role=None, pin_session=True, bounded=True):
     """
     Execute update SQL and return affected row count
     
@@ -33,21 +70,29 @@ def db_execute(sql, params=None, role=None):
         sql: SQL statement string
         params: Statement parameters (optional)
         role: User role for DBMS user selection (student, guardian, aro, dro)
+        pin_session: Keep the caller's following reads on the primary (read-after-write)
+        bounded: Apply the current request's deadline (deadline.py)
     """
-    conn = get_db_connection(role)
+    left = remaining() if bounded else None
+    if pin_session:
+        READ_ROUTER.record_write(current_session_key())
+    conn = POOL.acquire(role, timeout=connection_timeout(left))
+    failed = False
+    watch = None
     try:
-        with conn.cursor() as cur:
-            cur.execute(sql, params or ())
-            result = cur.rowcount
+        with span('db_execute'), guard(conn, role, left) as watch:
+            _, result = run(conn, sql, params, POOL.prepare)
             # Log database operation
             log_database_operation('EXECUTE', 'unknown', 'system', role or 'system', sql)
             return result
     except Exception as e:
+        failed = True
         app_logger.error(f"Database execute error: {e}, SQL: {sql[:100]}")
         raise
     finally:
-        conn.close()
+        POOL.release(conn, role, discard=failed or (watch is not None and watch.killed))
 
+@timed('get_table_columns')
 def getTableColumns(table_name, role=None):
     """
     Return all column information for the specified table
@@ -55,7 +100,13 @@ def getTableColumns(table_name, role=None):
     Args:
         table_name: Name of the table
         role: User role for DBMS user selection (student, guardian, aro, dro)
+    
+    Results are cached for SCHEMA_CACHE_TTL seconds (warmed at startup,
+    see startup.py); callers must not modify them.
     """
+    cached = _table_columns.get((table_name, role))
+    if cached is not None and time.monotonic() < cached[0]:
+        return cached[1]
     # Use parameterized query to prevent SQL injection
     # Note: SHOW COLUMNS doesn't support parameters, so we validate table_name first
     from security import validate_table_name
@@ -64,6 +115,7 @@ def getTableColumns(table_name, role=None):
     # Escape table name to prevent injection
     # Since table_name is validated, this is safe
     rows = db_query(f"SHOW COLUMNS FROM `{table_name}`", role=role)
+    _table_columns[(table_name, role)] = (time.monotonic() + SCHEMA_CACHE_TTL, rows)
     return rows
 
 def checkPrimaryKey(columnData, keyPair):
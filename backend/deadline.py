@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Per-request deadlines for database statements
+
+Every routed request gets a time budget (Route.deadline, default
+REQUEST_DEADLINE seconds). db_query / db_execute read it from the request
+context and apply what is left of it to each statement:
+
+  - PyMySQL connect/read/write timeouts on the statement's connection
+  - a MAX_EXECUTION_TIME optimizer hint on SELECT statements
+  - a watchdog thread that sends KILL QUERY for the statement once the
+    deadline passes or the client closes its connection, so MySQL stops
+    working on a result nobody will read
+
+A statement stopped this way raises DeadlineExceeded (answered with 504) or
+ClientDisconnected (nothing is sent). Statements outside a request (startup,
+maintenance jobs) have no deadline.
+"""
+import itertools
+import math
+import os
+import select
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+import metrics
+from logger_config import app_logger
+
+# Default time budget of a request, in seconds (0 disables)
+REQUEST_DEADLINE = float(os.getenv('REQUEST_DEADLINE', '10'))
+
+# Time budget of /performQuery, in seconds
+QUERY_DEADLINE = float(os.getenv('QUERY_DEADLINE', '5'))
+
+# Seconds between watchdog checks of running statements
+DEADLINE_WATCH_INTERVAL = float(os.getenv('DEADLINE_WATCH_INTERVAL', '0.1'))
+
+# Extra socket timeout so a KILL QUERY error arrives before the client gives up
+SOCKET_TIMEOUT_GRACE = 1.0
+
+# MySQL errors raised for a killed statement / an exceeded MAX_EXECUTION_TIME
+ER_QUERY_INTERRUPTED = 1317
+ER_QUERY_TIMEOUT = 3024
+
+
+class DeadlineExceeded(RuntimeError):
+    """The request ran out of its time budget"""
+
+
+class ClientDisconnected(RuntimeError):
+    """The client closed its connection while the request was being served"""
+
+
+def _context():
+    from router import current_context
+    return current_context()
+
+
+def remaining() -> Optional[float]:
+    """
+    Seconds left in the current request's budget (None outside a request or
+    without a deadline)
+
+    Raises:
+        DeadlineExceeded: The budget is already spent
+    """
+    ctx = _context()
+    if ctx is None or ctx.deadline is None:
+        return None
+    left = ctx.deadline - time.monotonic()
+    if left <= 0:
+        raise DeadlineExceeded(f"Deadline of {ctx.route.name} exceeded")
+    return left
+
+
+def connection_timeout(left: Optional[float]) -> Optional[float]:
+    """Socket timeout for a statement with `left` seconds of budget"""
+    return None if left is None else left + SOCKET_TIMEOUT_GRACE
+
+
+def limit_select(sql: str, left: Optional[float]) -> str:
+    """
+    Add a MAX_EXECUTION_TIME hint to a SELECT statement
+
+    The limit is rounded up to a power of two seconds so a statement keeps a
+    handful of distinct texts (and prepared statements, prepared_statements.py);
+    the watchdog enforces the exact deadline.
+    """
+    if left is None:
+        return sql
+    stripped = sql.lstrip()
+    if stripped[:6].lower() != "select" or "MAX_EXECUTION_TIME" in stripped[:80]:
+        return sql
+    seconds = 1 << max(0, math.ceil(math.log2(max(left, 1.0))))
+    return f"SELECT /*+ MAX_EXECUTION_TIME({seconds * 1000}) */{stripped[6:]}"
+
+
+def client_gone(sock) -> bool:
+    """True if the peer closed the connection (pending data counts as alive)"""
+    if sock is None:
+        return False
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        if not readable:
+            return False
+        # Peek at the raw socket (TLS sockets refuse recv flags)
+        return socket.socket.recv(sock, 1, socket.MSG_PEEK) == b""
+    except (OSError, ValueError):
+        return True
+
+
+class _Watched:
+    __slots__ = ('role', 'endpoint', 'thread_id', 'deadline', 'client', 'reason')
+
+    def __init__(self, role, endpoint, thread_id, deadline, client):
+        self.role = role
+        self.endpoint = endpoint
+        self.thread_id = thread_id
+        self.deadline = deadline
+        self.client = client
+        self.reason: Optional[str] = None
+
+
+class StatementWatchdog:
+    """Kills statements whose request deadline passed or whose client left"""
+
+    def __init__(self, interval: float = DEADLINE_WATCH_INTERVAL):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._entries: Dict[int, _Watched] = {}
+        self._ids = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+        metrics.REGISTRY.register_gauge('db_statements_watched', lambda: len(self._entries))
+
+    def watch(self, conn, role: str, deadline: float, client) -> int:
+        entry = _Watched(role, (conn.host, conn.port), conn.thread_id(), deadline, client)
+        with self._lock:
+            token = next(self._ids)
+            self._entries[token] = entry
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='deadline-watchdog', daemon=True)
+                self._thread.start()
+        return token
+
+    def unwatch(self, token: int) -> Optional[str]:
+        """
+        Stop watching; returns why the statement was killed, if a KILL QUERY
+        was sent or is about to be (the connection must then not be reused)
+        """
+        with self._lock:
+            entry = self._entries.pop(token, None)
+        return entry.reason if entry else None
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            now = time.monotonic()
+            # Decided under the lock: an entry unwatched before this point is
+            # never killed, one marked here is reported by unwatch()
+            doomed = []
+            with self._lock:
+                for entry in self._entries.values():
+                    if entry.reason is not None:
+                        continue
+                    if now >= entry.deadline:
+                        entry.reason = 'deadline'
+                    elif client_gone(entry.client):
+                        entry.reason = 'disconnect'
+                    else:
+                        continue
+                    doomed.append(entry)
+            for entry in doomed:
+                self._kill(entry)
+
+    @staticmethod
+    def _kill(entry: _Watched) -> None:
+        from db_connector import get_db_connection
+        try:
+            conn = get_db_connection(entry.role, entry.endpoint)
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("KILL QUERY %s", (entry.thread_id,))
+            finally:
+                conn.close()
+            metrics.inc('db_statements_killed_total', {'reason': entry.reason})
+            app_logger.warning(f"Statement killed: reason={entry.reason}, role={entry.role}, thread_id={entry.thread_id}")
+        except Exception as e:
+            # The statement may have finished in the meantime
+            app_logger.warning(f"KILL QUERY failed: thread_id={entry.thread_id}, error={e}")
+
+
+WATCHDOG = StatementWatchdog()
+
+
+class GuardState:
+    """Outcome of guard(): killed is True once the watchdog marked the statement"""
+
+    __slots__ = ('killed',)
+
+    def __init__(self):
+        self.killed = False
+
+
+@contextmanager
+def guard(conn, role: Optional[str], left: Optional[float]):
+    """
+    Watch the statement run on conn for the current request's deadline
+
+    Translates the errors of a killed or timed-out statement into
+    DeadlineExceeded / ClientDisconnected. Yields a GuardState; when its
+    killed flag is set a KILL QUERY may still reach the connection's
+    thread, so the caller must close the connection instead of pooling it.
+
+    Args:
+        left: Budget returned by remaining() (None: statement is unbounded)
+    """
+    state = GuardState()
+    ctx = _context()
+    if left is None or ctx is None or ctx.deadline is None:
+        yield state
+        return
+    # Already loaded by the connection (not imported at startup, see startup.py)
+    from pymysql.err import InternalError, OperationalError
+    token = WATCHDOG.watch(conn, role, ctx.deadline, getattr(ctx.handler, 'connection', None))
+    try:
+        yield state
+    except (OperationalError, InternalError) as e:
+        reason = WATCHDOG.unwatch(token)
+        state.killed = reason is not None
+        code = e.args[0] if e.args else None
+        if reason == 'disconnect':
+            raise ClientDisconnected(f"Client of {ctx.route.name} went away") from e
+        if reason == 'deadline' or code in (ER_QUERY_INTERRUPTED, ER_QUERY_TIMEOUT) or time.monotonic() >= ctx.deadline:
+            metrics.inc('request_deadline_exceeded_total', {'route': ctx.route.name})
+            raise DeadlineExceeded(f"Deadline of {ctx.route.name} exceeded") from e
+        raise
+    finally:
+        if WATCHDOG.unwatch(token) is not None:
+            state.killed = True
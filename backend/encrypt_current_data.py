@@ -1,13 +1,19 @@
 from typing import Tuple
 
+from column_crypto import decrypt_text, get_cipher
 from db_connector import get_db_connection
 from encryption import (
+    KEY_PROVIDER,
     ENCRYPTED_COLUMNS,
     getEncryptionKey,
     getColumnTypeDefinition,
     isNullableColumn,
+    getBlindIndexColumn,
+    computeBlindIndex,
 )
 
+BACKFILL_BATCH_SIZE = 500
+
 
 def alterColumnType(conn, table: str, column: str) -> None:
     column_type = getColumnTypeDefinition(table, column)
@@ -35,19 +41,67 @@ def encryptColumn(conn, table: str, column: str, key: str) -> None:
         print(f"✓ Encrypted {cur.rowcount} row(s) in {table}.{column}")
 
 
-def processTable(conn, table: str, columns: Tuple[str, ...], key: str) -> None:
+def getPrimaryKey(conn, table: str) -> str:
+    with conn.cursor() as cur:
+        cur.execute(f"SHOW KEYS FROM `{table}` WHERE Key_name = 'PRIMARY'")
+        return cur.fetchone()["Column_name"]
+
+
+def backfillBlindIndex(conn, table: str, column: str, key: str) -> None:
+    """Fill <column>_bidx for rows that do not have it yet"""
+    bidx_col = getBlindIndexColumn(table, column)
+    if not bidx_col:
+        return
+    pk = getPrimaryKey(conn, table)
+    ciphers = [get_cipher(k, key_id) for key_id, k in KEY_PROVIDER.ring().decrypt_keys()]
+    total = 0
+    last_pk = None
+    while True:
+        # Walk the primary key so each batch is a short, index-driven read
+        sql = f"SELECT `{pk}` AS pk, `{column}` AS val FROM `{table}` WHERE `{bidx_col}` IS NULL"
+        params = []
+        if last_pk is not None:
+            sql += f" AND `{pk}` > %s"
+            params.append(last_pk)
+        sql += f" ORDER BY `{pk}` LIMIT {BACKFILL_BATCH_SIZE}"
+        with conn.cursor() as cur:
+            cur.execute(sql, params)
+            rows = cur.fetchall()
+        if not rows:
+            break
+        updates = []
+        for row in rows:
+            plain = decrypt_text(table, column, row["val"], ciphers) if row["val"] is not None else None
+            if plain is not None:
+                updates.append((computeBlindIndex(table, column, plain), row["pk"]))
+        if updates:
+            with conn.cursor() as cur:
+                cur.executemany(f"UPDATE `{table}` SET `{bidx_col}` = %s WHERE `{pk}` = %s", updates)
+            total += len(updates)
+        last_pk = rows[-1]["pk"]
+    print(f"✓ Backfilled {total} blind index value(s) in {table}.{bidx_col}")
+
+
+def processTable(conn, backfill_conn, table: str, columns: Tuple[str, ...], key: str) -> None:
     for column in columns:
         alterColumnType(conn, table, column)
         encryptColumn(conn, table, column, key)
+        try:
+            backfillBlindIndex(backfill_conn, table, column, key)
+        except Exception as exc:
+            print(f"! Skipped blind index backfill for {table}.{column}: {exc}")
 
 
 def main() -> None:
     key = getEncryptionKey()
     conn = get_db_connection('auth')
+    # Only the maintenance account may write the blind index columns (V002)
+    backfill_conn = get_db_connection('maintenance')
     try:
         for table, columns_meta in ENCRYPTED_COLUMNS.items():
-            processTable(conn, table, tuple(columns_meta.keys()), key)
+            processTable(conn, backfill_conn, table, tuple(columns_meta.keys()), key)
     finally:
+        backfill_conn.close()
         conn.close()
 
 
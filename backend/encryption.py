@@ -1,80 +1,71 @@
+import hashlib
+import hmac
 import os
-from functools import lru_cache
-from typing import Any, Dict
-from pathlib import Path
-from dotenv import load_dotenv
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
+from key_provider import KEY_PROVIDER
+
+# "blind_index": True keeps a keyed HMAC of the plaintext in a `<column>_bidx`
+# companion column (see load_sql/migrations/V001__blind_index_columns.sql) so
+# equality filters can use an index instead of decrypting every row.
 ENCRYPTED_COLUMNS: Dict[str, Dict[str, Dict[str, Any]]] = {
     "students": {
-        "Id_No": {"cast": "CHAR(32)", "type": "VARBINARY(255)", "nullable": False},
+        "Id_No": {"cast": "CHAR(32)", "type": "VARBINARY(255)", "nullable": False, "blind_index": True},
         "address": {"cast": "TEXT", "type": "BLOB", "nullable": True},
-        "phone": {"cast": "CHAR(32)", "type": "VARBINARY(64)", "nullable": False},
+        "phone": {"cast": "CHAR(32)", "type": "VARBINARY(64)", "nullable": False, "blind_index": True},
     },
     "guardians": {
-        "phone": {"cast": "CHAR(32)", "type": "VARBINARY(64)", "nullable": False},
+        "phone": {"cast": "CHAR(32)", "type": "VARBINARY(64)", "nullable": False, "blind_index": True},
     },
     "staffs": {
-        "Id_No": {"cast": "CHAR(32)", "type": "VARBINARY(255)", "nullable": False},
+        "Id_No": {"cast": "CHAR(32)", "type": "VARBINARY(255)", "nullable": False, "blind_index": True},
         "address": {"cast": "TEXT", "type": "BLOB", "nullable": True},
-        "phone": {"cast": "CHAR(32)", "type": "VARBINARY(64)", "nullable": False},
+        "phone": {"cast": "CHAR(32)", "type": "VARBINARY(64)", "nullable": False, "blind_index": True},
     },
 }
 
+BLIND_INDEX_SUFFIX = "_bidx"
+
+# Stored blind index length in bytes (BINARY(16) columns)
+BLIND_INDEX_SIZE = 16
+
+
+# Where column encryption happens: "sql" (MySQL AES_ENCRYPT/AES_DECRYPT) or
+# "app" (AES-GCM in the API process, see column_crypto.py)
+ENCRYPTION_ENGINE = os.getenv("ENCRYPTION_ENGINE", "sql").strip().lower()
+
 
-def _find_env_file() -> Path:
-    """
-    Find .env file by searching from current directory up to project root
-    """
-    current = Path(__file__).resolve().parent  # backend directory
-    root = current.parent  # project root
-    
-    # Try project root first
-    env_path = root / ".env"
-    if env_path.exists():
-        return env_path
-    
-    # Try backend directory
-    env_path = current / ".env"
-    if env_path.exists():
-        return env_path
-    
-    # Try current working directory
-    env_path = Path(".env").resolve()
-    if env_path.exists():
-        return env_path
-    
-    # Return project root path (will be used by load_dotenv to search)
-    return root
-
-
-@lru_cache(maxsize=1)
 def getEncryptionKey() -> str:
-    # Find .env file location
-    env_path = _find_env_file()
-    
-    # Load .env file - load_dotenv will search upward if file not found at exact path
-    if env_path.is_file():
-        load_dotenv(dotenv_path=env_path, override=True)
-    else:
-        # If .env not found, let load_dotenv search from project root
-        load_dotenv(dotenv_path=env_path / ".env", override=True)
-        # Also try without specifying path (searches from current directory upward)
-        load_dotenv(override=True)
-    
-    key = os.environ.get("DATA_ENCRYPTION_KEY", "")
-    if not key:
-        raise RuntimeError(
-            f"DATA_ENCRYPTION_KEY environment variable is required to handle encrypted columns.\n"
-            f"Please ensure .env file exists in project root or backend directory with DATA_ENCRYPTION_KEY set.\n"
-            f"Searched paths: {env_path}, {Path(__file__).parent / '.env'}, {Path('.env').resolve()}"
-        )
-    return key
+    """Active data encryption key (served from the in-memory keyring)"""
+    return KEY_PROVIDER.ring().active_key
+
+
+def getActiveKeyId() -> str:
+    return KEY_PROVIDER.ring().active_id
 
 
 def ensureEncryptionKey() -> None:
     getEncryptionKey()
 
 
+def getPreviousEncryptionKey() -> Optional[str]:
+    """
+    Key being rotated away from (DATA_ENCRYPTION_KEY_PREVIOUS, or the next key
+    in DATA_KEYRING_FILE)
+
+    While set, reads try the current key first and fall back to older keys, so
+    rows not yet re-encrypted by reencrypt.py stay readable. Writes always
+    use the current key.
+    """
+    keys = KEY_PROVIDER.ring().decrypt_keys()
+    return keys[1][1] if len(keys) > 1 else None
+
+
+def getDecryptKeys() -> List[str]:
+    """Keys to try when decrypting, current key first"""
+    return [key for _, key in KEY_PROVIDER.ring().decrypt_keys()]
+
+
 def getEncryptedColumns(table: str) -> Dict[str, Dict[str, Any]]:
     return ENCRYPTED_COLUMNS.get(table.lower(), {})
 
@@ -84,6 +75,7 @@ def isEncryptedColumn(table: str, column: str) -> bool:
 
 
 def buildSelectDecryptExpr(table: str, column: str, table_alias: str) -> str:
+    """AES_DECRYPT expression for a column (one key parameter)"""
     columns = getEncryptedColumns(table)
     if column not in columns:
         raise KeyError(f"Column '{column}' is not marked as encrypted in table '{table}'.")
@@ -105,4 +97,123 @@ def isNullableColumn(table: str, column: str) -> bool:
     columns = getEncryptedColumns(table)
     if column not in columns:
         raise KeyError(f"Column '{column}' is not marked as encrypted in table '{table}'.")
-    return bool(columns[column].get("nullable", False))
\ No newline at end of file
+    return bool(columns[column].get("nullable", False))
+
+
+def isAppEncryptionEngine() -> bool:
+    return ENCRYPTION_ENGINE == "app"
+
+
+def buildSelectEncryptedColumn(table: str, column: str, table_alias: str) -> Tuple[str, List[Any]]:
+    """
+    SELECT expression for an encrypted column under the active engine
+
+    Returns:
+        (sql_fragment, params) - the app engine selects the raw ciphertext and
+        needs no key parameter; decryptResultRows() decrypts it afterwards
+
+    During a key rotation the SQL engine also selects the raw ciphertext:
+    COALESCE over AES_DECRYPT with each key would trust a wrong key whose
+    output passes the PKCS#7 check by chance (about 1 value in 256).
+    decryptResultRows() tries each key locally and keeps the first result
+    that is valid text.
+    """
+    keys = getDecryptKeys()
+    if isAppEncryptionEngine() or len(keys) > 1:
+        if column not in getEncryptedColumns(table):
+            raise KeyError(f"Column '{column}' is not marked as encrypted in table '{table}'.")
+        return f"{table_alias}.`{column}` AS `{column}`", []
+    return f"{buildSelectDecryptExpr(table, column, table_alias)} AS `{column}`", keys
+
+
+def buildEncryptValue(table: str, column: str, value: Any) -> Tuple[str, List[Any]]:
+    """
+    Value placeholder and params for writing an encrypted column
+
+    Returns:
+        (sql_fragment, params) - "AES_ENCRYPT(%s, %s)" with the key for the SQL
+        engine, or "%s" with ciphertext produced locally for the app engine
+    """
+    if isAppEncryptionEngine():
+        from column_crypto import get_cipher
+        ring = KEY_PROVIDER.ring()
+        return "%s", [get_cipher(ring.active_key, ring.active_id).encrypt(table, column, value)]
+    return "AES_ENCRYPT(%s, %s)", [value, getEncryptionKey()]
+
+
+def decryptResultRows(table: str, rows: List[Dict[str, Any]], columns: Iterable[str]) -> List[Dict[str, Any]]:
+    """
+    Decrypt selected encrypted columns of a result set
+
+    For the SQL engine only raw ciphertext is decrypted (selected during a
+    key rotation, see buildSelectEncryptedColumn); AES_DECRYPT output is
+    already text.
+    """
+    columns = [c for c in columns if c in getEncryptedColumns(table)]
+    if not columns or not rows:
+        return rows
+    if not isAppEncryptionEngine() and not any(
+            isinstance(row.get(c), (bytes, bytearray)) for row in rows for c in columns):
+        return rows
+    from column_crypto import decrypt_rows, get_cipher
+    ciphers = [get_cipher(key, key_id) for key_id, key in KEY_PROVIDER.ring().decrypt_keys()]
+    return decrypt_rows(table, rows, columns, ciphers)
+
+
+def getBlindIndexColumn(table: str, column: str) -> Optional[str]:
+    """Name of the blind index companion column, or None if the column has none"""
+    meta = getEncryptedColumns(table).get(column)
+    if meta and meta.get("blind_index"):
+        return f"{column}{BLIND_INDEX_SUFFIX}"
+    return None
+
+
+def isBlindIndexColumn(column: str) -> bool:
+    return str(column).endswith(BLIND_INDEX_SUFFIX)
+
+
+def _deriveBlindIndexKey(master_key: str) -> bytes:
+    return hmac.new(master_key.encode("utf-8"), b"blind-index", hashlib.sha256).digest()
+
+
+def _getBlindIndexKeys() -> Tuple[bytes, ...]:
+    # A dedicated BLIND_INDEX_KEY survives DATA_ENCRYPTION_KEY rotation;
+    # otherwise derive a separate key so the HMAC never reuses the AES key
+    ring = KEY_PROVIDER.ring()
+    keys = ring.cache.get("blind_index_keys")
+    if keys is None:
+        if ring.blind_index_key:
+            keys = (ring.blind_index_key.encode("utf-8"),)
+        else:
+            keys = tuple(_deriveBlindIndexKey(k) for _, k in ring.decrypt_keys())
+        ring.cache["blind_index_keys"] = keys
+    return keys
+
+
+def _blindIndex(index_key: bytes, table: str, column: str, value: Any) -> bytes:
+    message = f"{table.lower()}.{column}\0{str(value).strip()}".encode("utf-8")
+    return hmac.new(index_key, message, hashlib.sha256).digest()[:BLIND_INDEX_SIZE]
+
+
+def computeBlindIndex(table: str, column: str, value: Any) -> Optional[bytes]:
+    """
+    Keyed HMAC-SHA256 of a plaintext value, truncated to BLIND_INDEX_SIZE bytes
+
+    The table and column are part of the MAC input, so equal values in
+    different columns do not produce linkable index values.
+    """
+    if value is None:
+        return None
+    return _blindIndex(_getBlindIndexKeys()[0], table, column, value)
+
+
+def computeBlindIndexCandidates(table: str, column: str, value: Any) -> List[bytes]:
+    """
+    Blind index values to match in a lookup
+
+    During a key rotation without BLIND_INDEX_KEY, rows not yet re-encrypted
+    still carry an index derived from the previous key.
+    """
+    if value is None:
+        return []
+    return [_blindIndex(k, table, column, value) for k in _getBlindIndexKeys()]
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Guardian -> children resolution for the "children" range filter
+
+A guardian may read grades and disciplinary records of the students whose
+students.GuaID points at them. The StuID list is loaded once per guardian
+and cached. buildRangeFilter turns it into an IN (...) predicate on the
+indexed StuID column instead of joining students on every query.
+
+Entries expire after GUARDIAN_CHILDREN_TTL seconds and are dropped when a
+write through the API touches students.GuaID, in every prefork worker
+(invalidation.py).
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional, Tuple
+
+import metrics
+from invalidation import SHARED_GENERATIONS
+
+# Shared write counter of this cache (invalidation.py)
+_SHARED_NAME = "guardian_children"
+
+# Seconds a guardian's children list is reused (covers writes made outside the API)
+GUARDIAN_CHILDREN_TTL = float(os.getenv('GUARDIAN_CHILDREN_TTL', '600'))
+
+# Guardians kept in the cache
+GUARDIAN_CHILDREN_MAX_ENTRIES = int(os.getenv('GUARDIAN_CHILDREN_MAX_ENTRIES', '10000'))
+
+
+class GuardianChildrenCache:
+    """LRU of guardian id -> tuple of StuIDs"""
+
+    def __init__(self, ttl: float = GUARDIAN_CHILDREN_TTL, max_entries: int = GUARDIAN_CHILDREN_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, Tuple]]" = OrderedDict()
+        self._generation = 0
+        self._seen = 0   # shared write counter last applied
+        metrics.REGISTRY.register_gauge('guardian_children_cache_entries', lambda: len(self._entries))
+
+    def get(self, guardian_id) -> Tuple:
+        """StuIDs of the guardian's children (loaded on first use)"""
+        key = str(guardian_id)
+        now = time.monotonic()
+        with self._lock:
+            self._sync()
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                metrics.inc('guardian_children_cache_total', {'result': 'hit'})
+                return entry[1]
+            generation = self._generation
+        metrics.inc('guardian_children_cache_total', {'result': 'miss'})
+        children = self._load(guardian_id)
+        with self._lock:
+            self._sync()
+            # Don't store a list read while a GuaID write was being applied
+            if generation == self._generation:
+                self._entries[key] = (now + self.ttl, children)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return children
+
+    @staticmethod
+    def _load(guardian_id) -> Tuple:
+        from db_query import db_query
+        # Access control data: a lagging replica could restore a revoked child
+        rows = db_query(
+            "SELECT `StuID` FROM `students` WHERE `GuaID` = %s ORDER BY `StuID`",
+            (guardian_id,), role='guardian', use_primary=True,
+        )
+        return tuple(row["StuID"] for row in rows)
+
+    def invalidate(self, guardian_id=None) -> None:
+        """
+        Drop one guardian's entry, or every entry when guardian_id is None
+        (other workers drop every entry either way)
+        """
+        with self._lock:
+            self._generation += 1
+            if guardian_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(str(guardian_id), None)
+            self._seen = SHARED_GENERATIONS.bump(_SHARED_NAME)
+
+    def _sync(self) -> None:
+        """Apply invalidations made by other workers (caller holds the lock)"""
+        shared = SHARED_GENERATIONS.read(_SHARED_NAME)
+        if shared != self._seen:
+            self._seen = shared
+            self._generation += 1
+            self._entries.clear()
+
+    def on_write(self, table: str, columns: Optional[Iterable[str]] = None) -> None:
+        """
+        Invalidate after a write through the API
+
+        Args:
+            table: Table written
+            columns: Columns changed (None for inserts and deletes)
+        """
+        if table != "students":
+            return
+        if columns is None or "GuaID" in columns:
+            # The old and new guardian are not known here; drop everything
+            self.invalidate()
+
+
+GUARDIAN_CHILDREN = GuardianChildrenCache()
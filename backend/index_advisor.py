@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Index advisor for the hot statement shapes
+
+Runs EXPLAIN over the statements the API sends on every request:
+
+  - authenticate_user: LOWER(email) lookups on students / guardians / staffs
+  - validate_session:  token probe with an expires_at range
+  - /performQuery:     per role and table, the SELECT the handler builds
+                       (readable columns, FK joins, range filter), alone,
+                       with an equality filter on each FK column and with
+                       the usual ORDER BY, and the summaries in
+                       AGGREGATE_SHAPES (GROUP BY)
+
+and reports full table scans (type ALL), filesorts and temporary tables,
+with the index that would serve the shape. Each statement is explained as
+the DBMS user that runs it in production.
+
+The indexes for the findings on the seeded schema are in
+load_sql/migrations/V004__query_pattern_indexes.sql.
+
+Usage:
+    python index_advisor.py
+    python index_advisor.py --roles aro,dro --output advisor.json --strict
+"""
+import argparse
+import json
+import sys
+import time
+from typing import Dict, List, Optional
+
+from aggregation import build_aggregate
+from db_query import db_query, getTableColumns
+from encryption import getEncryptedColumns, buildSelectEncryptedColumn
+from privilege_controller import PRIVILEGE_MATRIX, FKLink, buildRangeFilter
+
+# Sample user ids per role for the range filters (seed data in University.sql)
+SAMPLE_PERSON_IDS = {"student": 100, "guardian": 1000, "aro": 5001, "dro": 5002}
+
+# Columns the UI sorts on, per table
+ORDER_COLUMNS = {
+    "grades": ["term"],
+    "disciplinary_records": ["date"],
+    "students": ["last_name"],
+}
+
+# Aggregates the UI requests, per table (see aggregation.py)
+AGGREGATE_SHAPES = {
+    "grades": [{"group_by": ["CID"], "metrics": [{"op": "count"}, {"op": "avg", "column": "grade"}]}],
+}
+
+
+class Shape:
+    """One statement shape to EXPLAIN"""
+
+    def __init__(self, name: str, sql: str, params: List, role: str, table: str,
+                 eq_columns: List[str] = (), order_columns: List[str] = ()):
+        self.name = name
+        self.sql = sql
+        self.params = list(params)
+        self.role = role
+        self.table = table
+        self.eq_columns = list(eq_columns)
+        self.order_columns = list(order_columns)
+
+
+def authShapes() -> List[Shape]:
+    shapes = [
+        Shape(f"login:{table}",
+              f"SELECT {pk}, password, salt FROM {table} WHERE LOWER(email) = %s",
+              ["nobody@example.com"], "auth", table, eq_columns=["(LOWER(email))"])
+        for table, pk in (("students", "StuID"), ("guardians", "GuaID"), ("staffs", "StfID"))
+    ]
+    shapes.append(Shape("session:lookup",
+                        "SELECT user_id, role, expires_at FROM sessions WHERE token = %s AND expires_at > NOW()",
+                        ["0" * 64], "student", "sessions", eq_columns=["token", "expires_at"]))
+    return shapes
+
+
+def performQueryShapes(roles: Optional[List[str]] = None) -> List[Shape]:
+    """Mirror the SELECT built by api_handler.handle_perform_query"""
+    shapes = []
+    for (role, table), table_priv in sorted(PRIVILEGE_MATRIX.items()):
+        if roles and role not in roles:
+            continue
+        auth = {"role": role, "personId": SAMPLE_PERSON_IDS.get(role)}
+        available = [col["Field"] for col in getTableColumns(table, role=role)]
+        tableCols = table_priv.readable_columns(available)
+        if not tableCols:
+            continue
+        encrypted = getEncryptedColumns(table)
+        tableFks = FKLink.get(table, {})
+        select, params, joins = [], [], []
+        for idx, col in enumerate(tableCols, start=1):
+            if col in encrypted:
+                expr, expr_params = buildSelectEncryptedColumn(table, col, "target")
+                select.append(expr)
+                params.extend(expr_params)
+            else:
+                select.append(f"target.`{col}` AS `{col}`")
+                if col in tableFks:
+                    fk = tableFks[col]
+                    joins.append(f"LEFT JOIN `{fk['table']}` j{idx} ON target.`{col}` = j{idx}.`{fk['pk']}`")
+                    if fk.get("corrNameSql") and fk.get("corrName"):
+                        select.append(f"{fk['corrNameSql'].replace('j.', f'j{idx}.')} AS `{fk['corrName']}`")
+        rangeJoins, rangeWhere, rangeParams = buildRangeFilter(auth, table, "target")
+        base = f"SELECT {', '.join(select)} FROM `{table}` target " + " ".join(list(rangeJoins) + joins)
+        range_cols = _filterColumns(rangeWhere)
+
+        def add(suffix, where, where_params, eq_cols, order_cols):
+            clauses = [c for c in (rangeWhere, where) if c]
+            sql = base + (" WHERE " + " AND ".join(clauses) if clauses else "")
+            if order_cols:
+                sql += " ORDER BY " + ", ".join(f"target.`{c}` ASC" for c in order_cols)
+            sql += " LIMIT 100 OFFSET 0"
+            shapes.append(Shape(f"performQuery:{role}:{table}{suffix}", sql,
+                                params + list(rangeParams) + where_params, role, table,
+                                range_cols + eq_cols, order_cols))
+
+        add("", "", [], [], [])
+        orders = [c for c in ORDER_COLUMNS.get(table, []) if c in tableCols]
+        for col in orders:
+            add(f":order={col}", "", [], [], [col])
+        if table_priv.range == "all":
+            # Admin roles narrow by a related row instead of a range filter
+            for col in tableFks:
+                if col in tableCols:
+                    add(f":{col}=", f"target.`{col}` = %s", [0], [col], orders[:1])
+        for spec in AGGREGATE_SHAPES.get(table, []):
+            agg = build_aggregate(table, spec, table_priv.column_lookup(available), encrypted)
+            group_cols = _filterColumns(" ".join(agg.group_by))
+            sql = (f"SELECT {', '.join(agg.select)} FROM `{table}` target "
+                   + " ".join(list(rangeJoins) + agg.joins)
+                   + (f" WHERE {rangeWhere}" if rangeWhere else "")
+                   + (f" GROUP BY {', '.join(agg.group_by)} ORDER BY "
+                      + ", ".join(f"{expr} ASC" for expr in agg.group_by) if agg.group_by else "")
+                   + " LIMIT 100 OFFSET 0")
+            shapes.append(Shape(f"performQuery:{role}:{table}:group_by={','.join(group_cols)}", sql,
+                                agg.select_params + list(rangeParams), role, table,
+                                range_cols, group_cols))
+    return shapes
+
+
+def _filterColumns(where: str) -> List[str]:
+    """Column names referenced as target.`col` in a range filter"""
+    cols = []
+    for part in where.split("target.`")[1:]:
+        cols.append(part.split("`", 1)[0])
+    return cols
+
+
+def explain(shape: Shape) -> List[Dict]:
+    return db_query("EXPLAIN " + shape.sql, shape.params, role=shape.role, use_primary=True)
+
+
+def analyze(shape: Shape, plan: List[Dict]) -> List[Dict]:
+    """Findings for one EXPLAIN result"""
+    findings = []
+    for row in plan:
+        table = row.get("table") or ""
+        extra = row.get("Extra") or ""
+        driving = table == "target" or table == shape.table
+        if row.get("type") == "ALL" and driving:
+            findings.append({"problem": "full_scan", "table": shape.table, "rows": row.get("rows"),
+                             "suggest": _suggest(shape, include_order=False)})
+        if "Using filesort" in extra:
+            findings.append({"problem": "filesort", "table": shape.table, "rows": row.get("rows"),
+                             "suggest": _suggest(shape, include_order=True)})
+        if "Using temporary" in extra:
+            findings.append({"problem": "temporary", "table": shape.table, "rows": row.get("rows"),
+                             "suggest": None})
+    return findings
+
+
+def _suggest(shape: Shape, include_order: bool) -> Optional[str]:
+    cols = list(dict.fromkeys(shape.eq_columns + (shape.order_columns if include_order else [])))
+    if not cols:
+        return None
+    return f"INDEX ON {shape.table} ({', '.join(c if c.startswith('(') else f'`{c}`' for c in cols)})"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="EXPLAIN the API's statement shapes and report scans/filesorts")
+    parser.add_argument("--roles", help="Comma separated roles for /performQuery shapes (default: all)")
+    parser.add_argument("--skip-auth", action="store_true", help="Skip the login and session shapes")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument("--strict", action="store_true", help="Exit 1 when anything is reported")
+    parser.add_argument("--verbose", action="store_true", help="Print every plan, not only findings")
+    args = parser.parse_args(argv)
+
+    roles = [r.strip() for r in args.roles.split(",")] if args.roles else None
+    shapes = ([] if args.skip_auth else authShapes()) + performQueryShapes(roles)
+
+    report = {"meta": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "shapes": len(shapes)},
+              "shapes": []}
+    suggestions = {}
+    for shape in shapes:
+        try:
+            plan = explain(shape)
+        except Exception as e:
+            print(f"! {shape.name}: EXPLAIN failed ({e})")
+            report["shapes"].append({"name": shape.name, "error": str(e)})
+            continue
+        findings = analyze(shape, plan)
+        report["shapes"].append({"name": shape.name, "role": shape.role, "sql": shape.sql,
+                                 "plan": plan, "findings": findings})
+        if findings:
+            for f in findings:
+                print(f"✗ {shape.name}: {f['problem']} on {f['table']} (~{f['rows']} rows)"
+                      + (f" -> {f['suggest']}" if f['suggest'] else ""))
+                if f["suggest"]:
+                    suggestions.setdefault(f["suggest"], []).append(shape.name)
+        elif args.verbose:
+            keys = ", ".join(f"{r.get('table')}:{r.get('type')}/{r.get('key')}" for r in plan)
+            print(f"✓ {shape.name}: {keys}")
+
+    report["suggestions"] = suggestions
+    flagged = sum(1 for s in report["shapes"] if s.get("findings"))
+    print(f"\n[Index advisor] {len(shapes)} shape(s) explained, {flagged} with findings")
+    for index, names in suggestions.items():
+        print(f"  - {index}  ({len(names)} shape(s))")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, default=str)
+        print(f"\n[Index advisor] Report written to {args.output}")
+    return 1 if args.strict and (flagged or any("error" in s for s in report["shapes"])) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
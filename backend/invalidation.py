@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Cache invalidation shared by prefork workers
+
+The query result cache (query_cache.py) and the guardian children cache
+(guardian_children.py) live in each worker's memory. A write handled by
+one worker must also drop the other workers' entries, or they keep
+serving stale rows (or a revoked guardian's access) until the TTL runs out.
+
+With SERVER_WORKERS > 1 the supervisor calls share_between_workers() before
+forking: every name ("query_cache:grades", "guardian_children") gets a
+write counter in an anonymous shared memory map that all workers inherit.
+A cache bumps the counter when it invalidates and compares it with the
+value it last saw before trusting an entry. Names share slots by hash; a
+collision only causes an extra invalidation. In a single process the
+counters are not needed and read as 0.
+"""
+import mmap
+import struct
+import zlib
+from typing import Optional
+
+# Counter slots in the shared map
+INVALIDATION_SLOTS = 1024
+
+_COUNTER = struct.Struct('q')
+
+
+class SharedGenerations:
+    """Per-name write counters shared by the processes forked after share_between_workers()"""
+
+    def __init__(self, slots: int = INVALIDATION_SLOTS):
+        self.slots = slots
+        self._map: Optional[mmap.mmap] = None
+        self._lock = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._map is not None
+
+    def share_between_workers(self) -> None:
+        """Create the shared counters; must run in the supervisor, before fork()"""
+        if self._map is not None:
+            return
+        import multiprocessing
+        # Anonymous maps are MAP_SHARED: forked children see the same pages
+        self._map = mmap.mmap(-1, self.slots * _COUNTER.size)
+        self._lock = multiprocessing.Lock()
+
+    def _offset(self, name: str) -> int:
+        return (zlib.crc32(name.encode('utf-8')) % self.slots) * _COUNTER.size
+
+    def read(self, name: str) -> int:
+        if self._map is None:
+            return 0
+        return _COUNTER.unpack_from(self._map, self._offset(name))[0]
+
+    def bump(self, name: str) -> int:
+        """Count a write to `name` in every worker; returns the new value"""
+        if self._map is None:
+            return 0
+        offset = self._offset(name)
+        with self._lock:
+            value = _COUNTER.unpack_from(self._map, offset)[0] + 1
+            _COUNTER.pack_into(self._map, offset, value)
+        return value
+
+
+SHARED_GENERATIONS = SharedGenerations()
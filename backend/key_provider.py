@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Key provider for column encryption
+
+Holds the data encryption keys in an in-memory keyring of versioned keys,
+each identified by a key id. Request handling only reads the current keyring
+snapshot (one attribute read, no file or environment access). The keyring is
+rebuilt when its sources change:
+
+  - SIGHUP (install_signal_handler)
+  - a change to the .env file or DATA_KEYRING_FILE, noticed by a background
+    watcher polling file modification times (start_watching)
+
+Key sources:
+  - DATA_KEYRING_FILE: JSON {"active": "<key id>", "keys": {"<key id>": "<key>", ...}}
+  - otherwise DATA_ENCRYPTION_KEY (active) and DATA_ENCRYPTION_KEY_PREVIOUS,
+    from .env or the environment. Their key ids are derived from a key
+    fingerprint unless DATA_ENCRYPTION_KEY_ID / DATA_ENCRYPTION_KEY_PREVIOUS_ID
+    are set.
+
+A failed reload keeps the previous keyring.
+"""
+import hashlib
+import hmac
+import json
+import os
+import signal
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from logger_config import app_logger
+
+# Key ids are stored in every app-engine ciphertext; keep them short
+MAX_KEY_ID_LENGTH = 8
+
+# Seconds between checks of the key source files for changes
+KEYRING_WATCH_INTERVAL = float(os.getenv('KEYRING_WATCH_INTERVAL', '5'))
+
+
+def _find_env_file() -> Path:
+    """
+    Find .env file by searching from current directory up to project root
+    """
+    current = Path(__file__).resolve().parent  # backend directory
+    root = current.parent  # project root
+
+    # Try project root first
+    env_path = root / ".env"
+    if env_path.exists():
+        return env_path
+
+    # Try backend directory
+    env_path = current / ".env"
+    if env_path.exists():
+        return env_path
+
+    # Try current working directory
+    env_path = Path(".env").resolve()
+    if env_path.exists():
+        return env_path
+
+    # Return project root path (will be used by load_dotenv to search)
+    return root
+
+
+def fingerprint_key_id(key: str) -> str:
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:MAX_KEY_ID_LENGTH]
+
+
+class KeyRing:
+    """Immutable snapshot of the configured keys"""
+
+    __slots__ = ('version', 'active_id', 'keys', 'blind_index_key', 'cache')
+
+    def __init__(self, version: int, active_id: str, keys: Dict[str, str], blind_index_key: Optional[str]):
+        self.version = version
+        self.active_id = active_id
+        self.keys = dict(keys)            # key id -> key, active first
+        self.blind_index_key = blind_index_key
+        self.cache: Dict = {}             # values derived from this snapshot
+
+    @property
+    def active_key(self) -> str:
+        return self.keys[self.active_id]
+
+    def decrypt_keys(self) -> List[Tuple[str, str]]:
+        """(key id, key) pairs to try when decrypting, active key first"""
+        return list(self.keys.items())
+
+    def get(self, key_id: str) -> Optional[str]:
+        return self.keys.get(key_id)
+
+
+class KeyProvider:
+    """Loads the keyring and swaps it atomically on reload"""
+
+    def __init__(self):
+        self._ring: Optional[KeyRing] = None
+        self._lock = threading.Lock()
+        self._version = 0
+        self._mtimes: Dict[str, Optional[float]] = {}
+        self._watcher: Optional[threading.Thread] = None
+        self._listeners: List[Callable[[KeyRing], None]] = []
+
+    def ring(self) -> KeyRing:
+        ring = self._ring
+        if ring is None:
+            self.reload("initial load")
+            ring = self._ring
+        return ring
+
+    def add_listener(self, listener: Callable[[KeyRing], None]) -> None:
+        """Call listener(new_ring) after every successful reload"""
+        self._listeners.append(listener)
+
+    # ---- loading ----
+
+    def _source_files(self) -> List[Path]:
+        from dotenv import dotenv_values  # imported on first load (see startup.py)
+        env_path = _find_env_file()
+        if env_path.is_dir():
+            env_path = env_path / ".env"  # not created yet; watch for it
+        files = [env_path]
+        env_file = dotenv_values(env_path) if env_path.is_file() else {}
+        keyring_file = self._setting('DATA_KEYRING_FILE', env_file)
+        if keyring_file:
+            files.append(Path(keyring_file))
+        return files
+
+    @staticmethod
+    def _setting(name: str, env_file: Dict[str, Optional[str]]) -> str:
+        # Values in .env take precedence over the process environment (as
+        # with load_dotenv(override=True))
+        value = env_file.get(name)
+        if value is None:
+            value = os.environ.get(name, '')
+        return (value or '').strip()
+
+    def _build(self) -> KeyRing:
+        from dotenv import dotenv_values, load_dotenv
+        env_path = _find_env_file()
+        env_file = dotenv_values(env_path) if env_path.is_file() else {}
+        if self._ring is None and env_path.is_file():
+            # First load also exports .env, as getEncryptionKey always did
+            load_dotenv(dotenv_path=env_path, override=True)
+        keyring_file = self._setting('DATA_KEYRING_FILE', env_file)
+        blind_index_key = self._setting('BLIND_INDEX_KEY', env_file) or None
+
+        keys: Dict[str, str] = {}
+        if keyring_file:
+            with open(keyring_file, encoding='utf-8') as f:
+                spec = json.load(f)
+            active_id = str(spec.get('active', ''))
+            configured = {str(k): str(v) for k, v in (spec.get('keys') or {}).items() if v}
+            if active_id not in configured:
+                raise RuntimeError(f"Active key id '{active_id}' is not defined in {keyring_file}")
+            keys[active_id] = configured.pop(active_id)
+            keys.update(configured)
+        else:
+            key = self._setting('DATA_ENCRYPTION_KEY', env_file)
+            if not key:
+                raise RuntimeError(
+                    f"DATA_ENCRYPTION_KEY environment variable is required to handle encrypted columns.\n"
+                    f"Please ensure .env file exists in project root or backend directory with DATA_ENCRYPTION_KEY set.\n"
+                    f"Searched paths: {env_path}, {Path(__file__).parent / '.env'}, {Path('.env').resolve()}"
+                )
+            active_id = self._setting('DATA_ENCRYPTION_KEY_ID', env_file) or fingerprint_key_id(key)
+            keys[active_id] = key
+            previous = self._setting('DATA_ENCRYPTION_KEY_PREVIOUS', env_file)
+            if previous and previous != key:
+                keys[self._setting('DATA_ENCRYPTION_KEY_PREVIOUS_ID', env_file) or fingerprint_key_id(previous)] = previous
+
+        for key_id in keys:
+            if not key_id or len(key_id.encode('utf-8')) > MAX_KEY_ID_LENGTH:
+                raise RuntimeError(f"Key id '{key_id}' must be 1-{MAX_KEY_ID_LENGTH} bytes")
+        return KeyRing(self._version + 1, active_id, keys, blind_index_key)
+
+    def reload(self, reason: str = "manual") -> bool:
+        """
+        Rebuild the keyring from its sources
+
+        Returns:
+            True if a new keyring was installed
+        """
+        with self._lock:
+            for path in self._source_files():
+                self._mtimes[str(path)] = _mtime(path)
+            try:
+                ring = self._build()
+            except Exception as e:
+                if self._ring is None:
+                    raise
+                app_logger.error(f"Key reload failed ({reason}), keeping key version {self._ring.version}: {e}")
+                return False
+            previous = self._ring
+            self._version = ring.version
+            self._ring = ring
+        if previous is not None:
+            app_logger.info(f"Encryption keys reloaded ({reason}): active={ring.active_id}, key_ids={list(ring.keys)}")
+        for listener in self._listeners:
+            try:
+                listener(ring)
+            except Exception as e:
+                app_logger.error(f"Key reload listener failed: {e}")
+        return True
+
+    # ---- reload triggers ----
+
+    def install_signal_handler(self) -> bool:
+        """Reload on SIGHUP (main thread, POSIX only)"""
+        if not hasattr(signal, 'SIGHUP') or threading.current_thread() is not threading.main_thread():
+            return False
+        # Reload off the signal handler so it never runs inside a held lock
+        signal.signal(signal.SIGHUP, lambda signum, frame: threading.Thread(
+            target=self.reload, args=("SIGHUP",), daemon=True).start())
+        return True
+
+    def start_watching(self, interval: float = KEYRING_WATCH_INTERVAL) -> None:
+        """Poll the key source files and reload when one changes"""
+        if self._watcher is not None or interval <= 0:
+            return
+        self.ring()
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), name='keyring-watch', daemon=True)
+        self._watcher.start()
+
+    def _watch(self, interval: float) -> None:
+        while True:
+            time.sleep(interval)
+            try:
+                changed = [p for p in self._source_files() if self._mtimes.get(str(p)) != _mtime(p)]
+                if changed:
+                    self.reload(f"{changed[0].name} changed")
+            except Exception as e:
+                app_logger.error(f"Key source check failed: {e}")
+
+
+def _mtime(path: Path) -> Optional[float]:
+    try:
+        return path.stat().st_mtime
+    except OSError:
+        return None
+
+
+KEY_PROVIDER = KeyProvider()
+
+
+def derived_hmac_keys(purpose: str, override_secret: str = '') -> Tuple[bytes, ...]:
+    """
+    HMAC signing keys for one purpose (e.g. "csrf-token"), the signing key first
+
+    override_secret, when set, is the only key. Otherwise one key per keyring
+    key is derived with the purpose as label, so an HMAC never reuses an AES
+    key and tokens signed before a key rotation still validate. Cached on the
+    keyring snapshot, so a reload derives them again.
+    """
+    if override_secret:
+        return (override_secret.encode('utf-8'),)
+    ring = KEY_PROVIDER.ring()
+    cache_key = ("hmac", purpose)
+    keys = ring.cache.get(cache_key)
+    if keys is None:
+        keys = tuple(hmac.new(key.encode('utf-8'), purpose.encode('utf-8'), hashlib.sha256).digest()
+                     for _, key in ring.decrypt_keys())
+        ring.cache[cache_key] = keys
+    return keys
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Partition rotation for the log tables
+
+audit_log, accountLog and dataUpdateLog are RANGE partitioned by month on
+their timestamp (load_sql/migrations/V005). Each table has partitions
+p<YYYYMM>, one per month, followed by a catch-all pmax. This job:
+
+  1. Splits pmax so the current month and LOG_PARTITIONS_AHEAD months after
+     it have their own partition. On the first run it also creates one
+     partition per month of the rows already in pmax.
+  2. Exports every partition older than LOG_RETENTION_MONTHS to
+     <archive dir>/<table>/<table>-p<YYYYMM>.jsonl.gz, then drops it.
+     Dropping a partition is a metadata change, unlike a DELETE of the same
+     rows.
+
+Range reads filtering on the timestamp column (WHERE timestamp >= ...)
+only touch the matching partitions.
+
+Run it daily from cron as the 'maintenance' DBMS user:
+    python log_partitions.py
+    python log_partitions.py --status
+    python log_partitions.py --retention-months 6 --dry-run
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+from datetime import date
+from typing import Dict, List, Optional
+
+import pymysql
+
+from db_connector import get_db_connection
+from logger_config import LOG_DIR, app_logger
+
+# Partitioned log tables: table -> (timestamp column, partitioned via UNIX_TIMESTAMP())
+LOG_TABLES = {
+    "audit_log": ("timestamp", True),
+    "accountLog": ("timestamp", False),
+    "dataUpdateLog": ("logged_at", False),
+}
+
+# Months of log rows kept in the database
+LOG_RETENTION_MONTHS = int(os.getenv('LOG_RETENTION_MONTHS', '12'))
+
+# Future months that always have a partition of their own
+LOG_PARTITIONS_AHEAD = int(os.getenv('LOG_PARTITIONS_AHEAD', '3'))
+
+# Where dropped partitions are exported
+LOG_ARCHIVE_DIR = os.getenv('LOG_ARCHIVE_DIR', os.path.join(LOG_DIR, 'archive'))
+
+CATCH_ALL = "pmax"
+
+
+def monthStart(value) -> date:
+    return date(value.year, value.month, 1)
+
+
+def addMonths(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partitionName(month: date) -> str:
+    return f"p{month.year:04d}{month.month:02d}"
+
+
+def partitionMonth(name: str) -> Optional[date]:
+    """Month held by a p<YYYYMM> partition (None for pmax)"""
+    if len(name) != 7 or not name.startswith("p") or not name[1:].isdigit():
+        return None
+    return date(int(name[1:5]), int(name[5:7]), 1)
+
+
+class PartitionRotator:
+    def __init__(self, retention_months: int = LOG_RETENTION_MONTHS, ahead: int = LOG_PARTITIONS_AHEAD,
+                 archive_dir: Optional[str] = LOG_ARCHIVE_DIR, dry_run: bool = False, today: Optional[date] = None):
+        """
+        Args:
+            archive_dir: Export directory for dropped partitions (None: drop without export)
+        """
+        self.retention_months = max(1, retention_months)
+        self.ahead = max(0, ahead)
+        self.archive_dir = archive_dir
+        self.dry_run = dry_run
+        self.current = monthStart(today or date.today())
+
+    def _boundary(self, table: str, month: date) -> str:
+        """VALUES LESS THAN clause for the partition holding `month`"""
+        _, unix = LOG_TABLES[table]
+        upper = addMonths(month, 1).strftime("%Y-%m-%d 00:00:00")
+        return f"UNIX_TIMESTAMP('{upper}')" if unix else f"('{upper}')"
+
+    def _catchAll(self, table: str) -> str:
+        _, unix = LOG_TABLES[table]
+        return f"PARTITION {CATCH_ALL} VALUES LESS THAN " + ("MAXVALUE" if unix else "(MAXVALUE)")
+
+    def partitions(self, conn, table: str) -> List[Dict]:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT PARTITION_NAME AS name, TABLE_ROWS AS `rows` FROM information_schema.PARTITIONS "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s ORDER BY PARTITION_ORDINAL_POSITION",
+                (table,),
+            )
+            parts = cur.fetchall()
+        if not parts or parts[0]["name"] is None:
+            raise RuntimeError(f"{table} is not partitioned; apply load_sql/migrations/V005 first")
+        return parts
+
+    def ensureFuture(self, conn, table: str) -> List[str]:
+        """Split pmax into monthly partitions up to the current month + ahead"""
+        column, _ = LOG_TABLES[table]
+        months = [m for m in (partitionMonth(p["name"]) for p in self.partitions(conn, table)) if m]
+        if months:
+            start = addMonths(max(months), 1)
+        else:
+            # First run: one partition per month of the rows already in pmax
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT MIN(`{column}`) AS oldest FROM `{table}` PARTITION ({CATCH_ALL})")
+                oldest = cur.fetchone()["oldest"]
+            start = monthStart(oldest) if oldest else self.current
+        end = addMonths(self.current, self.ahead)
+        new = []
+        month = start
+        while month <= end:
+            new.append(month)
+            month = addMonths(month, 1)
+        if not new:
+            return []
+        definitions = [f"PARTITION {partitionName(m)} VALUES LESS THAN {self._boundary(table, m)}" for m in new]
+        definitions.append(self._catchAll(table))
+        sql = f"ALTER TABLE `{table}` REORGANIZE PARTITION {CATCH_ALL} INTO ({', '.join(definitions)})"
+        names = [partitionName(m) for m in new]
+        if not self.dry_run:
+            with conn.cursor() as cur:
+                cur.execute(sql)
+            app_logger.info(f"Log partitions added: table={table}, partitions={names}")
+        return names
+
+    def expired(self, conn, table: str) -> List[str]:
+        cutoff = addMonths(self.current, -self.retention_months)
+        return [p["name"] for p in self.partitions(conn, table)
+                if partitionMonth(p["name"]) and partitionMonth(p["name"]) < cutoff]
+
+    def export(self, conn, table: str, partition: str) -> Optional[str]:
+        """Write one partition to a gzip JSON Lines file; returns the file path"""
+        if not self.archive_dir:
+            return None
+        directory = os.path.join(self.archive_dir, table)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{table}-{partition}.jsonl.gz")
+        tmp = f"{path}.tmp"
+        rows = 0
+        # Unbuffered cursor: a month of logs is streamed, not held in memory
+        with conn.cursor(pymysql.cursors.SSDictCursor) as cur, gzip.open(tmp, "wt", encoding="utf-8") as out:
+            cur.execute(f"SELECT * FROM `{table}` PARTITION ({partition})")
+            for row in cur:
+                out.write(json.dumps(row, default=str, ensure_ascii=False) + "\n")
+                rows += 1
+        with open(tmp, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        app_logger.info(f"Log partition archived: table={table}, partition={partition}, rows={rows}, file={path}")
+        return path
+
+    def expire(self, conn, table: str) -> List[str]:
+        """Export and drop the partitions older than the retention period"""
+        dropped = []
+        for partition in self.expired(conn, table):
+            if self.dry_run:
+                dropped.append(partition)
+                continue
+            # Export first: a failed export leaves the partition in place
+            self.export(conn, table, partition)
+            with conn.cursor() as cur:
+                cur.execute(f"ALTER TABLE `{table}` DROP PARTITION {partition}")
+            app_logger.info(f"Log partition dropped: table={table}, partition={partition}")
+            dropped.append(partition)
+        return dropped
+
+    def rotate(self, tables: List[str]) -> bool:
+        ok = True
+        for table in tables:
+            conn = get_db_connection("maintenance")
+            try:
+                added = self.ensureFuture(conn, table)
+                dropped = self.expire(conn, table)
+                prefix = "(dry run) " if self.dry_run else ""
+                print(f"✓ {prefix}{table}: added {added or 'none'}, dropped {dropped or 'none'}")
+            except Exception as e:
+                ok = False
+                print(f"! {table}: rotation failed ({e})")
+                app_logger.error(f"Log partition rotation failed: table={table}, error={e}", exc_info=True)
+            finally:
+                conn.close()
+        return ok
+
+    def status(self, tables: List[str]) -> None:
+        for table in tables:
+            conn = get_db_connection("maintenance")
+            try:
+                parts = self.partitions(conn, table)
+                print(f"{table}:")
+                for p in parts:
+                    print(f"  {p['name']:<8} ~{p['rows']} row(s)")
+            finally:
+                conn.close()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Rotate the monthly partitions of the log tables")
+    parser.add_argument("--tables", default=",".join(LOG_TABLES),
+                        help="Comma separated tables (default: all log tables)")
+    parser.add_argument("--retention-months", type=int, default=LOG_RETENTION_MONTHS)
+    parser.add_argument("--ahead", type=int, default=LOG_PARTITIONS_AHEAD, help="Future months to pre-create")
+    parser.add_argument("--archive-dir", default=LOG_ARCHIVE_DIR)
+    parser.add_argument("--no-archive", action="store_true", help="Drop expired partitions without exporting them")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would change")
+    parser.add_argument("--status", action="store_true", help="List partitions and exit")
+    args = parser.parse_args(argv)
+
+    tables = [t.strip() for t in args.tables.split(",") if t.strip()]
+    unknown = [t for t in tables if t not in LOG_TABLES]
+    if unknown:
+        parser.error(f"Not a partitioned log table: {', '.join(unknown)}")
+
+    rotator = PartitionRotator(args.retention_months, args.ahead,
+                               None if args.no_archive else args.archive_dir, args.dry_run)
+    if args.status:
+        rotator.status(tables)
+        return 0
+    print(f"[Log partitions] tables={','.join(tables)} month={partitionName(rotator.current)} "
+          f"retention={rotator.retention_months} month(s) ahead={rotator.ahead}")
+    return 0 if rotator.rotate(tables) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
-from db_connector import get_db_connection
+from db_query import db_execute
+from metrics import timed
 
+@timed('logDataUpdate')
 def logDataUpdate(user_id, role, sql_text):
     """
     Log data update operations to log table
@@ -10,20 +12,18 @@ def logDataUpdate(user_id, role, sql_text):
         role: User role (student, guardian, aro, dro)
         sql_text: SQL statement text
     """
-    conn = get_db_connection(role)
-    try:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO dataUpdateLog (user_id, user_role, sql_text)
-                VALUES (%s, %s, %s)
-                """,
-                (user_id, role, sql_text)
-            )
-            conn.commit()
-    finally:
-        conn.close()
+    db_execute(
+        """
+        INSERT INTO dataUpdateLog (user_id, user_role, sql_text)
+        VALUES (%s, %s, %s)
+        """,
+        (user_id, role, sql_text),
+        role=role,
+        pin_session=False,
+        bounded=False,
+    )
 
+@timed('logAccountOperation')
 def logAccountOperation(ip, user_id, user_role, log_content):
     """
     Log account operations to accountLog table
@@ -37,21 +37,19 @@ def logAccountOperation(ip, user_id, user_role, log_content):
     # Use user_role for DBMS connection, default to 'auth' if None (for login operations)
     # When user_role is None, it means we're in the login phase and should use auth_user
     dbms_role = user_role if user_role else 'auth'
-    conn = get_db_connection(dbms_role)
     try:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO accountLog (ip, user_id, user_role, logContent)
-                VALUES (%s, %s, %s, %s)
-                """,
-                (ip, user_id, user_role, log_content)
-            )
-            conn.commit()
+        db_execute(
+            """
+            INSERT INTO accountLog (ip, user_id, user_role, logContent)
+            VALUES (%s, %s, %s, %s)
+            """,
+            (ip, user_id, user_role, log_content),
+            role=dbms_role,
+            pin_session=False,
+            bounded=False,
+        )
     except Exception as e:
         # Log error but don't fail the operation
         import logging
         logging.error(f"Failed to log account operation: {e}")
-    finally:
-        conn.close()
 
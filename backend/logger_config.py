@@ -4,8 +4,10 @@ Structured logging configuration module
 """
 import logging
 import os
+import pickle
 from logging.handlers import RotatingFileHandler
 from datetime import datetime
+from metrics import timed
 
 # Configure logging
 LOG_DIR = os.getenv('LOG_DIR', 'logs')
@@ -15,6 +17,31 @@ LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
 # Create log directory if it doesn't exist
 os.makedirs(LOG_DIR, exist_ok=True)
 
+# Largest forwarded record accepted by the supervisor (one datagram)
+MAX_FORWARDED_RECORD = 256 * 1024
+
+# Loggers created by setup_logger, and the forwarding handler of prefork workers
+_configured_loggers = set()
+_forward_handler = None
+
+class _ForwardHandler(logging.Handler):
+    """Sends records to the prefork supervisor, which writes the log files"""
+
+    def __init__(self, sock, worker_id):
+        super().__init__()
+        self.sock = sock
+        self.worker_id = worker_id
+
+    def emit(self, record):
+        try:
+            msg = f"[worker {self.worker_id}] {record.getMessage()}"
+            if record.exc_info:
+                msg += "\n" + logging.Formatter().formatException(record.exc_info)
+            data = dict(record.__dict__, msg=msg[:MAX_FORWARDED_RECORD // 2], args=None, exc_info=None, exc_text=None)
+            self.sock.send(pickle.dumps(data))
+        except Exception:
+            self.handleError(record)
+
 def setup_logger(name='app', log_file=LOG_FILE, level=LOG_LEVEL):
     """
     Setup structured logger with file rotation
@@ -33,6 +60,12 @@ def setup_logger(name='app', log_file=LOG_FILE, level=LOG_LEVEL):
     # Prevent duplicate handlers
     if logger.handlers:
         return logger
+    _configured_loggers.add(name)
+    
+    # Prefork worker: the supervisor owns the files
+    if _forward_handler is not None:
+        logger.addHandler(_forward_handler)
+        return logger
     
     # File handler with rotation
     # Max 10MB per file, keep 5 backup files
@@ -62,9 +95,36 @@ def setup_logger(name='app', log_file=LOG_FILE, level=LOG_LEVEL):
     
     return logger
 
+def forward_logs(sock, worker_id):
+    """
+    Send this process's log records to the prefork supervisor
+    
+    Concurrent rotation of the same files by several processes would lose
+    records, so workers only forward and the supervisor writes.
+    
+    Args:
+        sock: Datagram socket connected to the supervisor
+        worker_id: Worker number shown in every forwarded message
+    """
+    global _forward_handler
+    _forward_handler = _ForwardHandler(sock, worker_id)
+    for name in _configured_loggers:
+        logger = logging.getLogger(name)
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+        logger.addHandler(_forward_handler)
+
+def write_forwarded_log(data):
+    """Write one record received from a prefork worker (supervisor side)"""
+    record = logging.makeLogRecord(pickle.loads(data))
+    logger = setup_logger(record.name, os.path.join(LOG_DIR, f"{record.name}.log"))
+    logger.handle(record)
+
 # Create default logger
 app_logger = setup_logger('app')
 
+@timed('log_security_event')
 def log_security_event(event_type, details, user_id=None, ip_address=None):
     """
     Log security-related events
@@ -85,6 +145,7 @@ def log_security_event(event_type, details, user_id=None, ip_address=None):
     }
     security_logger.warning(f"SECURITY_EVENT: {log_data}")
 
+@timed('log_database_operation')
 def log_database_operation(operation, table, user_id, role, sql=None):
     """
     Log database operations for audit trail
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+In-process login throttling
+
+Each login attempt takes a token from two buckets, one keyed by client IP and
+one by normalized email. An attempt with either bucket empty, or with either
+key serving a backoff, is rejected with 429 before any password decryption,
+injection check, DB lookup or bcrypt work is done.
+
+Failed attempts (400/401) raise the key's failure count. Past a free
+allowance, each further failure blocks the key for twice as long as the one
+before, up to a cap. A successful login clears the email's failures. Idle
+keys forget their failures after LOGIN_THROTTLE_IDLE_RESET seconds.
+
+Keys are stored as 8-byte digests in a bounded LRU, so attacker-chosen
+emails cannot grow memory beyond LOGIN_THROTTLE_MAX_KEYS entries.
+
+LOGIN_THROTTLE_ENABLED=0 turns throttling off, for load tests that log in
+many times from one address (benchmark/api_benchmark.py). Never in production.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import metrics
+from logger_config import app_logger, log_security_event
+
+# Throttle login attempts (0 only for benchmarks)
+LOGIN_THROTTLE_ENABLED = os.getenv('LOGIN_THROTTLE_ENABLED', '1') == '1'
+
+# Per-IP bucket: burst size and refill rate (attempts per second)
+LOGIN_IP_BURST = float(os.getenv('LOGIN_IP_BURST', '20'))
+LOGIN_IP_RATE = float(os.getenv('LOGIN_IP_RATE', '0.5'))
+
+# Per-email bucket: burst size and refill rate (attempts per second)
+LOGIN_EMAIL_BURST = float(os.getenv('LOGIN_EMAIL_BURST', '5'))
+LOGIN_EMAIL_RATE = float(os.getenv('LOGIN_EMAIL_RATE', str(1 / 30)))
+
+# Failures allowed before backoff starts, per IP and per email
+LOGIN_IP_FREE_FAILURES = int(os.getenv('LOGIN_IP_FREE_FAILURES', '10'))
+LOGIN_EMAIL_FREE_FAILURES = int(os.getenv('LOGIN_EMAIL_FREE_FAILURES', '3'))
+
+# First backoff and its cap, in seconds
+LOGIN_BACKOFF_BASE = float(os.getenv('LOGIN_BACKOFF_BASE', '1'))
+LOGIN_BACKOFF_MAX = float(os.getenv('LOGIN_BACKOFF_MAX', '900'))
+
+# Seconds without attempts after which a key's failures are forgotten
+LOGIN_THROTTLE_IDLE_RESET = float(os.getenv('LOGIN_THROTTLE_IDLE_RESET', '1800'))
+
+# Keys (IPs + emails) tracked at once; least recently used are dropped
+LOGIN_THROTTLE_MAX_KEYS = int(os.getenv('LOGIN_THROTTLE_MAX_KEYS', '100000'))
+
+
+class _KeyState:
+    __slots__ = ('tokens', 'updated', 'failures', 'blocked_until')
+
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.updated = now
+        self.failures = 0
+        self.blocked_until = 0.0
+
+
+class LoginThrottle:
+    """Token buckets with progressive backoff per IP and per email"""
+
+    # Body field carrying the account identity
+    identity_field = "email"
+
+    def __init__(self, max_keys: int = LOGIN_THROTTLE_MAX_KEYS, enabled: bool = LOGIN_THROTTLE_ENABLED):
+        self.max_keys = max_keys
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._states: "OrderedDict[bytes, _KeyState]" = OrderedDict()
+        # scope -> (burst, rate, free failures)
+        self._limits = {
+            'ip': (LOGIN_IP_BURST, LOGIN_IP_RATE, LOGIN_IP_FREE_FAILURES),
+            'email': (LOGIN_EMAIL_BURST, LOGIN_EMAIL_RATE, LOGIN_EMAIL_FREE_FAILURES),
+        }
+        metrics.REGISTRY.register_gauge('login_throttle_keys', lambda: len(self._states))
+
+    @staticmethod
+    def normalize(identity) -> str:
+        return str(identity or "").strip().lower()
+
+    @staticmethod
+    def _key(scope: str, value: str) -> bytes:
+        return hashlib.blake2b(f"{scope}:{value}".encode('utf-8'), digest_size=8).digest()
+
+    def _state(self, scope: str, value: str, now: float) -> _KeyState:
+        key = self._key(scope, value)
+        burst, rate, _ = self._limits[scope]
+        state = self._states.get(key)
+        if state is None:
+            state = _KeyState(burst, now)
+            self._states[key] = state
+            while len(self._states) > self.max_keys:
+                self._states.popitem(last=False)
+        else:
+            self._states.move_to_end(key)
+            idle = now - state.updated
+            if idle > LOGIN_THROTTLE_IDLE_RESET:
+                state.failures = 0
+            state.tokens = min(burst, state.tokens + idle * rate)
+            state.updated = now
+        return state
+
+    def _keys(self, client_ip: str, identity: Optional[str]):
+        keys = [('ip', client_ip or 'unknown')]
+        email = self.normalize(identity)
+        if email:
+            keys.append(('email', email))
+        return keys
+
+    def admit(self, client_ip: str, identity: Optional[str]) -> Optional[float]:
+        """
+        Take one attempt from the IP and email buckets
+
+        Returns:
+            None if admitted, otherwise seconds until the caller may retry
+        """
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            states = [(scope, self._state(scope, value, now)) for scope, value in self._keys(client_ip, identity)]
+            wait, blocked_scope = 0.0, None
+            for scope, state in states:
+                _, rate, _ = self._limits[scope]
+                if state.blocked_until > now:
+                    scope_wait = state.blocked_until - now
+                elif state.tokens < 1:
+                    scope_wait = (1 - state.tokens) / rate if rate > 0 else LOGIN_BACKOFF_MAX
+                else:
+                    continue
+                if scope_wait > wait:
+                    wait, blocked_scope = scope_wait, scope
+            if blocked_scope is None:
+                for _, state in states:
+                    state.tokens -= 1
+        if blocked_scope is None:
+            metrics.inc('login_throttle_total', {'result': 'admitted'})
+            return None
+        metrics.inc('login_throttle_total', {'result': 'rejected', 'scope': blocked_scope})
+        return wait
+
+    def record(self, client_ip: str, identity: Optional[str], succeeded: bool) -> None:
+        """Update failure counts after an admitted attempt"""
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        entered_backoff = []
+        with self._lock:
+            for scope, value in self._keys(client_ip, identity):
+                state = self._state(scope, value, now)
+                if succeeded:
+                    if scope == 'email':
+                        state.failures = 0
+                        state.blocked_until = 0.0
+                    continue
+                state.failures += 1
+                _, _, free = self._limits[scope]
+                over = state.failures - free
+                if over > 0:
+                    backoff = min(LOGIN_BACKOFF_MAX, LOGIN_BACKOFF_BASE * (2 ** min(over - 1, 30)))
+                    state.blocked_until = max(state.blocked_until, now + backoff)
+                    if over == 1:
+                        entered_backoff.append((scope, state.failures))
+        # Log once when a key enters backoff, not on every rejection
+        for scope, failures in entered_backoff:
+            app_logger.warning(f"Login backoff started: scope={scope}, ip={client_ip}, failures={failures}")
+            log_security_event('login_throttled', {'scope': scope, 'failures': failures}, None, client_ip)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._states.clear()
+
+
+LOGIN_THROTTLE = LoginThrottle()
+if not LOGIN_THROTTLE.enabled:
+    app_logger.warning("Login throttling is disabled (LOGIN_THROTTLE_ENABLED=0)")
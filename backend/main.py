@@ -2,15 +2,120 @@
 """
 University Data API Server - Main Entry Point (HTTPS)
 """
-import ssl
-from pathlib import Path
-from http.server import HTTPServer
-from api_handler import SimpleAPIServer
-from encryption import ensureEncryptionKey
+import startup  # first, so the import phases below are timed
 
-def run(host="127.0.0.1", port=8000, cert_file="../security/cert.pem", key_file="../security/key.pem"):
+with startup.phase("import stdlib"):
+    import signal
+    import socket
+    import ssl
+    import threading
+    from pathlib import Path
+    from http.server import ThreadingHTTPServer
+with startup.phase("import api_handler"):
+    from api_handler import SimpleAPIServer
+with startup.phase("import server modules"):
+    from encryption import ensureEncryptionKey
+    from key_provider import KEY_PROVIDER
+    from privilege_controller import verifyPrivilegeSources
+    import prefork
+    from logger_config import app_logger
+
+
+class APIHTTPServer(ThreadingHTTPServer):
+    """
+    One thread per connection; admission control (admission.py) bounds the
+    work actually running at once. Prefork workers share the port through
+    SO_REUSEPORT and drain their requests before exiting.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, server_address, handler_class, reuse_port=False):
+        self.reuse_port = reuse_port
+        self._active = 0
+        self._idle = threading.Condition()
+        super().__init__(server_address, handler_class)
+
+    def server_bind(self):
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+    def process_request(self, request, client_address):
+        # Counted before the thread starts, so drain() cannot miss it
+        with self._idle:
+            self._active += 1
+        try:
+            super().process_request(request, client_address)
+        except Exception:
+            self._finished()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self._finished()
+
+    def _finished(self):
+        with self._idle:
+            self._active -= 1
+            self._idle.notify_all()
+
+    def drain(self, timeout):
+        """Wait for in-flight requests; False if some were still running"""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._active == 0, timeout)
+
+
+def build_tls_context(cert_path, key_path):
+    """Create a secure SSLContext"""
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    # Reasonable defaults: TLS1.2+ and sane ciphers
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    context.set_ciphers("ECDHE+AESGCM:ECDHE+CHACHA20:@SECLEVEL=2")
+    context.load_cert_chain(certfile=str(cert_path), keyfile=str(key_path))
+    return context
+
+
+def make_server(address, context, reuse_port=False):
+    httpd = APIHTTPServer(address, SimpleAPIServer, reuse_port=reuse_port)
+    # Wrap the server socket with TLS. The handshake runs on the connection's
+    # own thread (first read), so a slow client cannot stall accept()
+    httpd.socket = context.wrap_socket(httpd.socket, server_side=True, do_handshake_on_connect=False)
+    return httpd
+
+
+def serve_worker(address, context, worker_id, ready):
+    """Body of a prefork worker (see prefork.Supervisor)"""
+    # Threads do not survive fork(): start the key file watcher here
+    KEY_PROVIDER.start_watching()
+    # Warm up before listening: the kernel hands connections to any listening
+    # worker. If warm-up is slow (database down), listen anyway; /readyz says so
+    startup.WARMUP.start()
+    if not startup.WARMUP.wait(min(startup.WARMUP_WAIT, prefork.PREFORK_READY_TIMEOUT / 2)):
+        app_logger.warning(f"Worker {worker_id} listening before warm-up finished")
+    httpd = make_server(address, context, reuse_port=True)
+    # shutdown() must not run on the serve_forever() thread
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=httpd.shutdown, daemon=True).start())
+    ready()
+    httpd.serve_forever()
+    httpd.server_close()
+    if not httpd.drain(prefork.PREFORK_GRACEFUL_TIMEOUT):
+        app_logger.warning(f"Worker {worker_id} exiting with requests still running")
+
+
+def run(host="127.0.0.1", port=8000, cert_file="../security/cert.pem", key_file="../security/key.pem",
+        workers=prefork.SERVER_WORKERS):
     """Start HTTPS server"""
-    ensureEncryptionKey()
+    with startup.phase("load keys"):
+        ensureEncryptionKey()
+
+    # Refuse to start if the permission definitions disagree
+    with startup.phase("check privileges"):
+        mismatches = verifyPrivilegeSources()
+    if mismatches:
+        raise RuntimeError("Inconsistent role privileges:\n  " + "\n  ".join(mismatches))
 
     cert_path = Path(cert_file)
     key_path = Path(key_file)
@@ -20,18 +125,32 @@ def run(host="127.0.0.1", port=8000, cert_file="../security/cert.pem", key_file=
             "Generate them with OpenSSL or mkcert (see setup instructions)."
         )
 
-    httpd = HTTPServer((host, port), SimpleAPIServer)
+    if workers > 1:
+        if prefork.supported():
+            # Workers warm up themselves: pools and crypto threads do not survive fork()
+            print(startup.PROFILE.report())
+            # Keys and the TLS context are loaded here once and inherited by
+            # the workers; SIGHUP reloads both and replaces the workers
+            prefork.Supervisor(
+                workers, (host, port),
+                make_context=lambda: build_tls_context(cert_path, key_path),
+                serve=serve_worker,
+                on_reload=lambda: KEY_PROVIDER.reload("SIGHUP"),
+            ).run()
+            return
+        app_logger.warning("SERVER_WORKERS > 1 needs fork() and SO_REUSEPORT, serving from one process")
 
-    # Create a secure SSLContext
-    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
-    # Reasonable defaults: TLS1.2+ and sane ciphers
-    context.minimum_version = ssl.TLSVersion.TLSv1_2
-    context.set_ciphers("ECDHE+AESGCM:ECDHE+CHACHA20:@SECLEVEL=2")
-    context.load_cert_chain(certfile=str(cert_path), keyfile=str(key_path))
+    # Pick up key changes without a restart (SIGHUP or edits to the key files)
+    KEY_PROVIDER.install_signal_handler()
+    KEY_PROVIDER.start_watching()
 
-    # Wrap the server socket with TLS
-    httpd.socket = context.wrap_socket(httpd.socket, server_side=True)
+    with startup.phase("TLS context"):
+        context = build_tls_context(cert_path, key_path)
+    httpd = make_server((host, port), context)
 
+    # /healthz answers from here on, /readyz once the warm-up is done
+    startup.WARMUP.start(on_ready=print)
+    print(startup.PROFILE.report())
     print(f"Serving on https://{host}:{port}")
     httpd.serve_forever()
 
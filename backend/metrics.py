@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+"""
+In-process request metrics with Prometheus text exposition
+
+Request latency is recorded per route by a router observer. Hot-path work
+inside a request (DB round trips, bcrypt, JSON encoding, log writes) is
+recorded as named spans attributed to the route currently being served.
+Spans are inclusive: a log call that performs a DB write shows up both as
+its own span and as a db_execute span.
+"""
+import functools
+import ipaddress
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional, Tuple
+
+# Latency buckets in seconds (upper bounds, +Inf is implicit)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Networks allowed to scrape /metrics (comma separated CIDRs)
+METRICS_ALLOWED_NETWORKS = os.getenv('METRICS_ALLOWED_NETWORKS', '127.0.0.0/8,::1/128')
+
+# Route label used for spans recorded outside of a request (startup, jobs)
+NO_ROUTE = "none"
+
+# Seconds between snapshot publications of prefork workers
+METRICS_SHARE_INTERVAL = float(os.getenv('METRICS_SHARE_INTERVAL', '5'))
+
+
+class Histogram:
+    """Fixed-bucket cumulative histogram"""
+
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        idx = len(LATENCY_BUCKETS)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                idx = i
+                break
+        self.counts[idx] += 1
+        self.total += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Thread-safe store of request histograms, span histograms and counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests: Dict[str, Histogram] = {}
+        self._statuses: Dict[Tuple[str, int], int] = {}
+        self._spans: Dict[Tuple[str, str], Histogram] = {}
+        self._counters: Dict[Tuple[str, Tuple], float] = {}
+        self._gauges: Dict[Tuple[str, Tuple], object] = {}
+
+    def observe_request(self, route: str, status: Optional[int], seconds: float) -> None:
+        with self._lock:
+            hist = self._requests.get(route)
+            if hist is None:
+                hist = self._requests[route] = Histogram()
+            hist.observe(seconds)
+            key = (route, status or 0)
+            self._statuses[key] = self._statuses.get(key, 0) + 1
+
+    def observe_span(self, route: str, span: str, seconds: float) -> None:
+        key = (route, span)
+        with self._lock:
+            hist = self._spans.get(key)
+            if hist is None:
+                hist = self._spans[key] = Histogram()
+            hist.observe(seconds)
+
+    def inc(self, name: str, labels: Optional[Dict[str, str]] = None, value: float = 1) -> None:
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def register_gauge(self, name: str, callback, labels: Optional[Dict[str, str]] = None) -> None:
+        """Register a callable evaluated at scrape time"""
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self._gauges[key] = callback
+
+    def snapshot(self) -> Dict:
+        """Copy of all series, safe to render or merge outside the lock"""
+        with self._lock:
+            snap = {
+                'requests': {k: (list(h.counts), h.total, h.count) for k, h in self._requests.items()},
+                'statuses': dict(self._statuses),
+                'spans': {k: (list(h.counts), h.total, h.count) for k, h in self._spans.items()},
+                'counters': dict(self._counters),
+            }
+            gauges = dict(self._gauges)
+        # Gauge callbacks may take their own locks; evaluate them outside ours
+        snap['gauges'] = {}
+        for key, callback in gauges.items():
+            try:
+                snap['gauges'][key] = float(callback())
+            except Exception:
+                continue
+        return snap
+
+    def render(self) -> str:
+        return render_snapshot(self.snapshot())
+
+
+REGISTRY = MetricsRegistry()
+
+_current_context = None
+
+
+def _current_route() -> str:
+    global _current_context
+    if _current_context is None:
+        from router import current_context
+        _current_context = current_context
+    ctx = _current_context()
+    return ctx.route.name if ctx is not None else NO_ROUTE
+
+
+@contextmanager
+def span(name: str):
+    """Time a block of hot-path work and attribute it to the current route"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        REGISTRY.observe_span(_current_route(), name, time.perf_counter() - start)
+
+
+def timed(name: str):
+    """Decorator form of span()"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                REGISTRY.observe_span(_current_route(), name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def observe_route(route, ctx, elapsed: float) -> None:
+    """Router observer recording per-route latency and status"""
+    REGISTRY.observe_request(route.name, ctx.status, elapsed)
+
+
+def inc(name: str, labels: Optional[Dict[str, str]] = None, value: float = 1) -> None:
+    REGISTRY.inc(name, labels, value)
+
+
+# =========================
+# Prefork workers
+# =========================
+
+# (directory, worker id) once share_snapshots() was called
+_shared: Optional[Tuple[str, str]] = None
+
+# Counters of exited workers, kept so the summed series never go backwards
+RETIRED_SNAPSHOT = "retired.json"
+
+# Exited worker pids remembered in the retired snapshot
+_RETIRED_PIDS_KEPT = 256
+
+
+def _to_json(value):
+    return [_to_json(v) for v in value] if isinstance(value, (tuple, list)) else value
+
+
+def _from_json(value):
+    return tuple(_from_json(v) for v in value) if isinstance(value, list) else value
+
+
+def _snapshot_path(directory: str, pid: int) -> str:
+    # Per process, not per slot: a replacement and the worker it replaces
+    # run side by side during a rolling restart
+    return os.path.join(directory, f"worker-{pid}.json")
+
+
+def _write_snapshot(path: str, snap: Dict, **extra) -> None:
+    data = dict(extra, series={section: [[_to_json(k), _to_json(v)] for k, v in series.items()]
+                               for section, series in snap.items()})
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(path + ".tmp", path)
+
+
+def _load_snapshot(path: str) -> Tuple[Dict, Dict]:
+    """(extra fields, snapshot) of a snapshot file"""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    series = data.pop("series")
+    return data, {section: {_from_json(k): _from_json(v) for k, v in items} for section, items in series.items()}
+
+
+def _publish() -> None:
+    directory, worker = _shared
+    _write_snapshot(_snapshot_path(directory, os.getpid()), REGISTRY.snapshot(), worker=worker)
+
+
+def _publish_loop(interval: float) -> None:
+    while True:
+        time.sleep(interval)
+        try:
+            _publish()
+        except OSError:
+            continue
+
+
+def share_snapshots(directory: str, worker_id, interval: float = METRICS_SHARE_INTERVAL) -> None:
+    """
+    Publish this process's snapshot for the other prefork workers
+
+    After this, render() serves the sum of all workers' series (gauges get
+    worker and pid labels), whichever worker the scrape lands on.
+    """
+    global _shared
+    _shared = (directory, str(worker_id))
+    threading.Thread(target=_publish_loop, args=(interval,), name='metrics-share', daemon=True).start()
+
+
+def publish_final() -> None:
+    """Publish the last snapshot of a worker that is about to exit"""
+    if _shared is None:
+        return
+    try:
+        _publish()
+    except OSError:
+        pass
+
+
+def retire_snapshot(directory: str, pid: int) -> None:
+    """
+    Fold an exited worker's counters into the retained totals (supervisor)
+
+    Without this the summed counters drop when a worker exits, and
+    Prometheus rate() reads the drop as a reset. A worker that was killed
+    keeps the counts of its last publication.
+    """
+    path = _snapshot_path(directory, pid)
+    try:
+        extra, snap = _load_snapshot(path)
+    except FileNotFoundError:
+        return
+    except (OSError, ValueError, KeyError):
+        os.remove(path)
+        return
+    retired_path = os.path.join(directory, RETIRED_SNAPSHOT)
+    try:
+        retired_extra, retired = _load_snapshot(retired_path)
+    except (OSError, ValueError, KeyError):
+        retired_extra, retired = {}, {}
+    merged = merge_snapshots([("retired", retired), (extra.get("worker", "?"), snap)])
+    merged['gauges'] = {}
+    pids = (retired_extra.get("pids", []) + [pid])[-_RETIRED_PIDS_KEPT:]
+    # Written before the worker's file is removed; render() skips folded pids
+    _write_snapshot(retired_path, merged, pids=pids)
+    os.remove(path)
+
+
+def merge_snapshots(snaps) -> Dict:
+    """Sum (gauge labels, snapshot) pairs into one snapshot"""
+    merged = {'requests': {}, 'statuses': {}, 'spans': {}, 'counters': {}, 'gauges': {}}
+    for gauge_labels, snap in snaps:
+        if not isinstance(gauge_labels, tuple):
+            gauge_labels = (('worker', gauge_labels),)
+        for section in ('requests', 'spans'):
+            for key, (counts, total, count) in snap.get(section, {}).items():
+                cur = merged[section].get(key)
+                if cur is not None:
+                    counts = [a + b for a, b in zip(cur[0], counts)]
+                    total += cur[1]
+                    count += cur[2]
+                merged[section][key] = (list(counts), total, count)
+        for section in ('statuses', 'counters'):
+            for key, value in snap.get(section, {}).items():
+                merged[section][key] = merged[section].get(key, 0) + value
+        for (name, labels), value in snap.get('gauges', {}).items():
+            merged['gauges'][(name, tuple(sorted(labels + gauge_labels)))] = value
+    return merged
+
+
+def render() -> str:
+    """Prometheus text of this process, or of all prefork workers"""
+    if _shared is None:
+        return REGISTRY.render()
+    directory, worker = _shared
+    own_pid = os.getpid()
+    snaps = [(own_pid, (('pid', own_pid), ('worker', worker)), REGISTRY.snapshot())]
+    for name in sorted(os.listdir(directory)):
+        if not (name.startswith("worker-") and name.endswith(".json")):
+            continue
+        try:
+            pid = int(name[len("worker-"):-len(".json")])
+        except ValueError:
+            continue
+        if pid == own_pid:
+            continue
+        try:
+            extra, snap = _load_snapshot(os.path.join(directory, name))
+        except (OSError, ValueError, KeyError):
+            continue  # Being replaced, retired, or from a worker that just started
+        snaps.append((pid, (('pid', pid), ('worker', extra.get("worker", "?"))), snap))
+    # Read after the worker files: a pid listed here was folded in before its file went away
+    try:
+        retired_extra, retired = _load_snapshot(os.path.join(directory, RETIRED_SNAPSHOT))
+    except (OSError, ValueError, KeyError):
+        retired_extra, retired = {}, {}
+    folded = set(retired_extra.get("pids", []))
+    merged = merge_snapshots([(labels, snap) for pid, labels, snap in snaps if pid not in folded]
+                             + [((), retired)])
+    return render_snapshot(merged)
+
+
+def _parse_networks(spec: str):
+    networks = []
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            networks.append(ipaddress.ip_network(item, strict=False))
+        except ValueError:
+            pass
+    return tuple(networks)
+
+
+_ALLOWED_NETWORKS = _parse_networks(METRICS_ALLOWED_NETWORKS)
+
+
+def is_scrape_allowed(client_ip: str) -> bool:
+    """Check whether a client may read /metrics"""
+    try:
+        addr = ipaddress.ip_address(client_ip)
+    except ValueError:
+        return False
+    return any(addr in net for net in _ALLOWED_NETWORKS if net.version == addr.version)
+
+
+# =========================
+# Prometheus text format
+# =========================
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(pairs: Iterable[Tuple[str, object]]) -> str:
+    body = ','.join(f'{k}="{_escape(v)}"' for k, v in pairs)
+    return '{' + body + '}' if body else ''
+
+
+def _number(value) -> str:
+    # Exact: ':g' keeps 6 significant digits, so large counters stop moving
+    value = float(value)
+    if value.is_integer():
+        return str(int(value))
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(value)
+
+
+def _render_histogram(lines, name, labels, counts, total, count):
+    cumulative = 0
+    for bound, n in zip(LATENCY_BUCKETS, counts):
+        cumulative += n
+        lines.append(f"{name}_bucket{_labels(labels + [('le', bound)])} {cumulative}")
+    lines.append(f"{name}_bucket{_labels(labels + [('le', '+Inf')])} {count}")
+    lines.append(f"{name}_sum{_labels(labels)} {total:.6f}")
+    lines.append(f"{name}_count{_labels(labels)} {count}")
+
+
+def render_snapshot(snap: Dict) -> str:
+    lines = []
+
+    lines.append("# HELP api_request_duration_seconds Request latency per route")
+    lines.append("# TYPE api_request_duration_seconds histogram")
+    for route, (counts, total, count) in sorted(snap['requests'].items()):
+        _render_histogram(lines, "api_request_duration_seconds", [('route', route)], counts, total, count)
+
+    lines.append("# HELP api_requests_total Requests per route and status code")
+    lines.append("# TYPE api_requests_total counter")
+    for (route, status), n in sorted(snap['statuses'].items()):
+        lines.append(f"api_requests_total{_labels([('route', route), ('status', status)])} {n}")
+
+    lines.append("# HELP api_span_duration_seconds Hot-path span latency per route")
+    lines.append("# TYPE api_span_duration_seconds histogram")
+    for (route, name), (counts, total, count) in sorted(snap['spans'].items()):
+        _render_histogram(lines, "api_span_duration_seconds", [('route', route), ('span', name)], counts, total, count)
+
+    typed = set()
+    for (name, labels), value in sorted(snap['counters'].items()):
+        if name not in typed:
+            lines.append(f"# TYPE {name} counter")
+            typed.add(name)
+        lines.append(f"{name}{_labels(list(labels))} {_number(value)}")
+
+    for (name, labels), value in sorted(snap['gauges'].items()):
+        if name not in typed:
+            lines.append(f"# TYPE {name} gauge")
+            typed.add(name)
+        lines.append(f"{name}{_labels(list(labels))} {_number(value)}")
+
+    return "\n".join(lines) + "\n"
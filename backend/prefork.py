@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Pre-fork supervisor for the API server (SERVER_WORKERS > 1)
+
+One Python process serves requests on one core at a time (GIL), however
+many threads it runs. With SERVER_WORKERS > 1, main.run() starts this
+supervisor instead. It loads the keys and builds the TLS context once,
+then forks the workers. Each worker listens on the same port through its
+own SO_REUSEPORT socket, so the kernel spreads new connections across
+workers.
+
+The supervisor:
+  - restarts a worker that dies, waiting longer each time a worker dies
+    right after starting
+  - on SIGHUP, reloads the keys and the certificate and replaces the
+    workers one at a time (a new worker is listening before the old one is
+    told to finish its requests and exit)
+  - on SIGTERM / SIGINT, lets every worker finish its requests, then exits
+  - writes all workers' log records to the log files
+    (logger_config.forward_logs)
+  - has /metrics served as the sum of all workers (metrics.share_snapshots)
+  - shares cache invalidations between the workers (invalidation.py)
+"""
+import os
+import select
+import shutil
+import signal
+import socket
+import tempfile
+import time
+import traceback
+from typing import Callable, Dict, Optional, Tuple
+
+import metrics
+from invalidation import SHARED_GENERATIONS
+from logger_config import app_logger, forward_logs, write_forwarded_log, MAX_FORWARDED_RECORD
+
+# Worker processes (1 keeps the single-process server)
+SERVER_WORKERS = int(os.getenv('SERVER_WORKERS', '1'))
+
+# Seconds a worker may take to finish its requests after SIGTERM
+PREFORK_GRACEFUL_TIMEOUT = float(os.getenv('PREFORK_GRACEFUL_TIMEOUT', '30'))
+
+# Seconds a new worker may take to start listening
+PREFORK_READY_TIMEOUT = float(os.getenv('PREFORK_READY_TIMEOUT', '10'))
+
+# A worker dying within this many seconds of its start counts as a crash loop
+PREFORK_MIN_UPTIME = 5.0
+
+# Restart delay bounds for crash-looping workers (doubles per crash)
+PREFORK_RESTART_DELAY = 1.0
+PREFORK_MAX_RESTART_DELAY = 30.0
+
+
+def supported() -> bool:
+    """Pre-forking needs fork() and SO_REUSEPORT (not available on Windows)"""
+    return hasattr(os, 'fork') and hasattr(socket, 'SO_REUSEPORT')
+
+
+class _Worker:
+    __slots__ = ('slot', 'pid', 'started', 'respawn', 'retiring')
+
+    def __init__(self, slot: int, pid: int, respawn: bool):
+        self.slot = slot
+        self.pid = pid
+        self.started = time.monotonic()
+        self.respawn = respawn      # restart the slot if this worker dies
+        self.retiring = False
+
+
+class Supervisor:
+    def __init__(self, workers: int, address: Tuple[str, int], make_context: Callable,
+                 serve: Callable, on_reload: Optional[Callable[[], None]] = None):
+        """
+        Args:
+            workers: Number of worker processes
+            address: (host, port) the workers listen on
+            make_context: Builds the TLS context (in the supervisor, again on SIGHUP)
+            serve: serve(address, context, worker_id, ready) runs a worker;
+                it calls ready() once listening and returns after SIGTERM
+            on_reload: Called in the supervisor on SIGHUP before workers are replaced
+        """
+        self.workers = workers
+        self.address = address
+        self.make_context = make_context
+        self.serve = serve
+        self.on_reload = on_reload
+        self.context = None
+        self._children: Dict[int, _Worker] = {}
+        self._restart_at: Dict[int, float] = {}      # slot -> monotonic time
+        self._restart_delay: Dict[int, float] = {}   # slot -> next crash delay
+        self._stopping = False
+        self._reload_requested = False
+        self._state_dir: Optional[str] = None
+        self._log_sock = None        # worker end of the log socket pair
+        self._collector = None       # supervisor end
+
+    # ---- supervisor ----
+
+    def run(self) -> None:
+        self.context = self.make_context()
+        reserved = self._reserve_port()
+        self._state_dir = tempfile.mkdtemp(prefix='api-prefork-')
+        self._collector, self._log_sock = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        # Before the first fork, so every worker (and every replacement) shares it
+        SHARED_GENERATIONS.share_between_workers()
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+        signal.signal(signal.SIGHUP, self._request_reload)
+        try:
+            print(f"Serving on https://{self.address[0]}:{self.address[1]} with {self.workers} workers")
+            for slot in range(self.workers):
+                self._spawn(slot, replace=True)
+            while not self._stopping:
+                self._pump(0.5)
+                if self._reload_requested:
+                    self._reload_requested = False
+                    self._rolling_restart()
+                self._restart_due()
+        finally:
+            self._shutdown()
+            reserved.close()
+            self._collector.close()
+            self._log_sock.close()
+            shutil.rmtree(self._state_dir, ignore_errors=True)
+
+    def _reserve_port(self) -> socket.socket:
+        # Bound but never listening: fails fast if the port is taken and
+        # keeps it reserved between worker restarts, without taking connections
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(self.address)
+        return sock
+
+    def _request_stop(self, signum, frame) -> None:
+        self._stopping = True
+
+    def _request_reload(self, signum, frame) -> None:
+        self._reload_requested = True
+
+    def _pump(self, timeout: float, ready_fd: Optional[int] = None) -> bool:
+        """
+        Write forwarded log records and reap exited workers for up to `timeout`
+
+        Returns:
+            True as soon as ready_fd becomes readable
+        """
+        end = time.monotonic() + timeout
+        while True:
+            fds = [self._collector] + ([ready_fd] if ready_fd is not None else [])
+            readable, _, _ = select.select(fds, [], [], max(0.0, min(0.5, end - time.monotonic())))
+            if self._collector in readable:
+                self._drain_logs()
+            self._reap()
+            if ready_fd is not None and ready_fd in readable:
+                return True
+            if time.monotonic() >= end or (self._stopping and ready_fd is None):
+                return False
+
+    def _drain_logs(self) -> None:
+        while True:
+            try:
+                data = self._collector.recv(MAX_FORWARDED_RECORD, socket.MSG_DONTWAIT)
+            except BlockingIOError:
+                return
+            try:
+                write_forwarded_log(data)
+            except Exception as e:
+                app_logger.error(f"Dropped a forwarded log record: {e}")
+
+    def _reap(self) -> None:
+        while self._children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            worker = self._children.pop(pid, None)
+            metrics.retire_snapshot(self._state_dir, pid)
+            if worker is None or not worker.respawn or self._stopping:
+                continue
+            app_logger.error(f"Worker {worker.slot} (pid {pid}) died with status {status}")
+            self._schedule_restart(worker)
+
+    def _schedule_restart(self, worker: _Worker) -> None:
+        uptime = time.monotonic() - worker.started
+        delay = self._restart_delay.get(worker.slot, PREFORK_RESTART_DELAY) if uptime < PREFORK_MIN_UPTIME else 0.0
+        self._restart_delay[worker.slot] = min(PREFORK_MAX_RESTART_DELAY, max(PREFORK_RESTART_DELAY, delay * 2))
+        self._restart_at[worker.slot] = time.monotonic() + delay
+        app_logger.info(f"Restarting worker {worker.slot} in {delay:.0f}s")
+
+    def _restart_due(self) -> None:
+        now = time.monotonic()
+        for slot, due in list(self._restart_at.items()):
+            if now >= due:
+                del self._restart_at[slot]
+                self._spawn(slot, replace=True)
+
+    def _spawn(self, slot: int, replace: bool = False) -> Optional[_Worker]:
+        """
+        Fork a worker and wait until it listens
+
+        Args:
+            replace: The slot has no running worker; retry later if this one fails
+
+        Returns:
+            The worker, None if it did not start listening
+        """
+        ready_r, ready_w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready_r)
+            code = 1
+            try:
+                self._worker_main(slot, ready_w)
+                code = 0
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                os._exit(code)
+        os.close(ready_w)
+        # A replacement that fails to start leaves the old worker in place
+        worker = _Worker(slot, pid, respawn=replace)
+        self._children[pid] = worker
+        try:
+            ready = self._pump(PREFORK_READY_TIMEOUT, ready_r) and os.read(ready_r, 1) == b'1'
+        finally:
+            os.close(ready_r)
+        if not ready:
+            app_logger.error(f"Worker {slot} (pid {pid}) did not start listening")
+            if pid in self._children:
+                # Hung rather than crashed (a crash was already rescheduled by _reap)
+                self._retire([worker])
+                if replace:
+                    self._schedule_restart(worker)
+            return None
+        worker.respawn = True
+        app_logger.info(f"Worker {slot} started: pid={pid}")
+        return worker
+
+    def _rolling_restart(self) -> None:
+        app_logger.info("SIGHUP: reloading and replacing workers one at a time")
+        if self.on_reload:
+            self.on_reload()
+        try:
+            self.context = self.make_context()
+        except Exception as e:
+            app_logger.error(f"TLS context reload failed, keeping the current certificate: {e}")
+        for old in [w for w in self._children.values() if not w.retiring]:
+            if self._stopping:
+                return
+            if self._spawn(old.slot) is None:
+                app_logger.error("Rolling restart aborted, remaining workers keep running")
+                return
+            self._retire([old])
+
+    def _retire(self, workers) -> None:
+        """SIGTERM workers, wait for them to drain, SIGKILL the stragglers"""
+        for worker in workers:
+            worker.retiring = True
+            worker.respawn = False
+            try:
+                os.kill(worker.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        end = time.monotonic() + PREFORK_GRACEFUL_TIMEOUT
+        while any(w.pid in self._children for w in workers) and time.monotonic() < end:
+            self._pump(0.1)
+        for worker in workers:
+            if worker.pid in self._children:
+                app_logger.warning(f"Worker {worker.slot} (pid {worker.pid}) did not exit, killing it")
+                try:
+                    os.kill(worker.pid, signal.SIGKILL)
+                    os.waitpid(worker.pid, 0)
+                except (ProcessLookupError, ChildProcessError):
+                    pass
+                self._children.pop(worker.pid, None)
+                metrics.retire_snapshot(self._state_dir, worker.pid)
+
+    def _shutdown(self) -> None:
+        self._stopping = True
+        self._retire(list(self._children.values()))
+        self._drain_logs()
+
+    # ---- worker ----
+
+    def _worker_main(self, slot: int, ready_fd: int) -> None:
+        # The supervisor coordinates reloads and Ctrl-C for the whole group
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        self._collector.close()
+        forward_logs(self._log_sock, slot)
+        metrics.share_snapshots(self._state_dir, slot)
+
+        def ready():
+            os.write(ready_fd, b'1')
+            os.close(ready_fd)
+
+        try:
+            self.serve(self.address, self.context, slot, ready)
+        finally:
+            # Counted into the supervisor's retained totals once reaped
+            metrics.publish_final()
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+Server-side prepared statements over PyMySQL connections
+
+PyMySQL only speaks the text protocol. This module adds COM_STMT_PREPARE /
+COM_STMT_EXECUTE / COM_STMT_CLOSE on top of its packet layer, so a
+statement shape (the SQL text with %s placeholders) is parsed and planned
+by MySQL once per connection and then executed with binary parameters and
+binary result rows.
+
+Each pooled connection keeps an LRU of its prepared statements
+(StatementCache, DB_PREPARED_CACHE_SIZE entries); evicted statements are
+closed on the server. Results match what a PyMySQL DictCursor returns for
+the same statement (dict rows, bytes for binary columns, datetime/date/
+timedelta/Decimal values).
+
+Prepared statements are opt-in (DB_PREPARED_STATEMENTS=1) and only used on
+pooled connections (DB_POOL_SIZE > 0, see db_pool.py): on a connection that
+is closed after one statement, PREPARE + EXECUTE costs more than a text
+query. Statements MySQL cannot prepare fall back to the text protocol.
+"""
+import datetime
+import decimal
+import os
+import struct
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import metrics
+
+# Set to 1 to run statements on pooled connections as prepared statements
+DB_PREPARED_STATEMENTS = os.getenv('DB_PREPARED_STATEMENTS', '0') == '1'
+
+# Prepared statements kept per connection
+DB_PREPARED_CACHE_SIZE = int(os.getenv('DB_PREPARED_CACHE_SIZE', '64'))
+
+# Statement kinds worth preparing (others always use the text protocol)
+PREPARABLE_PREFIXES = ('select', 'insert', 'update', 'delete')
+
+# MySQL: "This command is not supported in the prepared statement protocol yet"
+ER_UNSUPPORTED_PS = 1295
+
+# Charset number of binary strings (BLOB / VARBINARY / AES_ENCRYPT output)
+BINARY_CHARSET = 63
+
+# pymysql (which imports cryptography) is loaded on the first prepared
+# statement, not at import (see startup.py); _load_protocol() binds these
+err = COMMAND = FIELD_TYPE = FLAG = FieldDescriptorPacket = OKPacketWrapper = None
+_STRING_TYPES = frozenset()
+_INT_FORMATS: Dict[int, Tuple[str, str, int]] = {}
+
+
+def _load_protocol() -> None:
+    global err, COMMAND, FIELD_TYPE, FLAG, FieldDescriptorPacket, OKPacketWrapper, _STRING_TYPES, _INT_FORMATS
+    if OKPacketWrapper is not None:
+        return
+    from pymysql import err
+    from pymysql.constants import COMMAND, FIELD_TYPE, FLAG
+    from pymysql.protocol import FieldDescriptorPacket
+    _STRING_TYPES = frozenset((
+        FIELD_TYPE.VARCHAR, FIELD_TYPE.VAR_STRING, FIELD_TYPE.STRING, FIELD_TYPE.ENUM,
+        FIELD_TYPE.TINY_BLOB, FIELD_TYPE.MEDIUM_BLOB, FIELD_TYPE.LONG_BLOB, FIELD_TYPE.BLOB,
+        FIELD_TYPE.GEOMETRY,
+    ))
+    _INT_FORMATS = {
+        FIELD_TYPE.TINY: ('<b', '<B', 1),
+        FIELD_TYPE.SHORT: ('<h', '<H', 2),
+        FIELD_TYPE.YEAR: ('<h', '<H', 2),
+        FIELD_TYPE.INT24: ('<i', '<I', 4),
+        FIELD_TYPE.LONG: ('<i', '<I', 4),
+        FIELD_TYPE.LONGLONG: ('<q', '<Q', 8),
+    }
+    from pymysql.protocol import OKPacketWrapper  # last: marks the module as loaded
+
+
+def to_placeholders(sql: str) -> Optional[str]:
+    """
+    Rewrite PyMySQL %s placeholders as ? markers (and %% as %)
+
+    PyMySQL formats the whole string, quoted literals included, so %% is
+    unescaped everywhere. Returns None when the statement cannot be prepared
+    (a %s inside a quoted literal, or any other % directive).
+    """
+    out = []
+    quote = None
+    i, n = 0, len(sql)
+    while i < n:
+        ch = sql[i]
+        if ch == '%':
+            nxt = sql[i + 1] if i + 1 < n else ''
+            if nxt == '%':
+                out.append('%')
+            elif nxt == 's' and quote is None:
+                out.append('?')
+            else:
+                return None
+            i += 2
+            continue
+        out.append(ch)
+        if quote:
+            if ch == quote:
+                quote = None
+            elif ch == '\\' and quote != '`' and i + 1 < n and sql[i + 1] != '%':
+                out.append(sql[i + 1])
+                i += 1
+        elif ch in ("'", '"', '`'):
+            quote = ch
+        i += 1
+    return ''.join(out)
+
+
+def is_preparable(sql: str, params) -> bool:
+    if params is not None and not isinstance(params, (list, tuple)):
+        return False
+    return sql.lstrip()[:6].lower().startswith(PREPARABLE_PREFIXES)
+
+
+class PreparedStatement:
+    __slots__ = ('stmt_id', 'param_count', 'column_count')
+
+    def __init__(self, stmt_id: int, param_count: int, column_count: int):
+        self.stmt_id = stmt_id
+        self.param_count = param_count
+        self.column_count = column_count
+
+
+class StatementCache:
+    """LRU of SQL shape -> PreparedStatement for one connection"""
+
+    def __init__(self, max_size: int = DB_PREPARED_CACHE_SIZE):
+        self.max_size = max(1, max_size)
+        self._statements: "OrderedDict[str, Optional[PreparedStatement]]" = OrderedDict()
+        self.prepared = 0
+        self.hits = 0
+
+    def get(self, conn, sql: str) -> Optional[PreparedStatement]:
+        """Prepared statement for sql, preparing it on first use (None: not preparable)"""
+        if sql in self._statements:
+            self._statements.move_to_end(sql)
+            self.hits += 1
+            metrics.inc('db_prepared_statements_total', {'result': 'hit'})
+            return self._statements[sql]
+        marked = to_placeholders(sql)
+        stmt = None
+        if marked is not None:
+            _load_protocol()
+            try:
+                stmt = _prepare(conn, marked)
+                self.prepared += 1
+            except err.MySQLError as e:
+                if not e.args or e.args[0] != ER_UNSUPPORTED_PS:
+                    raise
+        metrics.inc('db_prepared_statements_total', {'result': 'prepared' if stmt else 'unsupported'})
+        self._statements[sql] = stmt
+        while len(self._statements) > self.max_size:
+            _, evicted = self._statements.popitem(last=False)
+            if evicted is not None:
+                _close(conn, evicted)
+        return stmt
+
+    def __len__(self) -> int:
+        return len(self._statements)
+
+
+def statement_cache(conn) -> StatementCache:
+    """The connection's statement cache (created on first use)"""
+    cache = getattr(conn, '_statement_cache', None)
+    if cache is None:
+        cache = StatementCache()
+        conn._statement_cache = cache
+    return cache
+
+
+def run(conn, sql: str, params=None, prepare: bool = DB_PREPARED_STATEMENTS) -> Tuple[List[Dict], int]:
+    """
+    Run one statement on conn
+
+    Args:
+        sql: Statement with PyMySQL %s placeholders
+        prepare: Use a (cached) prepared statement when the statement allows it
+
+    Returns:
+        (rows, affected row count)
+    """
+    if prepare and is_preparable(sql, params):
+        stmt = statement_cache(conn).get(conn, sql)
+        if stmt is not None:
+            return execute(conn, stmt, params)
+    with conn.cursor() as cur:
+        cur.execute(sql, params or ())
+        return cur.fetchall(), cur.rowcount
+
+
+def _prepare(conn, sql: str) -> PreparedStatement:
+    conn._execute_command(COMMAND.COM_STMT_PREPARE, sql)
+    first = conn._read_packet()
+    first.read_uint8()  # status (0x00)
+    stmt_id = first.read_uint32()
+    column_count = first.read_uint16()
+    param_count = first.read_uint16()
+    # Parameter and column definitions (sent again with each result set)
+    for count in (param_count, column_count):
+        if count:
+            for _ in range(count):
+                conn._read_packet()
+            conn._read_packet()  # EOF
+    return PreparedStatement(stmt_id, param_count, column_count)
+
+
+def _close(conn, stmt: PreparedStatement) -> None:
+    # COM_STMT_CLOSE has no response
+    conn._execute_command(COMMAND.COM_STMT_CLOSE, struct.pack('<I', stmt.stmt_id))
+
+
+def _lenenc(length: int) -> bytes:
+    if length < 251:
+        return bytes((length,))
+    if length < 1 << 16:
+        return b'\xfc' + struct.pack('<H', length)
+    if length < 1 << 24:
+        return b'\xfd' + struct.pack('<I', length)[:3]
+    return b'\xfe' + struct.pack('<Q', length)
+
+
+def _encode_params(conn, params: Sequence) -> bytes:
+    count = len(params)
+    null_bitmap = bytearray((count + 7) // 8)
+    types = bytearray()
+    values = bytearray()
+    for i, value in enumerate(params):
+        if value is None:
+            null_bitmap[i // 8] |= 1 << (i % 8)
+            types += bytes((FIELD_TYPE.NULL, 0))
+            continue
+        if isinstance(value, bool):
+            value = int(value)
+        if isinstance(value, int) and -(1 << 63) <= value < (1 << 63):
+            types += bytes((FIELD_TYPE.LONGLONG, 0))
+            values += struct.pack('<q', value)
+        elif isinstance(value, float):
+            types += bytes((FIELD_TYPE.DOUBLE, 0))
+            values += struct.pack('<d', value)
+        else:
+            if isinstance(value, (bytes, bytearray, memoryview)):
+                data = bytes(value)
+                types += bytes((FIELD_TYPE.BLOB, 0))
+            else:
+                # str, Decimal, date/datetime, ...: sent as text, converted by MySQL
+                data = str(value).encode(conn.encoding)
+                types += bytes((FIELD_TYPE.VAR_STRING, 0))
+            values += _lenenc(len(data)) + data
+    return bytes(null_bitmap) + b'\x01' + bytes(types) + bytes(values)
+
+
+def _decode_value(packet, field, encoding: str):
+    type_code = field.type_code
+    fmt = _INT_FORMATS.get(type_code)
+    if fmt is not None:
+        signed, unsigned, size = fmt
+        return struct.unpack(unsigned if field.flags & FLAG.UNSIGNED else signed, packet.read(size))[0]
+    if type_code == FIELD_TYPE.DOUBLE:
+        return struct.unpack('<d', packet.read(8))[0]
+    if type_code == FIELD_TYPE.FLOAT:
+        return struct.unpack('<f', packet.read(4))[0]
+    if type_code in (FIELD_TYPE.DATE, FIELD_TYPE.DATETIME, FIELD_TYPE.TIMESTAMP):
+        length = packet.read_uint8()
+        if length == 0:
+            return None  # zero date
+        year, month, day = struct.unpack('<HBB', packet.read(4))
+        hour = minute = second = micro = 0
+        if length >= 7:
+            hour, minute, second = struct.unpack('<BBB', packet.read(3))
+        if length >= 11:
+            micro = packet.read_uint32()
+        if type_code == FIELD_TYPE.DATE:
+            return datetime.date(year, month, day)
+        return datetime.datetime(year, month, day, hour, minute, second, micro)
+    if type_code == FIELD_TYPE.TIME:
+        length = packet.read_uint8()
+        if length == 0:
+            return datetime.timedelta(0)
+        negative, days, hours, minutes, seconds = struct.unpack('<BIBBB', packet.read(8))
+        micro = packet.read_uint32() if length >= 12 else 0
+        delta = datetime.timedelta(days=days, hours=hours, minutes=minutes, seconds=seconds, microseconds=micro)
+        return -delta if negative else delta
+    data = packet.read_length_coded_string()
+    if data is None:
+        return None
+    if type_code in (FIELD_TYPE.DECIMAL, FIELD_TYPE.NEWDECIMAL):
+        return decimal.Decimal(data.decode('ascii'))
+    if type_code == FIELD_TYPE.JSON:
+        return data.decode(encoding)
+    if type_code == FIELD_TYPE.SET:
+        text = data.decode(encoding)
+        return set(text.split(',')) if text else set()
+    if type_code in _STRING_TYPES and field.charsetnr != BINARY_CHARSET:
+        return data.decode(encoding)
+    return data  # binary strings, BIT
+
+
+def execute(conn, stmt: PreparedStatement, params: Sequence) -> Tuple[List[Dict], int]:
+    """
+    Run a prepared statement
+
+    Returns:
+        (rows as dicts, affected row count); rows is empty for statements
+        without a result set
+    """
+    _load_protocol()
+    params = tuple(params or ())
+    if len(params) != stmt.param_count:
+        raise err.ProgrammingError(f"Statement takes {stmt.param_count} parameter(s), {len(params)} given")
+    # stmt id, flags (no cursor), iteration count
+    packet = struct.pack('<IBI', stmt.stmt_id, 0, 1)
+    if params:
+        packet += _encode_params(conn, params)
+    conn._execute_command(COMMAND.COM_STMT_EXECUTE, packet)
+
+    first = conn._read_packet()
+    if first.is_ok_packet():
+        ok = OKPacketWrapper(first)
+        conn.insert_id = ok.insert_id
+        return [], ok.affected_rows
+
+    column_count = first.read_length_encoded_integer()
+    fields = [conn._read_packet(FieldDescriptorPacket) for _ in range(column_count)]
+    conn._read_packet()  # EOF
+    names = []
+    for field in fields:
+        # Same keys as DictCursor: duplicate names are qualified by table
+        names.append(f"{field.table_name}.{field.name}" if field.name in names else field.name)
+    bitmap_size = (column_count + 7 + 2) // 8
+    encoding = conn.encoding
+    rows = []
+    while True:
+        packet = conn._read_packet()
+        if packet.is_eof_packet():
+            break
+        packet.advance(1)  # row header (0x00)
+        null_bitmap = packet.read(bitmap_size)
+        row = {}
+        for i, field in enumerate(fields):
+            bit = i + 2  # the first two bits are reserved
+            if null_bitmap[bit // 8] & (1 << (bit % 8)):
+                row[names[i]] = None
+            else:
+                row[names[i]] = _decode_value(packet, field, encoding)
+        rows.append(row)
+    return rows, len(rows)
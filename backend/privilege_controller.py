@@ -1,4 +1,8 @@
 #!/usr/bin/env python3
+from types import MappingProxyType
+
+from encryption import isBlindIndexColumn
+from guardian_children import GUARDIAN_CHILDREN
 
 # =========================
 # Simple auth and role logic
@@ -48,14 +52,14 @@ RolePrivileges = {
         },
         "grades": {
             "read": True, 
-            "range": "self",
+            "range": "children", # rows of students whose GuaID is this guardian
             "insert": False,
             "update": [], # no update allowed
             "delete": False
         },
         "disciplinary_records": {
             "read": True, 
-            "range": "self",
+            "range": "children",
             "insert": [], # no insert allowed
             "update": [], # no update allowed
             "delete": False
@@ -158,12 +162,11 @@ def buildRangeFilter(auth, table_name, currentTableName="target"):
     whereSql = ""
     params = []
 
-    role_priv = RolePrivileges.get(role, {})
-    table_priv = role_priv.get(table_name)
+    table_priv = getTablePrivileges(role, table_name)
     if table_priv is None:
         return [], "", []
 
-    rng = (table_priv.get("range") or "").lower()
+    rng = table_priv.range
 
     # "All" range means no filtering (full access) - used by admin roles
     if rng == "all":
@@ -172,12 +175,13 @@ def buildRangeFilter(auth, table_name, currentTableName="target"):
     def restrict_eq(col, val):
         return f"{currentTableName}.`{col}` = %s", [val]
 
-    def join_and_restrict_student_guardian(stuId_col="StuID", guaId_col="GuaID"):
-        j = "s_guard"
-        joinSql.append(
-            f"INNER JOIN `students` {j} ON {currentTableName}.`{stuId_col}` = {j}.`StuID`"
-        )
-        return f"{j}.`{guaId_col}` = %s", [personId]
+    def restrict_children(stuId_col="StuID"):
+        # Cached StuID list -> IN (...) on the indexed StuID column
+        children = GUARDIAN_CHILDREN.get(personId)
+        if not children:
+            return "1 = 0", []
+        placeholders = ", ".join(["%s"] * len(children))
+        return f"{currentTableName}.`{stuId_col}` IN ({placeholders})", list(children)
 
     if role == "student":
         if rng == "self":
@@ -188,11 +192,15 @@ def buildRangeFilter(auth, table_name, currentTableName="target"):
         if rng == "self" and table_name == "guardians":
             whereSql, params = restrict_eq("GuaID", personId)
         elif rng == "children" and table_name in ("grades", "disciplinary_records"):
-            whereSql, params = join_and_restrict_student_guardian()
+            whereSql, params = restrict_children()
 
     return joinSql, whereSql, params
 
 def retrieveReadableColumns(table_priv, available_columns):
+    if isinstance(table_priv, TablePrivileges):
+        return set(table_priv.readable_columns(available_columns))
+    # Blind index companions of encrypted columns are internal, never readable
+    available_columns = [col for col in available_columns if not isBlindIndexColumn(col)]
     read_perm = table_priv.get("read")
     if read_perm is True:
         return set(available_columns)
@@ -204,4 +212,108 @@ def retrieveReadableColumns(table_priv, available_columns):
             if key in lowermap:
                 allowed.add(lowermap[key])
         return allowed
-    return set()
\ No newline at end of file
+    return set()
+
+
+# =========================
+# Compiled privilege matrix
+# =========================
+# RolePrivileges / ROLE_TABLES are compiled once at import into frozen
+# per-(role, table) objects so request handling only does dict/set lookups.
+
+class TablePrivileges:
+    """Frozen privileges of one role on one table"""
+
+    __slots__ = ("role", "table", "read_all", "read_columns", "range",
+                 "insert_columns", "insert_set", "update_columns", "can_delete", "_readable")
+
+    def __init__(self, role, table, spec):
+        read_perm = spec.get("read")
+        set_ = object.__setattr__
+        set_(self, "role", role)
+        set_(self, "table", table)
+        set_(self, "read_all", read_perm is True)
+        set_(self, "read_columns", frozenset(
+            str(c).lower() for c in read_perm) if isinstance(read_perm, (list, tuple, set)) else frozenset())
+        set_(self, "range", (spec.get("range") or "").lower())
+        set_(self, "insert_columns", tuple(spec.get("insert") or ()))
+        set_(self, "insert_set", frozenset(self.insert_columns))
+        set_(self, "update_columns", frozenset(spec.get("update") or ()))
+        set_(self, "can_delete", spec.get("delete") is True)
+        # available column tuple -> (readable columns, lowercase name map)
+        set_(self, "_readable", {})
+
+    def __setattr__(self, name, value):
+        raise AttributeError("TablePrivileges is read-only")
+
+    def _resolve(self, available_columns):
+        key = tuple(available_columns)
+        cached = self._readable.get(key)
+        if cached is None:
+            readable = tuple(
+                col for col in key
+                if not isBlindIndexColumn(col) and (self.read_all or col.lower() in self.read_columns)
+            )
+            cached = (readable, MappingProxyType({col.lower(): col for col in readable}))
+            self._readable[key] = cached
+        return cached
+
+    def readable_columns(self, available_columns):
+        """Readable columns in table order (memoized per column list)"""
+        return self._resolve(available_columns)[0]
+
+    def column_lookup(self, available_columns):
+        """Lowercase name -> actual name for the readable columns"""
+        return self._resolve(available_columns)[1]
+
+    def can_update(self, columns):
+        return bool(columns) and bool(self.update_columns) and all(c in self.update_columns for c in columns)
+
+    def insert_matches(self, columns):
+        return set(columns) == self.insert_set
+
+
+PRIVILEGE_MATRIX = MappingProxyType({
+    (role, table): TablePrivileges(role, table, spec)
+    for role, tables in RolePrivileges.items()
+    for table, spec in tables.items()
+})
+
+ROLE_TABLE_SETS = MappingProxyType({role: frozenset(tables) for role, tables in ROLE_TABLES.items()})
+
+
+def getTablePrivileges(role, table):
+    """Compiled privileges for (role, table), or None if the role has none"""
+    return PRIVILEGE_MATRIX.get((role, table))
+
+
+def isTableAllowed(role, table):
+    return table in ROLE_TABLE_SETS.get(role, ())
+
+
+def verifyPrivilegeSources():
+    """
+    Check that ROLE_TABLES, RolePrivileges and security_monitor.ROLE_PERMISSIONS agree
+
+    Returns:
+        List of human readable mismatches (empty if consistent)
+    """
+    from security_monitor import ROLE_PERMISSIONS
+    problems = []
+    for role in sorted(VALID_ROLES):
+        privileged = {t for (r, t) in PRIVILEGE_MATRIX if r == role}
+        visible = set(ROLE_TABLE_SETS.get(role, ()))
+        if visible != privileged:
+            problems.append(f"{role}: ROLE_TABLES {sorted(visible)} != RolePrivileges {sorted(privileged)}")
+        derived = {
+            "read": visible,
+            "write": {t for t in privileged
+                      if PRIVILEGE_MATRIX[(role, t)].update_columns or PRIVILEGE_MATRIX[(role, t)].insert_columns},
+            "delete": {t for t in privileged if PRIVILEGE_MATRIX[(role, t)].can_delete},
+        }
+        monitor = ROLE_PERMISSIONS.get(role, {})
+        for action, tables in derived.items():
+            declared = {t.lower() for t in monitor.get(action, [])}
+            if "*" not in declared and declared != tables:
+                problems.append(f"{role}/{action}: RolePrivileges {sorted(tables)} != ROLE_PERMISSIONS {sorted(declared)}")
+    return problems
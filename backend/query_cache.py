@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Result cache for self-service reads
+
+Caches /performQuery results for roles that mostly re-read their own small,
+rarely changing rows (student and guardian by default). Entries are keyed by
+role, final SQL and bound parameters. Memory use is capped by a byte budget
+with LRU eviction.
+
+Each entry records the tables its SQL reads (the target table, FK join tables
+and range-filter joins). A write through /data/* bumps the table's generation
+and drops every entry that depends on that table. Results computed while a
+write was in flight are not stored. With prefork workers the invalidation
+reaches every worker's cache (invalidation.py). Misses that will be cached are read from
+the primary, so a lagging replica cannot refill an entry with pre-write rows.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import metrics
+from invalidation import SHARED_GENERATIONS
+
+# Roles whose query results are cached
+QUERY_CACHE_ROLES = frozenset(
+    r.strip() for r in os.getenv('QUERY_CACHE_ROLES', 'student,guardian').split(',') if r.strip()
+)
+
+# Memory budget for cached results (bytes, estimated)
+QUERY_CACHE_MAX_BYTES = int(os.getenv('QUERY_CACHE_MAX_BYTES', str(16 * 1024 * 1024)))
+
+# Upper bound on entry age; covers writes made outside this process
+QUERY_CACHE_TTL = float(os.getenv('QUERY_CACHE_TTL', '300'))
+
+# Results larger than this fraction of the budget are not cached
+_MAX_ENTRY_FRACTION = 0.1
+
+
+def estimate_size(rows: List[Dict]) -> int:
+    """Rough memory footprint of a result set"""
+    size = 64
+    for row in rows:
+        size += 64
+        for key, value in row.items():
+            size += 48 + len(key)
+            if isinstance(value, (str, bytes)):
+                size += len(value)
+            else:
+                size += 16
+    return size
+
+
+class _Entry:
+    __slots__ = ('rows', 'size', 'tables', 'table', 'expires_at')
+
+    def __init__(self, rows, size, tables, table, expires_at):
+        self.rows = rows
+        self.size = size
+        self.tables = tables
+        self.table = table
+        self.expires_at = expires_at
+
+
+class QueryCache:
+    """Byte-bounded LRU cache of query results with per-table invalidation"""
+
+    def __init__(self, max_bytes: int = QUERY_CACHE_MAX_BYTES, ttl: float = QUERY_CACHE_TTL,
+                 roles: Iterable[str] = QUERY_CACHE_ROLES):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.roles = frozenset(roles)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._by_table: Dict[str, set] = {}
+        self._generations: Dict[str, int] = {}
+        self._seen: Dict[str, int] = {}   # table -> shared write counter last applied
+        self._bytes = 0
+        metrics.REGISTRY.register_gauge('query_cache_bytes', lambda: self._bytes)
+        metrics.REGISTRY.register_gauge('query_cache_entries', lambda: len(self._entries))
+
+    def enabled_for(self, role: Optional[str]) -> bool:
+        return self.max_bytes > 0 and role in self.roles
+
+    @staticmethod
+    def make_key(role: str, sql: str, params: Iterable) -> str:
+        """Cache key from role, SQL and parameters (hashed; params may hold key material)"""
+        digest = hashlib.sha256()
+        digest.update(role.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(sql.encode('utf-8'))
+        for param in params:
+            digest.update(b'\0')
+            digest.update(repr(param).encode('utf-8'))
+        return digest.hexdigest()
+
+    def generation(self, tables: Iterable[str]) -> Tuple:
+        """Snapshot of table generations, taken before running the query"""
+        with self._lock:
+            self._sync(tables)
+            return tuple(self._generations.get(t, 0) for t in sorted(tables))
+
+    def get(self, key: str, table: str) -> Optional[List[Dict]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._sync(entry.tables)
+                entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self._count(table, 'misses')
+                return None
+            self._entries.move_to_end(key)
+            self._count(table, 'hits')
+            return entry.rows
+
+    def put(self, key: str, table: str, tables: Iterable[str], rows: List[Dict], generation: Tuple) -> bool:
+        """
+        Store a result unless one of its tables was written since `generation`
+
+        Returns:
+            True if the result was cached
+        """
+        tables = frozenset(tables)
+        size = estimate_size(rows)
+        if size > self.max_bytes * _MAX_ENTRY_FRACTION:
+            return False
+        with self._lock:
+            self._sync(tables)
+            if tuple(self._generations.get(t, 0) for t in sorted(tables)) != generation:
+                return False
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(rows, size, tables, table, time.monotonic() + self.ttl)
+            self._bytes += size
+            for t in tables:
+                self._by_table.setdefault(t, set()).add(key)
+            while self._bytes > self.max_bytes and self._entries:
+                oldest_key, oldest = next(iter(self._entries.items()))
+                self._remove(oldest_key)
+                self._count(oldest.table, 'evictions')
+            return True
+
+    def invalidate(self, table: str) -> int:
+        """Drop every entry that reads `table`, in every worker; returns the number dropped here"""
+        with self._lock:
+            dropped = self._drop_table(table)
+            self._seen[table] = SHARED_GENERATIONS.bump(f"query_cache:{table}")
+            return dropped
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_table.clear()
+            self._bytes = 0
+
+    def _sync(self, tables: Iterable[str]) -> None:
+        """Apply invalidations made by other workers (caller holds the lock)"""
+        if not SHARED_GENERATIONS.enabled:
+            return
+        for table in tables:
+            shared = SHARED_GENERATIONS.read(f"query_cache:{table}")
+            if shared != self._seen.get(table, 0):
+                self._seen[table] = shared
+                self._drop_table(table)
+
+    def _drop_table(self, table: str) -> int:
+        self._generations[table] = self._generations.get(table, 0) + 1
+        keys = self._by_table.pop(table, set())
+        for key in keys:
+            self._remove(key)
+        if keys:
+            self._count(table, 'invalidations', len(keys))
+        return len(keys)
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= entry.size
+        for t in entry.tables:
+            keys = self._by_table.get(t)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_table[t]
+
+    def _count(self, table: str, event: str, n: int = 1) -> None:
+        # Per-table hit rate on /metrics: rate() of the hits over hits + misses
+        metrics.inc('query_cache_events_total', {'table': table, 'event': event}, n)
+
+
+QUERY_CACHE = QueryCache()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Online re-encryption and key rotation for ENCRYPTED_COLUMNS
+
+Walks each table in primary-key order, one short transaction per batch, so
+locks are held for milliseconds rather than for a whole-table UPDATE. Each
+value is decrypted locally with the previous or current key and rewritten
+with the current key in the target format:
+
+    sql - MySQL AES_ENCRYPT compatible (ENCRYPTION_ENGINE=sql)
+    app - AES-GCM envelope (ENCRYPTION_ENGINE=app, see column_crypto.py)
+
+Blind index columns are recomputed in the same UPDATE. Progress is written to
+a JSON checkpoint after every batch; re-running the command resumes where it
+stopped. Tables are processed in parallel.
+
+Key rotation:
+    1. Make the new key active and keep the old one in the keyring
+       (DATA_ENCRYPTION_KEY / DATA_ENCRYPTION_KEY_PREVIOUS, or DATA_KEYRING_FILE);
+       the API reloads keys without a restart and reads fall back to the old key
+    2. python reencrypt.py --batch-size 500 --throttle 0.05
+    3. Remove the old key from the keyring
+
+Runs as the 'maintenance' DBMS user (load_sql/migrations/V002).
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+from column_crypto import ColumnCipher, decrypt_text, get_cipher
+from db_connector import get_db_connection
+from encryption import (
+    KEY_PROVIDER,
+    ENCRYPTED_COLUMNS,
+    ENCRYPTION_ENGINE,
+    getBlindIndexColumn,
+    computeBlindIndex,
+)
+from logger_config import app_logger
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_CHECKPOINT = "reencrypt_checkpoint.json"
+
+
+def keyFingerprint(key: str) -> str:
+    """Short non-reversible id of a key, stored in the checkpoint"""
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:12]
+
+
+class Checkpoint:
+    """Per-table progress persisted as JSON (atomic replace on every save)"""
+
+    def __init__(self, path: str, target: str):
+        self.path = path
+        self.target = target
+        self._lock = threading.Lock()
+        self.tables: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                state = json.load(f)
+            if state.get("target") == target:
+                self.tables = state.get("tables", {})
+            else:
+                print(f"! Checkpoint {path} is for a different key/format, starting over")
+
+    def get(self, table: str) -> Dict:
+        with self._lock:
+            return dict(self.tables.get(table) or {"last_pk": None, "rows": 0, "skipped": 0, "done": False})
+
+    def update(self, table: str, state: Dict) -> None:
+        with self._lock:
+            self.tables[table] = state
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"target": self.target, "tables": self.tables}, f, indent=2)
+            os.replace(tmp, self.path)
+
+
+class Reencryptor:
+    def __init__(self, keys: List[Tuple[str, str]], engine: str,
+                 batch_size: int, throttle: float, checkpoint: Checkpoint, dry_run: bool = False):
+        """
+        Args:
+            keys: (key id, key) pairs from the keyring, active key first
+        """
+        self.engine = engine
+        self.batch_size = batch_size
+        self.throttle = throttle
+        self.checkpoint = checkpoint
+        self.dry_run = dry_run
+        # Try the current key first: rows already rewritten (by this tool or
+        # by the API during the rotation) must not be decrypted with the old one
+        self.read_ciphers: List[ColumnCipher] = [get_cipher(key, key_id) for key_id, key in keys]
+        self.cipher: ColumnCipher = self.read_ciphers[0]
+
+    def encrypt(self, table: str, column: str, plaintext: str) -> bytes:
+        if self.engine == "app":
+            return self.cipher.encrypt(table, column, plaintext)
+        return self.cipher.encrypt_legacy(plaintext)
+
+    def _primaryKey(self, conn, table: str) -> str:
+        with conn.cursor() as cur:
+            cur.execute(f"SHOW KEYS FROM `{table}` WHERE Key_name = 'PRIMARY'")
+            return cur.fetchone()["Column_name"]
+
+    def _save(self, table: str, state: Dict) -> None:
+        # A dry run rewrites nothing, so it must not mark progress either
+        if not self.dry_run:
+            self.checkpoint.update(table, state)
+
+    def processTable(self, table: str) -> Dict:
+        state = self.checkpoint.get(table)
+        if state.get("done"):
+            print(f"= {table}: already done ({state['rows']} row(s))")
+            return state
+        columns = list(ENCRYPTED_COLUMNS[table].keys())
+        conn = get_db_connection("maintenance")
+        try:
+            conn.autocommit(False)
+            pk = self._primaryKey(conn, table)
+            select_cols = ", ".join(f"`{c}`" for c in columns)
+            while True:
+                where, params = "", []
+                if state["last_pk"] is not None:
+                    where, params = f"WHERE `{pk}` > %s", [state["last_pk"]]
+                with conn.cursor() as cur:
+                    cur.execute(
+                        f"SELECT `{pk}` AS pk, {select_cols} FROM `{table}` {where} "
+                        f"ORDER BY `{pk}` LIMIT {self.batch_size} FOR UPDATE",
+                        params,
+                    )
+                    rows = cur.fetchall()
+                    if not rows:
+                        conn.commit()
+                        break
+                    updates, skipped = self._rewriteBatch(table, pk, columns, rows)
+                    if updates and not self.dry_run:
+                        for sql, values in updates.items():
+                            cur.executemany(sql, values)
+                if self.dry_run:
+                    conn.rollback()
+                else:
+                    conn.commit()
+                state["last_pk"] = rows[-1]["pk"]
+                state["rows"] += len(rows)
+                state["skipped"] += skipped
+                self._save(table, state)
+                if self.throttle:
+                    time.sleep(self.throttle)
+            state["done"] = True
+            self._save(table, state)
+            print(f"✓ {table}: {state['rows']} row(s) processed, {state['skipped']} undecryptable value(s) left as is")
+            return state
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def _rewriteBatch(self, table: str, pk: str, columns: List[str], rows: List[Dict]):
+        """Build per-statement parameter lists for one batch"""
+        updates: Dict[str, List] = {}
+        skipped = 0
+        for row in rows:
+            assignments, values = [], []
+            for column in columns:
+                blob = row[column]
+                if blob is None or blob == b"":
+                    continue
+                plaintext = decrypt_text(table, column, blob, self.read_ciphers)
+                if plaintext is None:
+                    skipped += 1
+                    app_logger.warning(f"Re-encryption skipped undecryptable value: table={table}, column={column}, pk={row['pk']}")
+                    continue
+                assignments.append(f"`{column}` = %s")
+                values.append(self.encrypt(table, column, plaintext))
+                bidx_col = getBlindIndexColumn(table, column)
+                if bidx_col:
+                    assignments.append(f"`{bidx_col}` = %s")
+                    values.append(computeBlindIndex(table, column, plaintext))
+            if assignments:
+                # Group rows with the same column set so each group is one executemany
+                sql = f"UPDATE `{table}` SET {', '.join(assignments)} WHERE `{pk}` = %s"
+                updates.setdefault(sql, []).append(tuple(values) + (row["pk"],))
+        return updates, skipped
+
+    def run(self, tables: List[str], parallel: int) -> bool:
+        ok = True
+        with ThreadPoolExecutor(max_workers=max(1, parallel)) as pool:
+            futures = {table: pool.submit(self.processTable, table) for table in tables}
+            for table, future in futures.items():
+                try:
+                    future.result()
+                except Exception as e:
+                    ok = False
+                    print(f"! {table}: failed ({e}); re-run to resume from the checkpoint")
+                    app_logger.error(f"Re-encryption failed: table={table}, error={e}", exc_info=True)
+        return ok
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Re-encrypt encrypted columns in primary-key batches")
+    parser.add_argument("--tables", default=",".join(ENCRYPTED_COLUMNS),
+                        help="Comma separated tables (default: all with encrypted columns)")
+    parser.add_argument("--engine", choices=("sql", "app"), default=ENCRYPTION_ENGINE if ENCRYPTION_ENGINE in ("sql", "app") else "sql",
+                        help="Target ciphertext format (default: ENCRYPTION_ENGINE)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--throttle", type=float, default=0.0, help="Seconds to sleep between batches")
+    parser.add_argument("--parallel", type=int, default=2, help="Tables processed concurrently")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT)
+    parser.add_argument("--dry-run", action="store_true", help="Decrypt and rewrite in a rolled-back transaction (checkpoint not written)")
+    args = parser.parse_args(argv)
+
+    tables = [t.strip() for t in args.tables.split(",") if t.strip()]
+    unknown = [t for t in tables if t not in ENCRYPTED_COLUMNS]
+    if unknown:
+        parser.error(f"No encrypted columns configured for: {', '.join(unknown)}")
+
+    ring = KEY_PROVIDER.ring()
+    target = f"{args.engine}:{ring.active_id}:{keyFingerprint(ring.active_key)}"
+    checkpoint = Checkpoint(args.checkpoint, target)
+    print(f"[Re-encrypt] tables={','.join(tables)} target={target} "
+          f"key_ids={','.join(ring.keys)} batch={args.batch_size}")
+
+    tool = Reencryptor(ring.decrypt_keys(), args.engine, max(1, args.batch_size), args.throttle, checkpoint, args.dry_run)
+    return 0 if tool.run(tables, args.parallel) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Read/write splitting for database traffic
+
+Read-only statements issued through db_query are routed to a pool of replica
+endpoints (DB_REPLICAS="host:port,host:port"). A background thread checks each
+replica's health and replication lag and excludes replicas that are down or
+lagging more than DB_REPLICA_MAX_LAG seconds.
+
+Writes always go to the primary. After a session writes, its reads stay on the
+primary for DB_READ_AFTER_WRITE_WINDOW seconds so it always sees its own writes.
+With no replicas configured every statement goes to the primary, as before.
+"""
+import itertools
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from logger_config import app_logger
+import metrics
+
+# Comma separated replica endpoints, e.g. "127.0.0.1:3308,127.0.0.1:3309"
+DB_REPLICAS = os.getenv('DB_REPLICAS', '')
+
+# Replicas lagging more than this many seconds are excluded
+REPLICA_MAX_LAG = float(os.getenv('DB_REPLICA_MAX_LAG', '5'))
+
+# Seconds between replica health checks
+REPLICA_CHECK_INTERVAL = float(os.getenv('DB_REPLICA_CHECK_INTERVAL', '5'))
+
+# Reads stay on the primary for this long after the same session writes
+READ_AFTER_WRITE_WINDOW = float(os.getenv('DB_READ_AFTER_WRITE_WINDOW', '10'))
+
+# Credentials used for health checks (needs REPLICATION CLIENT for lag)
+REPLICA_MONITOR_USER = os.getenv('DB_REPLICA_MONITOR_USER', 'auth_user')
+REPLICA_MONITOR_PASSWORD = os.getenv('DB_REPLICA_MONITOR_PASSWORD', 'auth_user_password')
+
+# Statement prefixes that never modify data
+_READ_PREFIXES = ('select', 'show', 'describe', 'desc ', 'explain', '(select', 'with')
+
+
+def is_read_only(sql: str) -> bool:
+    """Check whether a statement is safe to run on a replica"""
+    head = sql.lstrip()[:10].lower()
+    if not head.startswith(_READ_PREFIXES):
+        return False
+    # SELECT ... FOR UPDATE / LOCK IN SHARE MODE must run on the primary
+    tail = sql[-40:].lower()
+    return 'for update' not in tail and 'share mode' not in tail
+
+
+def _parse_endpoints(spec: str) -> List[Tuple[str, int]]:
+    endpoints = []
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        host, _, port = item.rpartition(':')
+        if not host:
+            host, port = item, '3306'
+        try:
+            endpoints.append((host, int(port)))
+        except ValueError:
+            app_logger.warning(f"Ignoring invalid replica endpoint: {item}")
+    return endpoints
+
+
+class ReplicaEndpoint:
+    """Health state of a single replica"""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.healthy = False
+        self.lag: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.checked_at = 0.0
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self.host, self.port
+
+    def __repr__(self):
+        return f"{self.host}:{self.port}"
+
+
+class ReplicaRouter:
+    """Chooses the endpoint for each read and tracks read-after-write pinning"""
+
+    def __init__(self, endpoints: List[Tuple[str, int]]):
+        self.replicas = [ReplicaEndpoint(host, port) for host, port in endpoints]
+        self._lock = threading.Lock()
+        self._rr = itertools.count()
+        self._recent_writes: Dict[str, float] = {}
+        self._monitor: Optional[threading.Thread] = None
+        self._lag_privilege_warned = False
+        for replica in self.replicas:
+            metrics.REGISTRY.register_gauge(
+                'db_replica_healthy', lambda r=replica: 1 if r.healthy else 0, {'replica': repr(replica)})
+            metrics.REGISTRY.register_gauge(
+                'db_replica_lag_seconds', lambda r=replica: r.lag if r.lag is not None else -1, {'replica': repr(replica)})
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.replicas)
+
+    def start(self) -> None:
+        """Run one synchronous check, then keep checking in the background"""
+        if not self.enabled or self._monitor is not None:
+            return
+        with self._lock:
+            if self._monitor is not None:
+                return
+            self._monitor = threading.Thread(target=self._monitor_loop, name='replica-monitor', daemon=True)
+        self.check_all()
+        self._monitor.start()
+
+    def _monitor_loop(self) -> None:
+        while True:
+            time.sleep(REPLICA_CHECK_INTERVAL)
+            self.check_all()
+
+    def check_all(self) -> None:
+        for replica in self.replicas:
+            self.check(replica)
+        self._prune_writes()
+
+    def check(self, replica: ReplicaEndpoint) -> None:
+        """Probe a replica and update its health and lag"""
+        import pymysql
+        try:
+            conn = pymysql.connect(
+                host=replica.host, port=replica.port,
+                user=REPLICA_MONITOR_USER, password=REPLICA_MONITOR_PASSWORD,
+                connect_timeout=2, read_timeout=2,
+                cursorclass=pymysql.cursors.DictCursor, autocommit=True,
+            )
+        except Exception as e:
+            self._set_state(replica, False, None, f"connect failed: {e}")
+            return
+        try:
+            with conn.cursor() as cur:
+                lag, reason = self._read_lag(cur)
+            if reason:
+                self._set_state(replica, False, None, reason)
+            elif lag is not None and lag > REPLICA_MAX_LAG:
+                self._set_state(replica, False, lag, f"lag {lag:.0f}s exceeds {REPLICA_MAX_LAG:.0f}s")
+            else:
+                self._set_state(replica, True, lag, None)
+        except Exception as e:
+            self._set_state(replica, False, None, f"health check failed: {e}")
+        finally:
+            conn.close()
+
+    def _read_lag(self, cur) -> Tuple[Optional[float], Optional[str]]:
+        """Return (lag_seconds, exclusion_reason) from the replica status"""
+        import pymysql
+        try:
+            try:
+                cur.execute("SHOW REPLICA STATUS")
+            except pymysql.err.ProgrammingError:
+                cur.execute("SHOW SLAVE STATUS")  # MySQL < 8.0.22
+            status = cur.fetchone()
+        except pymysql.err.OperationalError as e:
+            # Missing REPLICATION CLIENT: fall back to liveness only
+            if not self._lag_privilege_warned:
+                app_logger.warning(f"Cannot read replica lag ({e}); grant REPLICATION CLIENT to {REPLICA_MONITOR_USER}")
+                self._lag_privilege_warned = True
+            cur.execute("SELECT 1")
+            return None, None
+        if not status:
+            return None, "replication is not configured"
+        running = (status.get('Replica_SQL_Running') or status.get('Slave_SQL_Running')) == 'Yes'
+        lag = status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+        if not running or lag is None:
+            return None, "replication is not running"
+        return float(lag), None
+
+    def _set_state(self, replica: ReplicaEndpoint, healthy: bool, lag: Optional[float], error: Optional[str]) -> None:
+        if replica.healthy != healthy:
+            if healthy:
+                app_logger.info(f"Replica {replica} is back in rotation (lag={lag})")
+            else:
+                app_logger.warning(f"Replica {replica} excluded from rotation: {error}")
+        replica.healthy = healthy
+        replica.lag = lag
+        replica.last_error = error
+        replica.checked_at = time.time()
+
+    def mark_failed(self, address: Tuple[str, int], error: Exception) -> None:
+        """Take a replica out of rotation after a failed query until the next check"""
+        for replica in self.replicas:
+            if replica.address == address:
+                self._set_state(replica, False, replica.lag, f"query failed: {error}")
+
+    def record_write(self, session_key: Optional[str]) -> None:
+        """Pin a session's reads to the primary for the read-after-write window"""
+        if not self.enabled or not session_key:
+            return
+        with self._lock:
+            self._recent_writes[session_key] = time.monotonic() + READ_AFTER_WRITE_WINDOW
+
+    def _prune_writes(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            expired = [k for k, until in self._recent_writes.items() if until <= now]
+            for key in expired:
+                del self._recent_writes[key]
+
+    def pick_read_endpoint(self, session_key: Optional[str]) -> Optional[Tuple[str, int]]:
+        """
+        Choose a replica for a read
+
+        Returns:
+            (host, port) of a healthy replica, or None to use the primary
+        """
+        if not self.enabled:
+            return None
+        self.start()
+        if session_key:
+            until = self._recent_writes.get(session_key)
+            if until is not None and until > time.monotonic():
+                metrics.inc('db_reads_total', {'target': 'primary', 'reason': 'read_after_write'})
+                return None
+        healthy = [r for r in self.replicas if r.healthy]
+        if not healthy:
+            metrics.inc('db_reads_total', {'target': 'primary', 'reason': 'no_healthy_replica'})
+            return None
+        replica = healthy[next(self._rr) % len(healthy)]
+        metrics.inc('db_reads_total', {'target': 'replica', 'reason': 'routed'})
+        return replica.address
+
+
+READ_ROUTER = ReplicaRouter(_parse_endpoints(DB_REPLICAS))
+
+
+def current_session_key() -> Optional[str]:
+    """Identify the caller of the request being served, for read-after-write pinning"""
+    from router import current_context
+    ctx = current_context()
+    if ctx is None:
+        return None
+    token = ctx.bearer_token()
+    if token:
+        return token
+    if ctx.auth:
+        return f"{ctx.auth.get('role')}:{ctx.auth.get('personId')}"
+    return None
@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""
+Declarative request router for SimpleAPIServer
+
+Routes are registered once at import time as (method, path) -> handler entries.
+Each route carries its own options (auth, body limit, audit label, ...) and the
+middleware chain for it is compiled when the route is registered, so dispatch is
+a single dict lookup followed by a pre-built call chain.
+"""
+import math
+import time
+import threading
+import traceback
+import urllib.parse
+from typing import Callable, Dict, List, Optional, Tuple
+
+from admission import ADMISSION
+from communicator import RequestBodyTooLarge, json_response, text_response, read_json
+from crypto_pool import CryptoPoolBusy
+from deadline import REQUEST_DEADLINE, DeadlineExceeded, ClientDisconnected
+from logger_config import app_logger, log_security_event
+
+# Default request body limit (matches the historical read_json limit)
+DEFAULT_MAX_BODY = 10 * 1024 * 1024  # 10MB
+
+# Per-thread pointer to the request being served (used by lower layers that
+# want request-scoped information without threading it through every call)
+_local = threading.local()
+
+
+def get_client_ip(handler) -> str:
+    """Resolve client IP address for a request handler"""
+    if hasattr(handler, 'client_address'):
+        return handler.client_address[0]
+    return handler.headers.get('X-Forwarded-For', '').split(',')[0].strip() or 'unknown'
+
+
+def retry_after(seconds: float) -> Dict[str, str]:
+    """Retry-After header for a wait in seconds (whole seconds, at least 1)"""
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
+
+
+def current_context():
+    """Return the RequestContext being served on this thread, or None"""
+    return getattr(_local, 'context', None)
+
+
+class Route:
+    """A single registered endpoint and its options"""
+
+    def __init__(self, method: str, path: str, handler: Callable, auth: bool = False,
+                 action: Optional[str] = None, max_body: Optional[int] = DEFAULT_MAX_BODY,
+                 audit: Optional[str] = None, table_field: Optional[str] = None,
+                 policy_action: Optional[str] = None, envelope: bool = False,
+                 throttle=None, admission: bool = True,
+                 deadline: Optional[float] = REQUEST_DEADLINE, batch: Optional[str] = None):
+        if batch not in (None, 'read', 'write'):
+            raise ValueError(f"batch must be None, 'read' or 'write', not {batch!r}")
+        self.method = method
+        self.path = path
+        self.handler = handler
+        self.auth = auth                    # require a valid session / role headers
+        self.action = action or path.strip('/').replace('/', '_') or 'root'
+        self.max_body = max_body            # None = route does not read a body
+        self.audit = audit                  # accountLog label for the request line
+        self.table_field = table_field      # body field holding the target table
+        self.policy_action = policy_action  # read / write / delete for policy logs
+        self.envelope = envelope            # error bodies carry "ok": False
+        self.throttle = throttle            # attempt limiter (login_throttle.LoginThrottle)
+        self.admission = admission          # subject to load shedding (admission.py)
+        self.deadline = deadline or None    # seconds for the request's DB work (deadline.py)
+        self.batch = batch                  # allowed in /batch: 'read' (concurrent) or 'write' (ordered)
+        self.name = f"{method} {path}"
+        self.pipeline: Callable = handler
+        self.batch_pipeline: Optional[Callable] = None
+
+
+class RequestContext:
+    """Per-request state shared by middleware and route handlers"""
+
+    def __init__(self, handler, method: str, route: Route):
+        self.handler = handler
+        self.method = method
+        self.route = route
+        url = urllib.parse.urlparse(handler.path)
+        self.path = url.path
+        self.query = urllib.parse.parse_qs(url.query)
+        self.headers = handler.headers
+        self.client_ip = get_client_ip(handler)
+        self.auth: Optional[Dict] = None
+        self.data: Dict = {}
+        self.table = ""
+        self.status: Optional[int] = None
+        self.started_at = time.perf_counter()
+        self.deadline = time.monotonic() + route.deadline if route.deadline else None
+
+    @property
+    def user_id(self):
+        return self.auth.get('personId') if self.auth else None
+
+    @property
+    def role(self):
+        return self.auth.get('role') if self.auth else None
+
+    def bearer_token(self) -> str:
+        auth_header = self.headers.get("Authorization", "")
+        return auth_header.replace("Bearer ", "") if auth_header.startswith("Bearer ") else ""
+
+    def respond(self, status: int, data, headers: Optional[Dict] = None):
+        """Send a JSON response and remember the status for observers"""
+        self.status = status
+        return json_response(self.handler, status, data, headers)
+
+    def respond_text(self, status: int, text: str, content_type: str = "text/plain; charset=utf-8"):
+        """Send a plain text response and remember the status for observers"""
+        self.status = status
+        return text_response(self.handler, status, text, content_type)
+
+    def error(self, status: int, message: str, headers: Optional[Dict] = None):
+        """Send an error response in the route's error envelope"""
+        body = {"ok": False, "error": message} if self.route.envelope else {"error": message}
+        return self.respond(status, body, headers)
+
+
+class SubRequestContext(RequestContext):
+    """
+    One sub-request of POST /batch
+
+    Shares the batch's connection, headers and resolved session; the
+    response is kept on the context instead of being sent.
+    """
+
+    def __init__(self, parent: RequestContext, route: Route, data: Dict):
+        self.handler = parent.handler
+        self.method = route.method
+        self.route = route
+        self.path = route.path
+        self.query = {}
+        self.headers = parent.headers
+        self.client_ip = parent.client_ip
+        self.auth = parent.auth
+        self.data = data
+        self.table = str(data.get(route.table_field) or "") if route.table_field else ""
+        self.status: Optional[int] = None
+        self.body = None
+        self.response_headers: Optional[Dict] = None
+        self.started_at = time.perf_counter()
+        # The route's own budget, within what is left of the batch's
+        deadlines = [d for d in (parent.deadline, time.monotonic() + route.deadline if route.deadline else None)
+                     if d is not None]
+        self.deadline = min(deadlines) if deadlines else None
+
+    def respond(self, status: int, data, headers: Optional[Dict] = None):
+        self.status = status
+        self.body = data
+        self.response_headers = headers
+
+    def respond_text(self, status: int, text: str, content_type: str = "text/plain; charset=utf-8"):
+        self.status = status
+        self.body = text
+
+
+# =========================
+# Middleware
+# =========================
+# A middleware factory receives a Route and returns either None (not applicable
+# to this route) or a callable (ctx, call_next) -> response.
+
+def admission_middleware(route: Route):
+    """Shed load per route before any other work is done"""
+    if not route.admission:
+        return None
+    limiter = ADMISSION.limiter(route.name)
+
+    def middleware(ctx: RequestContext, call_next):
+        wait = ADMISSION.acquire(limiter)
+        if wait is not None:
+            return ctx.error(503, "Server busy, please retry", retry_after(wait))
+        started = time.perf_counter()
+        try:
+            return call_next(ctx)
+        finally:
+            ADMISSION.release(limiter, time.perf_counter() - started)
+
+    return middleware
+
+
+def auth_middleware(route: Route):
+    """Resolve the caller once and reject unauthenticated requests"""
+    if not route.auth:
+        return None
+    from privilege_controller import parse_bearer_role
+    from logger import logAccountOperation
+
+    def middleware(ctx: RequestContext, call_next):
+        ctx.auth = parse_bearer_role(ctx.headers)
+        if ctx.auth:
+            return call_next(ctx)
+        # Log unauthorized access attempt (session attack indicator)
+        token = ctx.bearer_token()
+        token_info = "missing"
+        if token:
+            token_info = f"invalid_token: {token[:20]}..." if len(token) > 20 else f"invalid_token: {token}"
+        app_logger.warning(f"Unauthorized {route.action} attempt: ip={ctx.client_ip}, token={token_info}")
+        log_security_event('unauthorized_access', {'action': route.action, 'reason': 'invalid_token', 'token_info': token_info}, None, ctx.client_ip)
+        logAccountOperation(ctx.client_ip, None, None, f"Unauthorized access: action={route.action}, reason=Invalid or missing token")
+        return ctx.error(401, "Unauthorized")
+
+    return middleware
+
+
+def body_middleware(route: Route):
+    """Read and size-limit the JSON body once"""
+    if route.max_body is None:
+        return None
+
+    def middleware(ctx: RequestContext, call_next):
+        try:
+            ctx.data = read_json(ctx.handler, max_body=route.max_body) or {}
+        except RequestBodyTooLarge as e:
+            app_logger.warning(f"Request body rejected: route={route.name}, ip={ctx.client_ip}, reason={e}")
+            return ctx.error(413, "Request body too large")
+        except ValueError as e:
+            # Malformed Content-Length: the body cannot be framed, so drop the connection
+            app_logger.warning(f"Request body rejected: route={route.name}, ip={ctx.client_ip}, reason={e}")
+            ctx.handler.close_connection = True
+            return ctx.error(400, "Invalid Content-Length")
+        if route.table_field:
+            ctx.table = str(ctx.data.get(route.table_field) or "")
+        return call_next(ctx)
+
+    return middleware
+
+
+def throttle_middleware(route: Route):
+    """Reject over-limit attempts before the handler does any work"""
+    if route.throttle is None:
+        return None
+    throttle = route.throttle
+
+    def middleware(ctx: RequestContext, call_next):
+        identity = ctx.data.get(throttle.identity_field)
+        wait = throttle.admit(ctx.client_ip, identity)
+        if wait is not None:
+            return ctx.error(429, "Too many attempts, please retry later",
+                             retry_after(wait))
+        response = call_next(ctx)
+        if ctx.status is not None and ctx.status < 500:
+            throttle.record(ctx.client_ip, identity, ctx.status < 400)
+        return response
+
+    return middleware
+
+
+def audit_middleware(route: Route):
+    """Record the request line for auditable routes"""
+    if not route.audit:
+        return None
+    from logger import logAccountOperation
+
+    def middleware(ctx: RequestContext, call_next):
+        app_logger.info(f"{route.action.capitalize()} request: user_id={ctx.user_id}, role={ctx.role}, table={ctx.table}, ip={ctx.client_ip}")
+        logAccountOperation(ctx.client_ip, ctx.user_id, ctx.role, f"{route.audit}: table={ctx.table}")
+        return call_next(ctx)
+
+    return middleware
+
+
+def table_middleware(route: Route):
+    """Validate the target table against the caller's role whitelist"""
+    if not route.table_field:
+        return None
+    from privilege_controller import isTableAllowed
+    from security import validate_table_name
+    from security_monitor import log_policy_violation
+    from audit_logger import log_unauthorized_access
+    from logger import logAccountOperation
+
+    def middleware(ctx: RequestContext, call_next):
+        table = ctx.table
+        if not validate_table_name(table):
+            app_logger.warning(f"Invalid table name in {route.action}: user_id={ctx.user_id}, role={ctx.role}, table={table}, ip={ctx.client_ip}")
+            log_security_event('policy_violation', {'action': route.action, 'resource': table, 'reason': 'invalid_table_name'}, ctx.user_id, ctx.client_ip)
+            logAccountOperation(ctx.client_ip, ctx.user_id, ctx.role, f"Policy violation: action={route.action}, table={table}, reason=Invalid table name")
+            return ctx.error(400, "Invalid table name")
+
+        # check if the table is allowed for the role
+        if not isTableAllowed(ctx.role, table):
+            app_logger.warning(f"Access denied to table for {route.action}: user_id={ctx.user_id}, role={ctx.role}, table={table}, ip={ctx.client_ip}")
+            log_policy_violation(route.policy_action or route.action, ctx.role, table, ctx.user_id, ctx.client_ip)
+            log_unauthorized_access(route.action, ctx.user_id, ctx.role, ctx.client_ip, table)
+            logAccountOperation(ctx.client_ip, ctx.user_id, ctx.role, f"Inappropriate access: action={route.action}, table={table}, reason=Access denied")
+            return ctx.error(403, "Forbidden")
+        return call_next(ctx)
+
+    return middleware
+
+
+# Order matters: admission comes first so shed requests cost nothing, auth is
+# resolved before the body is read, throttling needs the body, and the audit
+# line is written before the table policy check (as the original handlers did).
+DEFAULT_MIDDLEWARE = [admission_middleware, auth_middleware, body_middleware, throttle_middleware,
+                      audit_middleware, table_middleware]
+
+
+class Router:
+    """Path -> handler map with per-route compiled middleware chains"""
+
+    def __init__(self, middleware: Optional[List[Callable]] = None):
+        self._routes: Dict[Tuple[str, str], Route] = {}
+        self._middleware = list(DEFAULT_MIDDLEWARE if middleware is None else middleware)
+        self._observers: List[Callable] = []
+
+    def add_observer(self, observer: Callable) -> None:
+        """
+        Register a callback invoked after every routed request
+
+        Args:
+            observer: Callable (route, ctx, elapsed_seconds) -> None
+        """
+        self._observers.append(observer)
+
+    def add(self, method: str, path: str, handler: Callable, **options) -> Route:
+        route = Route(method, path, handler, **options)
+        route.pipeline = self._compile(route)
+        if route.batch:
+            # Sub-requests arrive with the batch's session and parsed body
+            route.batch_pipeline = self._compile(route, skip=(auth_middleware, body_middleware))
+        self._routes[(method, path)] = route
+        return route
+
+    def get(self, path: str, **options):
+        return self._decorator("GET", path, options)
+
+    def post(self, path: str, **options):
+        return self._decorator("POST", path, options)
+
+    def _decorator(self, method, path, options):
+        def register(handler):
+            self.add(method, path, handler, **options)
+            return handler
+        return register
+
+    def _compile(self, route: Route, skip: Tuple[Callable, ...] = ()) -> Callable:
+        chain = [mw for mw in (factory(route) for factory in self._middleware if factory not in skip)
+                 if mw is not None]
+        call = route.handler
+        for middleware in reversed(chain):
+            call = (lambda mw, nxt: lambda ctx: mw(ctx, nxt))(middleware, call)
+        return call
+
+    def resolve(self, method: str, path: str) -> Optional[Route]:
+        return self._routes.get((method, path))
+
+    def routes(self) -> List[Route]:
+        return list(self._routes.values())
+
+    def dispatch(self, handler, method: str):
+        """Serve one request on a BaseHTTPRequestHandler"""
+        path = urllib.parse.urlparse(handler.path).path
+        handler.log_message(f"{method} {path}")
+        route = self.resolve(method, path)
+        if route is None:
+            return json_response(handler, 404, {"error": "Not found"})
+
+        ctx = RequestContext(handler, method, route)
+        return self._serve(ctx, route.pipeline)
+
+    def run_subrequest(self, parent: RequestContext, route: Route, data: Dict) -> SubRequestContext:
+        """
+        Serve a /batch sub-request on the current thread
+
+        Runs route.batch_pipeline: admission, audit and table checks as for
+        a direct request, without re-validating the session or reading a body.
+
+        Returns:
+            The sub-request context holding status, body and headers
+        """
+        ctx = SubRequestContext(parent, route, data)
+        self._serve(ctx, route.batch_pipeline)
+        return ctx
+
+    def _serve(self, ctx: RequestContext, pipeline: Callable):
+        route = ctx.route
+        method = ctx.method
+        handler = ctx.handler
+        previous = current_context()
+        _local.context = ctx
+        try:
+            return pipeline(ctx)
+        except DeadlineExceeded:
+            app_logger.warning(f"Request deadline exceeded: route={route.name}, ip={ctx.client_ip}")
+            return ctx.error(504, "Request timed out")
+        except ClientDisconnected:
+            # Nobody is left to read a response
+            app_logger.info(f"Client disconnected: route={route.name}, ip={ctx.client_ip}")
+            ctx.status = 499
+            handler.close_connection = True
+            return None
+        except CryptoPoolBusy:
+            app_logger.warning(f"Crypto pool saturated: route={route.name}, ip={ctx.client_ip}")
+            return ctx.respond(503, {"error": "Server busy, please retry"}, retry_after(1))
+        except Exception as e:
+            # Log error details but don't expose to client
+            app_logger.error(f"{method} request error: route={route.name}, error={e}", exc_info=True)
+            traceback.print_exc()  # Keep for development
+            # Return generic error message
+            return ctx.respond(500, {"error": "Server error occurred"})
+        finally:
+            elapsed = time.perf_counter() - ctx.started_at
+            _local.context = previous
+            for observer in self._observers:
+                try:
+                    observer(route, ctx, elapsed)
+                except Exception as e:
+                    app_logger.error(f"Route observer failed: {e}")
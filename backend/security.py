@@ -4,51 +4,203 @@ Security module for enhanced security features
 """
 import os
 import base64
+import hashlib
 import re
-from cryptography.hazmat.primitives import serialization, hashes
-from cryptography.hazmat.primitives.asymmetric import rsa, padding
-from cryptography.hazmat.backends import default_backend
+import threading
+import time
+
+from crypto_pool import CRYPTO_POOL, CryptoPoolBusy
+from key_provider import KEY_PROVIDER, _find_env_file
+from logger_config import app_logger
+
+# RSA private keys for decrypting passwords, by key id
+#   RSA_PRIVATE_KEYS="2025a=keys/a.pem,2025b=keys/b.pem"  (several valid keys)
+#   RSA_KEY_ID: key id advertised by /auth/public-key (defaults to the first)
+#   RSA_PRIVATE_KEY_PATH: single key, used when RSA_PRIVATE_KEYS is unset
+# Read again (from .env too) and the key files reopened on every key reload
+# Missing keys are retried at most every RSA_KEY_RETRY_INTERVAL seconds
+RSA_KEY_RETRY_INTERVAL = float(os.getenv('RSA_KEY_RETRY_INTERVAL', '60'))
+
+# cryptography is imported on first use (see startup.py)
+_OAEP = None
+
+
+def _oaep():
+    global _OAEP
+    if _OAEP is None:
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.asymmetric import padding
+        _OAEP = padding.OAEP(
+            mgf=padding.MGF1(algorithm=hashes.SHA256()),
+            algorithm=hashes.SHA256(),
+            label=None
+        )
+    return _OAEP
+
+
+class RSAKeyStore:
+    """Loaded RSA private keys with cached public PEMs and fingerprints"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = {}          # key id -> private key
+        self._public = {}        # key id -> (pem, fingerprint)
+        self._missing = {}       # path -> time of next load attempt
+        self._env_file = {}      # .env values as of the last reload
+
+    def _setting(self, name, default=''):
+        # As for the data keys, .env takes precedence over the process environment
+        value = self._env_file.get(name)
+        if value is None:
+            value = os.getenv(name, '')
+        return (value or '').strip() or default
+
+    def configured_keys(self):
+        """[(key_id, path)] from the environment, advertised key first"""
+        spec = self._setting('RSA_PRIVATE_KEYS')
+        entries = []
+        if spec:
+            for item in spec.split(','):
+                key_id, sep, path = item.strip().partition('=')
+                if sep and key_id.strip() and path.strip():
+                    entries.append((key_id.strip(), path.strip()))
+        else:
+            entries.append((self._setting('RSA_KEY_ID', 'default'),
+                            self._setting('RSA_PRIVATE_KEY_PATH', 'backend/keys/private_key.pem')))
+        active = self._setting('RSA_KEY_ID') or None
+        entries.sort(key=lambda entry: entry[0] != active)
+        return entries
+
+    def active_key_id(self):
+        entries = self.configured_keys()
+        return entries[0][0] if entries else None
+
+    def get(self, key_id, key_path=None):
+        """Private key for key_id, or None if it is not configured or cannot be loaded"""
+        key = self._keys.get(key_id)
+        if key is not None:
+            return key
+        if key_path is None:
+            key_path = dict(self.configured_keys()).get(key_id)
+            if key_path is None:
+                return None
+        with self._lock:
+            key = self._keys.get(key_id)
+            if key is not None:
+                return key
+            # Negative cache: don't hit the filesystem (or log) on every login
+            retry_at = self._missing.get(key_path)
+            if retry_at is not None and time.monotonic() < retry_at:
+                return None
+            try:
+                if not os.path.exists(key_path):
+                    app_logger.warning(f"Private key '{key_id}' not found at {key_path}. RSA decryption with this key is disabled.")
+                    self._missing[key_path] = time.monotonic() + RSA_KEY_RETRY_INTERVAL
+                    return None
+                from cryptography.hazmat.primitives import serialization
+                from cryptography.hazmat.backends import default_backend
+                with open(key_path, 'rb') as f:
+                    key = serialization.load_pem_private_key(
+                        f.read(),
+                        password=None,
+                        backend=default_backend()
+                    )
+            except Exception as e:
+                app_logger.error(f"Error loading private key '{key_id}': {e}. RSA decryption with this key is disabled.")
+                self._missing[key_path] = time.monotonic() + RSA_KEY_RETRY_INTERVAL
+                return None
+            self._missing.pop(key_path, None)
+            self._keys[key_id] = key
+            return key
+
+    def candidates(self, key_id=None):
+        """Keys to try for a ciphertext: the named key only, or every valid key"""
+        if key_id:
+            key = self.get(key_id)
+            return [(key_id, key)] if key is not None else []
+        result = []
+        for configured_id, path in self.configured_keys():
+            key = self.get(configured_id, path)
+            if key is not None:
+                result.append((configured_id, key))
+        return result
+
+    def public_info(self, key_id):
+        """(public PEM, SHA-256 fingerprint of the SubjectPublicKeyInfo) for key_id"""
+        info = self._public.get(key_id)
+        if info is not None:
+            return info
+        private_key = self.get(key_id)
+        if private_key is None:
+            return None
+        from cryptography.hazmat.primitives import serialization
+        public_key = private_key.public_key()
+        pem = public_key.public_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo
+        ).decode('utf-8')
+        der = public_key.public_bytes(
+            encoding=serialization.Encoding.DER,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+        info = (pem, hashlib.sha256(der).hexdigest())
+        self._public[key_id] = info
+        return info
+
+    def reload(self, reason="manual"):
+        """Re-read the RSA_* settings and drop every loaded key (and negative cache entry)"""
+        from dotenv import dotenv_values
+        env_path = _find_env_file()
+        env_file = dotenv_values(env_path) if env_path.is_file() else {}
+        with self._lock:
+            self._env_file = env_file
+            self._keys = {}
+            self._public = {}
+            self._missing = {}
+        active = self.active_key_id()
+        app_logger.info(f"RSA keys reloaded ({reason}): advertised={active}, "
+                        f"key_ids={[key_id for key_id, _ in self.configured_keys()]}")
+        # Load the advertised key now, so a bad path is logged at reload time
+        self.get(active)
+
+
+RSA_KEYS = RSAKeyStore()
+
+
+def _on_key_reload(ring):
+    # SIGHUP and key file changes reload the keyring; reload the RSA keys with it
+    if ring.version > 1:
+        RSA_KEYS.reload(f"key version {ring.version}")
+
+
+KEY_PROVIDER.add_listener(_on_key_reload)
 
-# RSA private key for decrypting passwords (should be loaded from secure storage)
-_PRIVATE_KEY = None
 
 def load_private_key(key_path=None):
     """
-    Load RSA private key from file or environment variable
+    Load the advertised RSA private key (cached, including a missing key)
     
     Args:
         key_path: Path to private key file, or None to use environment variable
     """
-    global _PRIVATE_KEY
-    if _PRIVATE_KEY is not None:
-        return _PRIVATE_KEY
-    
-    try:
-        if key_path is None:
-            key_path = os.getenv('RSA_PRIVATE_KEY_PATH', 'backend/keys/private_key.pem')
-        
-        if os.path.exists(key_path):
-            with open(key_path, 'rb') as f:
-                _PRIVATE_KEY = serialization.load_pem_private_key(
-                    f.read(),
-                    password=None,
-                    backend=default_backend()
-                )
-            return _PRIVATE_KEY
-        else:
-            # Generate a new key pair if not exists (for development only)
-            print(f"Warning: Private key not found at {key_path}. RSA decryption will be disabled.")
-            return None
-    except Exception as e:
-        print(f"Error loading private key: {e}. RSA decryption will be disabled.")
-        return None
+    return RSA_KEYS.get(RSA_KEYS.active_key_id(), key_path)
 
-def decrypt_password(encrypted_password_base64):
+def _rsa_decrypt(candidates, encrypted_bytes):
+    for key_id, private_key in candidates:
+        try:
+            return private_key.decrypt(encrypted_bytes, _oaep())
+        except ValueError:
+            continue  # Encrypted for another valid key
+    return None
+
+def decrypt_password(encrypted_password_base64, key_id=None):
     """
     Decrypt RSA-OAEP encrypted password
     
     Args:
         encrypted_password_base64: Base64 encoded encrypted password
+        key_id: Key id the client encrypted with (X-Key-Id / keyId), or None
+            to try every configured key
         
     Returns:
         Decrypted password string, or None if decryption fails
@@ -56,25 +208,43 @@ def decrypt_password(encrypted_password_base64):
     if not encrypted_password_base64:
         return None
     
-    private_key = load_private_key()
-    if private_key is None:
+    candidates = RSA_KEYS.candidates(key_id)
+    if not candidates:
         return None
     
     try:
         encrypted_bytes = base64.b64decode(encrypted_password_base64)
-        decrypted_bytes = private_key.decrypt(
-            encrypted_bytes,
-            padding.OAEP(
-                mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                algorithm=hashes.SHA256(),
-                label=None
-            )
-        )
+        # RSA private key operations are CPU heavy; run them on the crypto pool
+        decrypted_bytes = CRYPTO_POOL.run(_rsa_decrypt, candidates, encrypted_bytes)
+        if decrypted_bytes is None:
+            app_logger.warning(f"Password decryption failed: key_id={key_id or 'any'}")
+            return None
         return decrypted_bytes.decode('utf-8')
+    except CryptoPoolBusy:
+        raise
     except Exception as e:
-        print(f"Error decrypting password: {e}")
+        app_logger.error(f"Error decrypting password: {e}")
         return None
 
+def check_rsa_keys():
+    """
+    Round-trip a probe through every configured key (startup warm-up)
+    
+    Parses the keys, caches the public key info and runs one decryption on
+    the crypto pool, as the first login would.
+    
+    Returns:
+        Key ids checked (empty if no key could be loaded)
+    """
+    checked = []
+    for key_id, private_key in RSA_KEYS.candidates():
+        get_public_key_info(key_id)
+        probe = private_key.public_key().encrypt(b"warm-up", _oaep())
+        if decrypt_password(base64.b64encode(probe).decode('ascii'), key_id) != "warm-up":
+            raise RuntimeError(f"RSA round trip failed for key '{key_id}'")
+        checked.append(key_id)
+    return checked
+
 def validate_email(email):
     """
     Validate email format
@@ -248,25 +418,33 @@ def is_origin_allowed(origin):
         return True
     return origin in allowed
 
-def get_public_key_pem():
+def get_public_key_pem(key_id=None):
     """
     Get RSA public key in PEM format for frontend encryption
     
     Returns:
         Public key PEM string, or None if not available
     """
-    private_key = load_private_key()
-    if private_key is None:
-        return None
+    info = get_public_key_info(key_id)
+    return info["publicKey"] if info else None
+
+def get_public_key_info(key_id=None):
+    """
+    Public key, key id and fingerprint for frontend encryption (cached)
+    
+    Args:
+        key_id: Key id to describe, or None for the advertised key
     
+    Returns:
+        Dict with publicKey, keyId and fingerprint, or None if not available
+    """
+    key_id = key_id or RSA_KEYS.active_key_id()
     try:
-        public_key = private_key.public_key()
-        pem = public_key.public_bytes(
-            encoding=serialization.Encoding.PEM,
-            format=serialization.PublicFormat.SubjectPublicKeyInfo
-        )
-        return pem.decode('utf-8')
+        info = RSA_KEYS.public_info(key_id)
     except Exception as e:
-        print(f"Error getting public key: {e}")
+        app_logger.error(f"Error getting public key: {e}")
+        return None
+    if info is None:
         return None
+    return {"publicKey": info[0], "keyId": key_id, "fingerprint": info[1]}
 
@@ -47,6 +47,43 @@ def detect_sql_injection(input_str: str) -> bool:
     
     return False
 
+# Allowed actions per role (checked against privilege_controller.RolePrivileges
+# at startup, see privilege_controller.verifyPrivilegeSources)
+ROLE_PERMISSIONS = {
+    'student': {
+        'read': ['students', 'grades', 'disciplinary_records'],
+        'write': ['students'],  # Only own data
+        'delete': []
+    },
+    'guardian': {
+        'read': ['guardians', 'grades', 'disciplinary_records'],
+        'write': ['guardians'],  # Only own data
+        'delete': []
+    },
+    'aro': {
+        'read': ['grades'],
+        'write': ['grades'],
+        'delete': ['grades']
+    },
+    'dro': {
+        'read': ['disciplinary_records'],
+        'write': ['disciplinary_records'],
+        'delete': ['disciplinary_records']
+    },
+    'root': {
+        'read': ['*'],  # All tables
+        'write': ['*'],
+        'delete': ['*']
+    }
+}
+
+# (role, action) -> allowed resources, lowercased once at import
+_ALLOWED_RESOURCES = {
+    (role, action): frozenset(r.lower() for r in resources)
+    for role, actions in ROLE_PERMISSIONS.items()
+    for action, resources in actions.items()
+}
+
 def detect_policy_violation(action: str, user_role: str, resource: str) -> bool:
     """
     Detect policy violations based on role and resource
@@ -59,46 +96,13 @@ def detect_policy_violation(action: str, user_role: str, resource: str) -> bool:
     Returns:
         True if policy violation detected, False otherwise
     """
-    # Define allowed actions per role
-    role_permissions = {
-        'student': {
-            'read': ['students', 'grades', 'disciplinary_records'],
-            'write': ['students'],  # Only own data
-            'delete': []
-        },
-        'guardian': {
-            'read': ['guardians', 'grades', 'disciplinary_records'],
-            'write': ['guardians'],  # Only own data
-            'delete': []
-        },
-        'aro': {
-            'read': ['grades'],
-            'write': ['grades'],
-            'delete': ['grades']
-        },
-        'dro': {
-            'read': ['disciplinary_records'],
-            'write': ['disciplinary_records'],
-            'delete': ['disciplinary_records']
-        },
-        'root': {
-            'read': ['*'],  # All tables
-            'write': ['*'],
-            'delete': ['*']
-        }
-    }
-    
-    permissions = role_permissions.get(user_role.lower(), {})
-    allowed_resources = permissions.get(action, [])
+    allowed_resources = _ALLOWED_RESOURCES.get((user_role.lower(), action), frozenset())
     
     # Check if resource is allowed
     if '*' in allowed_resources:
         return False  # Root has access to all
     
-    if resource.lower() not in [r.lower() for r in allowed_resources]:
-        return True  # Policy violation
-    
-    return False
+    return resource.lower() not in allowed_resources  # Policy violation
 
 def log_sql_injection_attempt(input_str: str, user_id: Optional[str] = None, 
                              ip_address: Optional[str] = None, sql: Optional[str] = None):
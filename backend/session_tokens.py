@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Signed session tokens (SESSION_TOKEN_MODE=signed)
+
+A signed token carries the session itself:
+
+    s1.<payload>.<mac>
+
+payload is base64url JSON {"sub": user id, "role": role, "exp": expiry,
+"jti": token id} and mac an HMAC-SHA256 over "s1.<payload>". A token is
+validated by recomputing the MAC, so no ACTIVE_SESSIONS entry or sessions
+table lookup is needed and any worker or server can validate any token.
+
+Logout adds the token id to a revocation set. The set lives in memory and in
+the session_revocations table (load_sql/migrations/V006), which every
+process re-reads every SESSION_REVOCATION_SYNC seconds, so a logout reaches
+all processes within that interval. Entries are dropped once the token has
+expired anyway, so the set only holds sessions logged out within the last
+SESSION_EXPIRY.
+"""
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import metrics
+from db_query import db_execute, db_query
+from key_provider import derived_hmac_keys
+from logger_config import app_logger
+
+# Session token HMAC key; every server accepting the tokens needs the same one
+# (empty: derived from the keyring)
+SESSION_SECRET = os.getenv('SESSION_SECRET', '')
+
+# Seconds between reloads of the revocation set from the database
+SESSION_REVOCATION_SYNC = float(os.getenv('SESSION_REVOCATION_SYNC', '5'))
+
+# Version prefix of signed tokens (opaque tokens never contain '.')
+TOKEN_PREFIX = "s1"
+
+# DBMS role used for the revocation table (same as the sessions table)
+REVOCATION_DB_ROLE = 'student'
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _signing_keys() -> Tuple[bytes, ...]:
+    return derived_hmac_keys("session-token", SESSION_SECRET)
+
+
+def _mac(key: bytes, signing_input: str) -> str:
+    return _b64encode(hmac.new(key, signing_input.encode('ascii'), hashlib.sha256).digest())
+
+
+def is_signed_token(token: Optional[str]) -> bool:
+    return bool(token) and token.startswith(TOKEN_PREFIX + ".")
+
+
+def issue_token(user_id: str, role: str, expires_at: float) -> str:
+    payload = {"sub": str(user_id), "role": role, "exp": int(expires_at), "jti": secrets.token_urlsafe(12)}
+    signing_input = f"{TOKEN_PREFIX}.{_b64encode(json.dumps(payload, separators=(',', ':')).encode('utf-8'))}"
+    return f"{signing_input}.{_mac(_signing_keys()[0], signing_input)}"
+
+
+def decode_token(token: str) -> Optional[Dict]:
+    """Payload of a well-signed, unexpired token (revocation not checked)"""
+    parts = token.split('.')
+    if len(parts) != 3 or parts[0] != TOKEN_PREFIX:
+        return None
+    signing_input = f"{parts[0]}.{parts[1]}"
+    # Constant-time comparison against every accepted key
+    if not any(hmac.compare_digest(_mac(key, signing_input), parts[2]) for key in _signing_keys()):
+        return None
+    try:
+        payload = json.loads(_b64decode(parts[1]))
+        expired = time.time() > payload["exp"]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        return None
+    return None if expired else payload
+
+
+def validate_token(token: str) -> Optional[Dict]:
+    """Payload of a valid token, None if forged, expired or logged out"""
+    payload = decode_token(token)
+    if payload is None or REVOCATIONS.is_revoked(payload.get("jti")):
+        return None
+    return payload
+
+
+def revoke_token(token: str) -> bool:
+    payload = decode_token(token)
+    if payload is None:
+        return False
+    REVOCATIONS.revoke(payload["jti"], payload["exp"])
+    return True
+
+
+class RevocationSet:
+    """Token ids logged out before their expiry, shared through the database"""
+
+    def __init__(self, sync_interval: float = SESSION_REVOCATION_SYNC):
+        self.sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self._revoked: Dict[str, float] = {}  # token id -> expires_at
+        self._thread: Optional[threading.Thread] = None
+        metrics.REGISTRY.register_gauge('session_revocations', lambda: len(self._revoked))
+
+    def is_revoked(self, token_id: Optional[str]) -> bool:
+        self._start()
+        return token_id in self._revoked
+
+    def revoke(self, token_id: str, expires_at: float) -> None:
+        with self._lock:
+            self._revoked[token_id] = expires_at
+        try:
+            db_execute(
+                "INSERT IGNORE INTO session_revocations (token_id, expires_at) VALUES (%s, FROM_UNIXTIME(%s))",
+                (token_id, int(expires_at)), role=REVOCATION_DB_ROLE, pin_session=False, bounded=False)
+            # Rows of expired tokens are useless; logouts are rare enough to prune here
+            db_execute("DELETE FROM session_revocations WHERE expires_at <= NOW() LIMIT 100",
+                       role=REVOCATION_DB_ROLE, pin_session=False, bounded=False)
+        except Exception as e:
+            app_logger.warning(f"Failed to store session revocation, this process only: {e}")
+
+    def sync(self) -> None:
+        """Merge the database's unexpired revocations and drop expired entries"""
+        try:
+            rows = db_query(
+                "SELECT token_id, UNIX_TIMESTAMP(expires_at) AS expires_at FROM session_revocations WHERE expires_at > NOW()",
+                role=REVOCATION_DB_ROLE, bounded=False)
+        except Exception as e:
+            app_logger.warning(f"Failed to load session revocations: {e}")
+            rows = []
+        now = time.time()
+        with self._lock:
+            for row in rows:
+                self._revoked[row["token_id"]] = float(row["expires_at"])
+            for token_id in [t for t, expires_at in self._revoked.items() if expires_at <= now]:
+                del self._revoked[token_id]
+
+    def _start(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='session-revocations', daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self.sync()
+            time.sleep(self.sync_interval)
+
+
+REVOCATIONS = RevocationSet()
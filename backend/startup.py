@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Startup profile, warm-up and readiness
+
+The API modules import only what routing needs. cryptography, bcrypt and
+python-dotenv are imported on first use. main.py times its import phases
+with phase() and prints the breakdown (PROFILE.report()) before it serves.
+
+A server that just started would otherwise make its first requests pay
+for work that only needs doing once. WARMUP does that work up front, in
+this order:
+  keys      - load the keyring (key_provider.py)
+  rsa       - parse the RSA private keys, one RSA-OAEP round trip per key
+  bcrypt    - one bcrypt hash and check on the crypto pool
+  aes       - one AES-GCM column round trip per key (app engine) and one
+              blind index
+  database  - open WARMUP_DB_CONNECTIONS pooled connections per role, or
+              check that the database answers when there is no pool
+  schema    - SHOW COLUMNS of every table each role can see (cached by
+              db_query.getTableColumns)
+
+A failing step is retried every WARMUP_RETRY_INTERVAL seconds before the
+steps after it run, because the database may come up after the API.
+/healthz answers 200 as soon as the server listens. /readyz answers 503
+with the step status until every step has passed, then 200.
+"""
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+import metrics
+from logger_config import app_logger
+
+# Seconds between attempts while a warm-up step fails
+WARMUP_RETRY_INTERVAL = float(os.getenv('WARMUP_RETRY_INTERVAL', '5'))
+
+# Seconds a prefork worker waits for its warm-up before it starts listening anyway
+WARMUP_WAIT = float(os.getenv('WARMUP_WAIT', '5'))
+
+# Pooled connections opened per role during warm-up (capped by DB_POOL_SIZE)
+WARMUP_DB_CONNECTIONS = int(os.getenv('WARMUP_DB_CONNECTIONS', '2'))
+
+# Packages kept out of the import phase (listed by the report while still unloaded)
+DEFERRED_PACKAGES = ('cryptography', 'bcrypt', 'dotenv')
+
+# DBMS roles used by requests (the maintenance user is for offline jobs)
+WARMUP_DB_ROLES = ('auth', 'student', 'guardian', 'aro', 'dro')
+
+
+class StartupProfile:
+    """Wall time and modules loaded per startup phase"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: List[Tuple[str, float, int]] = []  # (name, seconds, modules loaded)
+
+    @contextmanager
+    def phase(self, name: str):
+        modules = len(sys.modules)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start, len(sys.modules) - modules))
+
+    def report(self) -> str:
+        lines = ["Startup profile:"]
+        for name, seconds, modules in self.phases:
+            lines.append(f"  {name:<22} {seconds * 1000:8.1f} ms  {modules:4d} modules")
+        total = time.perf_counter() - self.started
+        lines.append(f"  {'total':<22} {total * 1000:8.1f} ms  {len(sys.modules):4d} modules")
+        deferred = [name for name in DEFERRED_PACKAGES if name not in sys.modules]
+        if deferred:
+            lines.append(f"  deferred to first use: {', '.join(deferred)}")
+        return "\n".join(lines)
+
+
+PROFILE = StartupProfile()
+phase = PROFILE.phase
+
+
+# =========================
+# Warm-up steps
+# =========================
+# Each step returns None when done, or a reason when it has nothing to do
+
+def _warm_keys() -> Optional[str]:
+    from key_provider import KEY_PROVIDER
+    KEY_PROVIDER.ring()
+    return None
+
+
+def _warm_rsa() -> Optional[str]:
+    from security import check_rsa_keys
+    if not check_rsa_keys():
+        return "no RSA private key available"
+    return None
+
+
+def _warm_bcrypt() -> Optional[str]:
+    from auth import hash_password, verify_password
+    if not verify_password("warm-up", "", hash_password("warm-up")):
+        raise RuntimeError("bcrypt check failed")
+    return None
+
+
+def _warm_aes() -> Optional[str]:
+    from encryption import ENCRYPTED_COLUMNS, computeBlindIndexCandidates, isAppEncryptionEngine
+    from key_provider import KEY_PROVIDER
+    for table, columns in ENCRYPTED_COLUMNS.items():
+        for column, meta in columns.items():
+            if meta.get("blind_index"):
+                computeBlindIndexCandidates(table, column, "warm-up")
+                break
+    if not isAppEncryptionEngine():
+        return "ENCRYPTION_ENGINE is not app"
+    from column_crypto import get_cipher
+    # Same cache keys as encryption.py, so requests find these ciphers
+    for key_id, key in KEY_PROVIDER.ring().decrypt_keys():
+        cipher = get_cipher(key, key_id)
+        if cipher.decrypt("warmup", "probe", cipher.encrypt("warmup", "probe", "warm-up")) != b"warm-up":
+            raise RuntimeError(f"AES-GCM round trip failed for key '{key_id}'")
+    return None
+
+
+def _warm_database() -> Optional[str]:
+    from db_connector import test_db_connection
+    from db_pool import POOL
+    if POOL.size <= 0:
+        ok, message = test_db_connection('auth')
+        if not ok:
+            raise RuntimeError(message)
+        return None
+    for role in WARMUP_DB_ROLES:
+        POOL.warm(role, min(POOL.size, WARMUP_DB_CONNECTIONS))
+    return None
+
+
+def _warm_schema() -> Optional[str]:
+    from db_query import getTableColumns
+    from privilege_controller import ROLE_TABLES
+    for role, tables in ROLE_TABLES.items():
+        for table in tables:
+            getTableColumns(table, role=role)
+    return None
+
+
+WARMUP_STEPS: List[Tuple[str, Callable[[], Optional[str]]]] = [
+    ("keys", _warm_keys),
+    ("rsa", _warm_rsa),
+    ("bcrypt", _warm_bcrypt),
+    ("aes", _warm_aes),
+    ("database", _warm_database),
+    ("schema", _warm_schema),
+]
+
+
+class WarmUp:
+    """Runs the warm-up steps in a background thread and tracks readiness"""
+
+    def __init__(self, steps: List[Tuple[str, Callable[[], Optional[str]]]] = WARMUP_STEPS,
+                 retry_interval: float = WARMUP_RETRY_INTERVAL):
+        self.steps = list(steps)
+        self.retry_interval = retry_interval
+        self._lock = threading.Lock()
+        self._status: Dict[str, str] = {name: 'pending' for name, _ in self.steps}
+        self._timings: Dict[str, float] = {}
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._on_ready: Optional[Callable[[str], None]] = None
+        metrics.REGISTRY.register_gauge('server_ready', lambda: 1 if self._ready.is_set() else 0)
+
+    def start(self, on_ready: Optional[Callable[[str], None]] = None) -> None:
+        """Start warming up (once); on_ready(summary) is called when every step passed"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._on_ready = on_ready
+            self._thread = threading.Thread(target=self._run, name='warm-up', daemon=True)
+            self._thread.start()
+
+    def is_ready(self) -> bool:
+        return self._ready.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def status(self) -> Dict:
+        """Readiness and step states (pending, ok, skipped, failed); no error details"""
+        with self._lock:
+            return {"ready": self._ready.is_set(), "steps": dict(self._status)}
+
+    def _run(self) -> None:
+        started = time.perf_counter()
+        errors: Dict[str, str] = {}
+        index = 0
+        # In order; a failed step is retried before the steps after it (schema needs the database)
+        while index < len(self.steps):
+            name, step = self.steps[index]
+            step_start = time.perf_counter()
+            try:
+                skipped = step()
+            except Exception as e:
+                self._set(name, 'failed')
+                # Log each distinct failure once, not every retry
+                if errors.get(name) != str(e):
+                    errors[name] = str(e)
+                    app_logger.warning(f"Warm-up step '{name}' failed, retrying every {self.retry_interval:g}s: {e}")
+                time.sleep(self.retry_interval)
+                continue
+            self._timings[name] = time.perf_counter() - step_start
+            self._set(name, 'skipped' if skipped else 'ok')
+            if skipped:
+                app_logger.info(f"Warm-up step '{name}' skipped: {skipped}")
+            index += 1
+
+        self._ready.set()
+        summary = (f"Ready after {(time.perf_counter() - started) * 1000:.0f} ms of warm-up ("
+                   + ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in self._timings.items()) + ")")
+        app_logger.info(summary)
+        if self._on_ready:
+            self._on_ready(summary)
+
+    def _set(self, name: str, state: str) -> None:
+        with self._lock:
+            self._status[name] = state
+
+
+WARMUP = WarmUp()
@@ -0,0 +1,31 @@
+-- Blind index companion columns for encrypted columns marked "blind_index"
+-- in backend/encryption.py (ENCRYPTED_COLUMNS).
+--
+-- Each <column>_bidx holds a truncated HMAC-SHA256 of the plaintext, so an
+-- equality filter on the encrypted column becomes an indexed lookup.
+-- Existing rows are backfilled by backend/encrypt_current_data.py, as
+-- maintenance_user (V002).
+
+USE ComputingU;
+
+ALTER TABLE students
+    ADD COLUMN Id_No_bidx BINARY(16) NULL AFTER Id_No,
+    ADD COLUMN phone_bidx BINARY(16) NULL AFTER phone,
+    ADD INDEX idx_students_Id_No_bidx (Id_No_bidx),
+    ADD INDEX idx_students_phone_bidx (phone_bidx);
+
+ALTER TABLE guardians
+    ADD COLUMN phone_bidx BINARY(16) NULL AFTER phone,
+    ADD INDEX idx_guardians_phone_bidx (phone_bidx);
+
+ALTER TABLE staffs
+    ADD COLUMN Id_No_bidx BINARY(16) NULL AFTER Id_No,
+    ADD COLUMN phone_bidx BINARY(16) NULL AFTER phone,
+    ADD INDEX idx_staffs_Id_No_bidx (Id_No_bidx),
+    ADD INDEX idx_staffs_phone_bidx (phone_bidx);
+
+-- Roles that may update an encrypted column must keep its index in step
+GRANT UPDATE (Id_No_bidx, phone_bidx) ON ComputingU.students TO 'student'@'localhost', 'student'@'%';
+GRANT UPDATE (phone_bidx) ON ComputingU.guardians TO 'guardian'@'localhost', 'guardian'@'%';
+
+FLUSH PRIVILEGES;
@@ -0,0 +1,19 @@
+-- DBMS account for offline maintenance jobs (backend/reencrypt.py).
+-- Only touches the encrypted columns, their blind indexes and primary keys.
+
+USE ComputingU;
+
+CREATE USER IF NOT EXISTS 'maintenance_user'@'localhost' IDENTIFIED BY 'maintenance_password';
+CREATE USER IF NOT EXISTS 'maintenance_user'@'%' IDENTIFIED BY 'maintenance_password';
+
+GRANT SELECT (StuID, Id_No, address, phone, Id_No_bidx, phone_bidx),
+      UPDATE (Id_No, address, phone, Id_No_bidx, phone_bidx)
+    ON ComputingU.students TO 'maintenance_user'@'localhost', 'maintenance_user'@'%';
+GRANT SELECT (GuaID, phone, phone_bidx),
+      UPDATE (phone, phone_bidx)
+    ON ComputingU.guardians TO 'maintenance_user'@'localhost', 'maintenance_user'@'%';
+GRANT SELECT (StfID, Id_No, address, phone, Id_No_bidx, phone_bidx),
+      UPDATE (Id_No, address, phone, Id_No_bidx, phone_bidx)
+    ON ComputingU.staffs TO 'maintenance_user'@'localhost', 'maintenance_user'@'%';
+
+FLUSH PRIVILEGES;
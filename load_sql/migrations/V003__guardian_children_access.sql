@@ -0,0 +1,14 @@
+-- Guardians read grades and disciplinary records of their children
+-- ("children" range in backend/privilege_controller.py).
+--
+-- The API resolves a guardian's children with
+--   SELECT StuID FROM students WHERE GuaID = ?
+-- and joins students for the "Student name" column, so the guardian account
+-- needs these columns (and nothing else) of students. GuaID is an indexed
+-- foreign key, so the lookup is an index range read.
+
+USE ComputingU;
+
+GRANT SELECT (StuID, GuaID, first_name, last_name) ON ComputingU.students TO 'guardian'@'localhost', 'guardian'@'%';
+
+FLUSH PRIVILEGES;
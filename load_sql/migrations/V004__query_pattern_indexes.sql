@@ -0,0 +1,26 @@
+-- Indexes for the statement shapes reported by backend/index_advisor.py
+--
+-- Login (auth.authenticate_user) looks users up with LOWER(email) = ?, which
+-- cannot use the UNIQUE index on email; a functional index on the same
+-- expression turns the full scan into a lookup (MySQL 8.0.13+).
+--
+-- /performQuery on grades and disciplinary_records filters on StuID (own
+-- rows, a guardian's children, or an ARO/DRO filter) and sorts by term/date.
+-- The composite indexes serve both the filter and the ORDER BY, so no
+-- filesort; they also back the StuID foreign keys, making the single-column
+-- StuID indexes redundant.
+--
+-- sessions needs nothing: validate_session probes the token primary key and
+-- the expiry purge uses idx_expires_at.
+
+USE ComputingU;
+
+CREATE INDEX idx_students_email_lower ON students ((LOWER(email)));
+CREATE INDEX idx_guardians_email_lower ON guardians ((LOWER(email)));
+CREATE INDEX idx_staffs_email_lower ON staffs ((LOWER(email)));
+
+ALTER TABLE grades ADD INDEX idx_grades_StuID_term (StuID, term);
+ALTER TABLE grades DROP INDEX StuID;
+
+ALTER TABLE disciplinary_records ADD INDEX idx_disciplinary_records_StuID_date (StuID, date);
+ALTER TABLE disciplinary_records DROP INDEX StuID;
@@ -0,0 +1,49 @@
+-- Monthly RANGE partitioning for the log tables (audit_log, accountLog,
+-- dataUpdateLog).
+--
+-- The partitioning key must be part of every unique key, so each primary
+-- key becomes (id, timestamp). Every table starts with a single catch-all
+-- partition pmax. backend/log_partitions.py then splits it into monthly
+-- partitions p<YYYYMM> (one per month of existing data plus the months
+-- ahead). It also exports and drops partitions older than the retention
+-- period, instead of DELETEing rows. Run it once right after this migration,
+-- then from cron (see DEPLOYMENT.md).
+--
+-- audit_log.timestamp is a TIMESTAMP, which only partitions through
+-- UNIX_TIMESTAMP(); the DATETIME tables use RANGE COLUMNS.
+
+USE ComputingU;
+
+ALTER TABLE audit_log
+    MODIFY timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    DROP PRIMARY KEY,
+    ADD PRIMARY KEY (id, timestamp);
+ALTER TABLE audit_log
+    PARTITION BY RANGE (UNIX_TIMESTAMP(timestamp)) (
+        PARTITION pmax VALUES LESS THAN MAXVALUE
+    );
+
+ALTER TABLE accountLog
+    DROP PRIMARY KEY,
+    ADD PRIMARY KEY (logID, timestamp);
+ALTER TABLE accountLog
+    PARTITION BY RANGE COLUMNS (timestamp) (
+        PARTITION pmax VALUES LESS THAN (MAXVALUE)
+    );
+
+ALTER TABLE dataUpdateLog
+    DROP PRIMARY KEY,
+    ADD PRIMARY KEY (LogID, logged_at),
+    ADD INDEX idx_logged_at (logged_at);
+ALTER TABLE dataUpdateLog
+    PARTITION BY RANGE COLUMNS (logged_at) (
+        PARTITION pmax VALUES LESS THAN (MAXVALUE)
+    );
+
+-- Rotation job: read partitions for the archive export, split pmax and drop
+-- expired partitions (ALTER TABLE also needs CREATE and INSERT)
+GRANT SELECT, INSERT, CREATE, ALTER, DROP ON ComputingU.audit_log TO 'maintenance_user'@'localhost', 'maintenance_user'@'%';
+GRANT SELECT, INSERT, CREATE, ALTER, DROP ON ComputingU.accountLog TO 'maintenance_user'@'localhost', 'maintenance_user'@'%';
+GRANT SELECT, INSERT, CREATE, ALTER, DROP ON ComputingU.dataUpdateLog TO 'maintenance_user'@'localhost', 'maintenance_user'@'%';
+
+FLUSH PRIVILEGES;
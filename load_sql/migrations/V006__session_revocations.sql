@@ -0,0 +1,22 @@
+-- Revocation set for signed session tokens (SESSION_TOKEN_MODE=signed,
+-- backend/session_tokens.py).
+--
+-- Signed tokens are validated without a sessions lookup, so logout records
+-- the token id here instead. Every API process reloads the unexpired rows
+-- every few seconds. Rows are only needed until the token would have
+-- expired anyway, and logout deletes expired rows, so the table stays as
+-- small as the number of logouts within one SESSION_EXPIRY.
+
+USE ComputingU;
+
+CREATE TABLE session_revocations (
+  token_id VARCHAR(32) PRIMARY KEY,
+  expires_at TIMESTAMP NOT NULL,
+  revoked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  INDEX idx_expires_at (expires_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+-- Sessions are handled with the 'student' account (as for the sessions table)
+GRANT SELECT, INSERT, DELETE ON ComputingU.session_revocations TO 'student'@'localhost', 'student'@'%', 'guardian'@'localhost', 'guardian'@'%', 'aro'@'localhost', 'aro'@'%', 'dro'@'localhost', 'dro'@'%';
+
+FLUSH PRIVILEGES;
@@ -0,0 +1,15 @@
+#!/bin/bash
+# Load the University schema and its migrations into the benchmark database.
+# University.sql expects @encryption_key to be set in the same session, so the
+# key, the schema and the migrations (in version order) are streamed through
+# a single mysql client invocation.
+set -euo pipefail
+
+{
+  echo "SET @encryption_key = '${DATA_ENCRYPTION_KEY}';"
+  cat /schema/University.sql
+  for migration in $(ls /schema/migrations/V*.sql | sort -V); do
+    echo
+    cat "${migration}"
+  done
+} | mysql --protocol=socket -uroot -p"${MYSQL_ROOT_PASSWORD}"
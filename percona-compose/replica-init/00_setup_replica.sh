@@ -0,0 +1,41 @@
+#!/bin/bash
+# Seed the replica with the same University schema and migrations as the
+# primary, then start replicating from the primary's current binlog position.
+# Both containers must be started from fresh volumes, and the migrations
+# applied to the primary before the replica starts, so their seeds match.
+set -euo pipefail
+
+PRIMARY_HOST="${PRIMARY_HOST:-mysql}"
+LOCAL_MYSQL=(mysql --protocol=socket -uroot -p"${MYSQL_ROOT_PASSWORD}")
+PRIMARY_MYSQL=(mysql -h"${PRIMARY_HOST}" -uroot -p"${MYSQL_ROOT_PASSWORD}")
+
+until mysqladmin ping -h"${PRIMARY_HOST}" -uroot -p"${MYSQL_ROOT_PASSWORD}" --silent; do
+  echo "Waiting for primary ${PRIMARY_HOST}..."
+  sleep 2
+done
+
+{
+  echo "SET @encryption_key = '${DATA_ENCRYPTION_KEY}';"
+  cat /schema/University.sql
+  for migration in $(ls /schema/migrations/V*.sql | sort -V); do
+    echo
+    cat "${migration}"
+  done
+} | "${LOCAL_MYSQL[@]}"
+
+"${PRIMARY_MYSQL[@]}" -e "
+  CREATE USER IF NOT EXISTS 'repl'@'%' IDENTIFIED BY '${REPLICATION_PASSWORD}';
+  GRANT REPLICATION SLAVE ON *.* TO 'repl'@'%';"
+
+read -r BINLOG_FILE BINLOG_POS < <("${PRIMARY_MYSQL[@]}" -N -e "SHOW MASTER STATUS" | awk '{print $1, $2}')
+
+"${LOCAL_MYSQL[@]}" -e "
+  GRANT REPLICATION CLIENT ON *.* TO 'auth_user'@'%';
+  CHANGE REPLICATION SOURCE TO
+    SOURCE_HOST='${PRIMARY_HOST}',
+    SOURCE_USER='repl',
+    SOURCE_PASSWORD='${REPLICATION_PASSWORD}',
+    SOURCE_LOG_FILE='${BINLOG_FILE}',
+    SOURCE_LOG_POS=${BINLOG_POS},
+    GET_SOURCE_PUBLIC_KEY=1;
+  START REPLICA;"